@@ -0,0 +1,250 @@
+"""Benchmarks the data and plotting pipeline on synthetic GHCNd data.
+
+Each benchmark runs in a fresh process so its peak memory isn't inflated by
+the ones before it. Results are written as JSON for comparing commits:
+
+    uv run benchmarks/bench_pipeline.py --stations 1 --years 100 -o new.json
+    uv run benchmarks/bench_pipeline.py --compare old.json new.json
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+from cumulative_snow import profiling, synthetic
+
+# Prepares inputs in a fresh process and returns the function to time,
+# which returns the size in bytes of what it produced
+Benchmark = Callable[[str, int, int], Callable[[], int]]
+
+
+@dataclass
+class Result:
+    name: str
+    wall_seconds: float
+    # Peak resident memory of the benchmark's process, including its inputs
+    peak_memory_bytes: int
+    payload_bytes: int
+    repeat: int
+
+
+def _load_noaa_data(workdir: str, stations: int, years: int) -> Callable[[], int]:
+    from cumulative_snow import load_data
+
+    daily = _daily(stations, years)
+    return lambda: int(load_data.load_noaa_data(daily).estimated_size())
+
+
+def _load_noaa_csv(workdir: str, stations: int, years: int) -> Callable[[], int]:
+    from cumulative_snow import load_data
+
+    path = os.path.join(workdir, "export.csv")
+    return lambda: int(sum(df.estimated_size() for df in load_data.iter_noaa_csv(path)))
+
+
+def _plot(builder: str) -> Benchmark:
+    def setup(workdir: str, stations: int, years: int) -> Callable[[], int]:
+        from cumulative_snow import load_data, plot
+
+        data = load_data.load_noaa_data(_daily(1, years))
+        build = getattr(plot, builder)
+
+        def run() -> int:
+            figs = build(data)
+            figs = figs if isinstance(figs, tuple) else (figs,)
+            return sum(len(fig.to_json()) for fig in figs)
+
+        return run
+
+    return setup
+
+
+def _plot_to_html(workdir: str, stations: int, years: int) -> Callable[[], int]:
+    from cumulative_snow import plot
+    from cumulative_snow.args import Args
+
+    output = os.path.join(workdir, "report.html")
+    args = Args(
+        os.path.join(workdir, "export.csv"),
+        output_path=output,
+        station=synthetic.station_id(0),
+    )
+
+    def run() -> int:
+        plot.plot_to_html(args)
+        return os.path.getsize(output)
+
+    return run
+
+
+def _duckdb_pivot(workdir: str, stations: int, years: int) -> Callable[[], int]:
+    import duckdb
+    import pyarrow as pa
+
+    from cumulative_snow import store
+
+    raw = pa.concat_tables(synthetic.raw_daily(i, years) for i in range(stations))
+    sql = store.pivot_sql(min_year=synthetic.DEFAULT_END_YEAR - years)
+
+    def run() -> int:
+        con = duckdb.connect()
+        con.register("raw", raw)
+        return pa.table(con.execute(sql).arrow()).nbytes
+
+    return run
+
+
+def _search_typeahead(workdir: str, stations: int, years: int) -> Callable[[], int]:
+    import numpy as np
+
+    from cumulative_snow.search import StationSearch
+
+    # About as many stations as GHCNd has, whatever --stations is
+    catalog = synthetic.stations(130_000)
+    num_years = np.random.default_rng(0).integers(1, 150, len(catalog))
+    search = StationSearch(
+        catalog["ID"].to_list(),
+        catalog["NAME"].to_list(),
+        catalog["STATE"].to_list(),
+        num_years,
+    )
+    # Prefixes matching every station, a state's and only a few
+    queries = ["s", "station", "station 12", "vt s", "syn000123"]
+
+    def run() -> int:
+        # Five keystrokes' worth of searches
+        return sum(search.search(query).nbytes for query in queries)
+
+    return run
+
+
+def _import(module: str) -> Benchmark:
+    def setup(workdir: str, stations: int, years: int) -> Callable[[], int]:
+        # Timed in a fresh interpreter each run, as imports are cached
+        def run() -> int:
+            subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+            return 0
+
+        return run
+
+    return setup
+
+
+BENCHMARKS: dict[str, Benchmark] = {
+    "import_main": _import("cumulative_snow.main"),
+    "import_store": _import("cumulative_snow.store"),
+    "import_plot": _import("cumulative_snow.plot"),
+    "load_noaa_data": _load_noaa_data,
+    "load_noaa_csv": _load_noaa_csv,
+    "plot_continuous": _plot("plot_continuous"),
+    "plot_overlapping": _plot("plot_overlapping"),
+    "plot_monthly_averages": _plot("plot_monthly_averages"),
+    "plot_to_html": _plot_to_html,
+    "duckdb_pivot": _duckdb_pivot,
+    "search_typeahead": _search_typeahead,
+}
+
+
+def _daily(stations: int, years: int):
+    import polars as pl
+
+    return pl.concat(synthetic.ncei_daily(i, years) for i in range(stations))
+
+
+def _run_one(name: str, workdir: str, stations: int, years: int, repeat: int) -> Result:
+    run = BENCHMARKS[name](workdir, stations, years)
+    times = []
+    payload = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = run()
+        times.append(time.perf_counter() - start)
+    return Result(name, min(times), profiling.peak_rss() or 0, payload, repeat)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names: list[str], stations: int, years: int, repeat: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        synthetic.write_csv(os.path.join(workdir, "export.csv"), stations, years)
+        for name in names:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(_run_one, (name, workdir, stations, years, repeat))
+            print(
+                f"{name:24} {result.wall_seconds * 1000:10.1f} ms "
+                f"{result.peak_memory_bytes / 2**20:8.1f} MiB "
+                f"{result.payload_bytes / 2**10:10.1f} KiB",
+                flush=True,
+            )
+            results.append(asdict(result))
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stations": stations,
+        "years": years,
+        "results": results,
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = {r["name"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"{'':24} {'time':>8} {'memory':>8} {'payload':>8}")
+    for name in [name for name in new if name in old]:
+        ratios = [
+            new[name][key] / old[name][key] if old[name][key] else float("nan")
+            for key in ("wall_seconds", "peak_memory_bytes", "payload_bytes")
+        ]
+        print(f"{name:24}" + "".join(f" {r:7.2f}x" for r in ratios))
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=1, help="1 to 10,000")
+    parser.add_argument("--years", type=int, default=100, help="1 to 150")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only", action="append", choices=list(BENCHMARKS), help="Can be repeated"
+    )
+    parser.add_argument("-o", "--output", help="Path to write the JSON results to")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not 1 <= args.stations <= 10_000 or not 1 <= args.years <= 150:
+        parser.error("--stations must be 1 to 10,000 and --years 1 to 150")
+
+    report = run_benchmarks(
+        args.only or list(BENCHMARKS), args.stations, args.years, args.repeat
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
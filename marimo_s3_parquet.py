@@ -26,94 +26,51 @@ def _(mo):
 
 
 @app.cell
-def _(mo, pd, pl):
-    @mo.persistent_cache
-    def read_fwf_polars(url: str, **kwargs) -> pl.DataFrame:
-        df = pd.read_fwf(url, header=0, **kwargs)
-        return pl.from_pandas(df)
-
-
+def _(catalog, data_cache, mo, pl):
     with mo.status.spinner(title="Loading stations from noaa.gov") as _spinner:
-        _stations_df: pl.DataFrame = read_fwf_polars(
-            "https://www.ncei.noaa.gov/pub/data/ghcn/daily/ghcnd-stations.txt",
-            colspecs=[
-                (0, 11),  # ID
-                (12, 20),  # LATITUDE
-                (21, 30),  # LONGITUDE
-                (31, 37),  # ELEVATION
-                (38, 40),  # STATE
-                (41, 71),  # NAME
-                (72, 75),  # GSN FLAG
-                (76, 79),  # HCN/CRN FLAG
-                (80, 85),  # WMO ID
-            ],
-            names=[
-                "ID",
-                "LATITUDE",
-                "LONGITUDE",
-                "ELEVATION",
-                "STATE",
-                "NAME",
-                "GSN_FLAG",
-                "HCN_CRN_FLAG",
-                "WMO_ID",
-            ],
-            usecols=["ID", "LATITUDE", "LONGITUDE", "ELEVATION", "STATE", "NAME"],
-        )
-        _inventory_df: pl.DataFrame = read_fwf_polars(
-            "https://www.ncei.noaa.gov/pub/data/ghcn/daily/ghcnd-inventory.txt",
-            colspecs=[
-                (0, 11),  # ID
-                (12, 20),  # LATITUDE
-                (21, 30),  # LONGITUDE
-                (31, 35),  # ELEMENT
-                (36, 40),  # FIRSTYEAR
-                (41, 45),  # LASTYEAR
-            ],
-            names=["ID", "LATITUDE", "LONGITUDE", "ELEMENT", "FIRSTYEAR", "LASTYEAR"],
-            usecols=["ID", "ELEMENT", "FIRSTYEAR", "LASTYEAR"],
-        )
-
-    # Consider using lazy to optimize perf
-    _stations_df = (
-        _stations_df.join(
-            _inventory_df.filter(pl.col("ELEMENT") == "SNOW").select(
-                pl.col("ID"), pl.col("FIRSTYEAR"), pl.col("LASTYEAR")
-            ),
-            on=[pl.col("ID")],
-        )
-        .with_columns(NUM_YEARS=pl.col("LASTYEAR") - pl.col("FIRSTYEAR") + 1)
-        # Reorder
-        .select(
-            "ID",
-            "NAME",
-            "STATE",
-            "FIRSTYEAR",
-            "LASTYEAR",
-            "NUM_YEARS",
-            "LATITUDE",
-            "LONGITUDE",
-            "ELEVATION",
-        )
-    )
+        # Memory-mapped from a snapshot unless NOAA updated the source files
+        catalog_df: pl.DataFrame = catalog.load_catalog(data_cache)
 
     _initial_selection = (
-        _stations_df.with_row_index().filter(pl.col("LASTYEAR") > 2015)["index"].to_list()
+        catalog_df.with_row_index().filter(pl.col("LASTYEAR") > 2015)["index"].to_list()
     )
 
     table = mo.ui.table(
-        _stations_df,
+        catalog_df,
         initial_selection=_initial_selection,
         format_mapping={"FIRSTYEAR": "{:d}", "LASTYEAR": "{:d}"},
     )
     mo.accordion({"Filter raw stations dataframe": table})
-    return (table,)
+    return catalog_df, table
+
+
+@app.cell
+def _(catalog_df, spatial):
+    # Built once per catalog so panning and zooming only look up the stations
+    # in view
+    station_index = spatial.StationIndex.from_catalog(catalog_df)
+    return (station_index,)
+
+
+@app.cell
+def _(catalog_df, search):
+    # Built once per catalog so typing only looks up the matching stations
+    station_search = search.StationSearch.from_catalog(catalog_df)
+    return (station_search,)
 
 
 @app.cell
-def _(table):
+def _(mo, spatial):
+    get_map_view, set_map_view = mo.state(spatial.WORLD)
+    return get_map_view, set_map_view
+
+
+@app.cell
+def _(catalog_df, table):
     stations_df = table.value
-    return (stations_df,)
+    # The catalog rows selected in the table
+    station_mask = catalog_df["ID"].is_in(stations_df["ID"].implode()).to_numpy()
+    return station_mask, stations_df
 
 
 @app.cell
@@ -123,52 +80,104 @@ def _():
 
 
 @app.cell
-def _(mo, plotly_config, px, stations_df):
+def _(
+    catalog_df,
+    get_map_view,
+    mo,
+    pl,
+    plotly_config,
+    px,
+    set_map_view,
+    spatial,
+    station_index,
+    station_mask,
+    stations_df,
+):
     mo.stop(stations_df.is_empty())
-    # Create the figure
+    _view = get_map_view()
+    _zoom = spatial.zoom_for(_view)
+    # Clustered here rather than by plotly so the browser only gets the
+    # clusters in view instead of every station in the catalog
+    _points = station_index.clusters(catalog_df, _view, _zoom, mask=station_mask)
     _fig = px.scatter_map(
-        stations_df,
+        _points,
         lat="LATITUDE",
         lon="LONGITUDE",
         color="NUM_YEARS",
-        size="NUM_YEARS",
+        size="COUNT",
         hover_name="NAME",
-        hover_data={"NAME": True, "STATE": True, "ID": True, "NUM_YEARS": True},
-        zoom=2,
-        # height=800,
-        # width=800,
-    )
-    _fig.update_traces(
-        cluster=dict(
-            enabled=True,
-            maxzoom=5,  # Individual bubbles appear at zoom level 10+
-            color="royalblue",
-            # step=1,  # How many points trigger a cluster (1 is default)
-        )
+        hover_data={
+            "NAME": True,
+            "STATE": True,
+            "ID": True,
+            "NUM_YEARS": True,
+            "COUNT": True,
+        },
+        zoom=_zoom,
+        center={
+            "lat": (_view.south + _view.north) / 2,
+            "lon": (_view.west + _view.east) / 2,
+        },
     )
     _fig.update_layout(clickmode="event+select", dragmode="pan")
-    # del _fig
+
+
+    def _zoom_into_cluster(selection):
+        # Selecting a cluster zooms the map into the stations it contains
+        _clusters = _points.filter(
+            pl.col("ID").is_null()
+            & pl.col("NAME").is_in([entry.get("NAME") for entry in selection or []])
+        )
+        if not _clusters.is_empty():
+            set_map_view(
+                spatial.BBox(
+                    _clusters["SOUTH"].min(),
+                    _clusters["WEST"].min(),
+                    _clusters["NORTH"].max(),
+                    _clusters["EAST"].max(),
+                )
+            )
+
 
     # Wrap it in a marimo UI element
     map_selector = mo.ui.plotly(
-        _fig, label="Choose a station by map (zoom and click)", config=plotly_config
+        _fig,
+        label="Choose a station by map (click a cluster to zoom into it)",
+        config=plotly_config,
+        on_change=_zoom_into_cluster,
+    )
+    _reset = mo.ui.button(
+        label="Zoom out", on_click=lambda _: set_map_view(spatial.WORLD)
     )
 
     # Display the map
-    map_selector
+    mo.vstack([map_selector, _reset])
     return (map_selector,)
 
 
 @app.cell
-def _(map_selector, mo, stations_df):
+def _(mo):
+    station_query = mo.ui.text(
+        placeholder="Name, state or ID", label="Search stations", debounce=True
+    )
+    station_query
+    return (station_query,)
+
+
+@app.cell
+def _(catalog_df, map_selector, mo, station_mask, station_query, station_search):
     def _key(name: str, state: str) -> str:
         return f"{state} - {name}"
 
 
+    # Only the best matches are sent to the browser rather than every station
+    _matches = catalog_df[
+        station_search.search(station_query.value, mask=station_mask)
+    ]
     _values = {
         _key(name, state): id
         for name, state, id in zip(
-            stations_df["NAME"], stations_df["STATE"], stations_df["ID"]
+            _matches["NAME"], _matches["STATE"], _matches["ID"]
         )
     }
 
@@ -176,12 +185,16 @@ def _(map_selector, mo, stations_df):
     _value = None
     if map_selector.value:
         entry = map_selector.value[0]
-        _value = _key(entry["NAME"], entry["STATE"])
+        # Clusters of several stations have no ID
+        if entry.get("ID"):
+            _value = _key(entry["NAME"], entry["STATE"])
+            _values[_value] = entry["ID"]
 
     station_dropdown = mo.ui.dropdown(
         _values,
         label="Choose a station",
         value=_value,
+        searchable=True,
     )
     station_dropdown
     return (station_dropdown,)
@@ -194,72 +207,43 @@ def _(station_dropdown):
 
 
 @app.cell
-def _(data, mo, plot, plotly_config):
-    _continous = mo.ui.plotly(plot.plot_continuous(data), config=plotly_config)
+def _(data, mo, monthly_cube, plot, plotly_config):
+    # Every winter in a few WebGL traces, so panning stays smooth however
+    # long the record is
+    _continous = mo.ui.plotly(
+        plot.plot_continuous(data, packed=True), config=plotly_config
+    )
     _overlapping_all = (
-        mo.ui.plotly(fig, config=plotly_config) for fig in plot.plot_overlapping(data)
+        mo.ui.plotly(fig, config=plotly_config)
+        for fig in plot.plot_overlapping(data, packed=True, bands=True)
+    )
+    _monthly = mo.ui.plotly(
+        plot.plot_monthly_averages(data, monthly_cube), config=plotly_config
     )
-    _monthly = mo.ui.plotly(plot.plot_monthly_averages(data), config=plotly_config)
 
-    mo.vstack([_continous, *_overlapping_all, _monthly])
-    return
+    charts = mo.vstack([_continous, *_overlapping_all, _monthly])
+    charts
+    return (charts,)
 
 
 @app.cell
-def _(mo, paths, pivoted_data):
-    duckdb_df = mo.sql(
-        f"""
-        WITH
-            pivoted_data AS (
-                PIVOT (
-                    SELECT
-                        ID,
-                        strptime(DATE, '%Y%m%d')::DATE AS DATE,
-                        ELEMENT,
-                        CASE
-                        -- Temperature: Tenths of C to Fahrenheit
-                            WHEN ELEMENT IN ('TMAX', 'TAVG', 'TMIN', 'TOBS') THEN ROUND((DATA_VALUE / 10.0) * 1.8 + 32, 2)
-                            -- Precipitation: Tenths of mm to Inches
-                            WHEN ELEMENT = 'PRCP' THEN ROUND(COALESCE(DATA_VALUE, 0) / 254.0, 2)
-                            -- Snow: mm to Inches
-                            WHEN ELEMENT IN ('SNOW', 'SNWD') THEN ROUND(COALESCE(DATA_VALUE, 0) / 25.4, 2)
-                            ELSE DATA_VALUE
-                        END AS converted_value
-                    FROM
-                        read_parquet({paths}, hive_partitioning = true)
-                    WHERE
-                        ELEMENT IN ('TMAX', 'TAVG', 'TMIN', 'PRCP', 'SNOW', 'SNWD')
-                        AND YEAR(strptime(DATE, '%Y%m%d')) > 1970
-                ) ON ELEMENT IN ('TMAX', 'TAVG', 'TMIN', 'PRCP', 'SNOW', 'SNWD') USING FIRST(converted_value)
-                GROUP BY
-                    ID,
-                    DATE
+def _(charts, mo, profiler):
+    # Refers to charts so this updates once they're built
+    _ = charts
+    mo.accordion(
+        {
+            "Time spent in each stage": mo.vstack(
+                [profiler.summary(), profiler.to_frame()]
             )
-        SELECT
-            ID,
-            DATE,
-            -- Leave temperatures as NULL if they are missing
-            TMAX,
-            TAVG,
-            TMIN,
-            -- Fill missing precipitation/snow with 0
-            COALESCE(PRCP, 0) AS PRCP,
-            COALESCE(SNOW, 0) AS SNOW,
-            COALESCE(SNWD, 0) AS SNWD
-        FROM
-            pivoted_data
-        ORDER BY
-            ID,
-            DATE;
-        """,
-        output=False
+        }
     )
-    return (duckdb_df,)
+    return
 
 
 @app.cell
-def _(duckdb_df, load_data):
-    data = load_data.load_noaa_data(duckdb_df.df())
+def _(daily_table, load_data, units):
+    # The stored table is in GHCNd's integer units until it's plotted
+    data = load_data.load_noaa_data(units.to_display_units(daily_table))
     data
     return (data,)
 
@@ -279,38 +263,100 @@ async def _(mo):
                 )
             )
 
-    import plotly.express as px
-    import plotly.io as pio
-
     import polars as pl
-    import pandas as pd
 
-    from cumulative_snow import load_data, plot
-    from cumulative_snow.args import Args
+    from cumulative_snow import (
+        browser_storage,
+        cache,
+        catalog,
+        fetch,
+        load_data,
+        profiling,
+        remote_parquet,
+        search,
+        spatial,
+        store,
+        units,
+    )
+    return (
+        browser_storage,
+        cache,
+        catalog,
+        fetch,
+        load_data,
+        pl,
+        profiling,
+        remote_parquet,
+        search,
+        spatial,
+        store,
+        units,
+    )
+
+
+@app.cell
+def _(load_data, mo):
+    # Imported apart from the data modules so the catalog can load before
+    # plotly, the slowest import, is needed. Refers to load_data so this runs
+    # once the package is installed.
+    _ = load_data
+    import plotly.express as px
+    import plotly.io as pio
 
-    import os
-    import urllib.request
-    from urllib.parse import urlencode
+    from cumulative_snow import plot
 
     # Set plotly theme based on marimo theme
     pio.templates.default = "plotly_dark" if mo.app_meta().theme == "dark" else None
-    return load_data, os, pd, pl, plot, px, urlencode, urllib
+    return plot, px
 
 
 @app.cell
 def _():
     import marimo as mo
 
-    # TODO: make marimo use IndexDB for persistent caches:
-    #
-    # - Implementation: Mount pyodide.FS.filesystems.IDBFS to a local path (e.g., /mnt/marimo_cache).
-    # - Syncing: Ensure pyodide.FS.syncfs(True, ...) runs on notebook startup to hydrate data.
-    # - Lifecycle: Add a final cell to trigger pyodide.FS.syncfs(False, ...) to persist results
-    #   to the browser's IndexedDB after expensive computations.
-    # - Reference: https://pyodide.org, https://share.google/aimode/WPx02Z0E7LqlgScYt
     return (mo,)
 
 
+@app.cell
+async def _(browser_storage):
+    # Under WASM this is kept in IndexedDB, and last visit's files are restored
+    # before anything reads them
+    cache_dir = await browser_storage.mount_persistent("/tmp/noaa-ghcn")
+    return (cache_dir,)
+
+
+@app.cell
+def _(cache, cache_dir):
+    # Revalidated with NOAA before reuse, least recently used files are evicted
+    # past the byte budget
+    data_cache = cache.StationCache(cache_dir, max_bytes=cache.DEFAULT_MAX_BYTES)
+    return (data_cache,)
+
+
+@app.cell
+def _(cache_dir, store):
+    station_store = store.DailyStore(f"{cache_dir}/daily.db")
+    return (station_store,)
+
+
+@app.cell
+async def _(browser_storage, catalog_df):
+    # Refers to catalog_df so the catalog is saved once it's downloaded
+    _ = catalog_df
+    await browser_storage.sync()
+    return
+
+
+@app.cell
+async def _(browser_storage, daily_table, mo, station_store):
+    # Refers to daily_table so the station is saved once it's stored
+    _ = daily_table
+    station_store.checkpoint()
+    _saved = await browser_storage.sync()
+    mo.md("Station data saved in this browser for your next visit") if _saved else None
+    return
+
+
 @app.function
 def is_wasm():
     import sys
@@ -319,12 +365,15 @@ def is_wasm():
 
 
 @app.cell
-def hack_for_https_not_working(
-    download_parquet,
+async def hack_for_https_not_working(
+    cache,
+    fetch,
     mo,
+    profiling,
+    remote_parquet,
     selected_station: str | None,
-    urlencode,
-    urllib,
+    station_store,
+    store,
 ):
     # This whole cell is a hack to get around none of polars, pandas, duckdb's
     # https, fsspec, and botocore not working correctly in pyodide.
@@ -333,52 +382,37 @@ def hack_for_https_not_working(
 
     mo.stop(not selected_station)
 
-    import xml.etree.ElementTree as ET
-    import pyarrow.dataset as ds
-
-
-    def list_public_objects_with_prefix(bucket_name, prefix, region="us-east-1"):
-        # S3 API uses 'prefix' query parameter to filter results
-        params = {"list-type": "2", "prefix": prefix}
-        query_string = urlencode(params)
-        url = f"https://{bucket_name}.s3.amazonaws.com/?{query_string}"
-
-        ns = {"s3": "http://s3.amazonaws.com/doc/2006-03-01/"}
-
-        with urllib.request.urlopen(url) as response:
-            r = response.read()
-            root = ET.fromstring(r)
+    # Records the time, rows, bytes and peak memory of every stage. A new one
+    # for each station, so the stages shown are only the current station's.
+    profiler = profiling.enable()
 
-            # Extract keys from the XML response
-            for content in root.findall("s3:Contents", ns):
-                yield content.find("s3:Key", ns).text
-
-            if not root.findall("s3:Contents", ns):
-                raise RuntimeError(f"No objects found with prefix: {prefix}")
-
-
-    paths = []
-    for key in list_public_objects_with_prefix(
-        "noaa-ghcn-pds",
-        f"parquet/by_station/STATION={selected_station}",
-    ):
-        path = f"/tmp/{key}"
-        url = f"https://noaa-ghcn-pds.s3.amazonaws.com/{key}"
-        download_parquet(path, url)
-        paths.append(path)
-    return (paths,)
-
-
-@app.cell
-def _(mo, os, urllib):
-    # This "caches" the computation really, the return value is not important
-    @mo.persistent_cache
-    def download_parquet(path: str, url: str):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        urllib.request.urlretrieve(url, path)
-        return path
-
-    return (download_parquet,)
+    # Stations checked against NOAA's files recently aren't listed again
+    daily_table = station_store.get_recent(
+        selected_station, max_age_seconds=cache.DEFAULT_MAX_AGE_SECONDS
+    )
+    if daily_table is None:
+        _prefix = f"parquet/by_station/STATION={selected_station}"
+        if is_wasm():
+            _objects = [_obj async for _obj in fetch.list_objects_async(_prefix)]
+        else:
+            _objects = list(fetch.list_objects(_prefix))
+        if not _objects:
+            raise RuntimeError(f"No objects found with prefix: {_prefix}")
+
+        # Reuses the stored pivoted table unless the station's files changed.
+        # When they did, only the station's latest winter is read again, and
+        # only the columns, elements and row groups the pivot uses are fetched.
+        daily_table = station_store.load(
+            selected_station,
+            store.source_hash(_objects),
+            lambda since: remote_parquet.read_station_parquet(
+                [f"{fetch.NOAA_BUCKET_URL}/{_obj.key}" for _obj in _objects],
+                min_date=since,
+            ),
+        )
+    # Kept up to date with the daily table
+    monthly_cube = station_store.monthly(selected_station)
+    return daily_table, monthly_cube, profiler
 
 
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+"""Dataset-wide snowfall statistics from NOAA's by_year parquet partitions.
+
+Every station's snow total for each winter is built first, one winter at a
+time, by DuckDB scanning only the ELEMENT=SNOW files of the two years the
+winter spans. Each winter is written to its own parquet file as soon as it's
+done, so a pass over the whole dataset keeps memory bounded and, if stopped,
+picks up where it left off. DuckDB spills to disk past its memory limit.
+
+The statistics are queries over those totals, which are a row per station per
+winter rather than per day. Snow is in mm, GHCNd's unit.
+
+    uv run python -m cumulative_snow.analytics --output_dir analytics/
+"""
+
+import logging
+import os
+import re
+from argparse import ArgumentParser
+from collections import defaultdict
+from typing import Callable, Optional, Sequence
+
+import duckdb
+import pyarrow as pa
+
+from cumulative_snow import profiling
+from cumulative_snow.load_data import WINTER_START_MONTH
+
+logger = logging.getLogger(__name__)
+
+NOAA_BY_YEAR_URL = "s3://noaa-ghcn-pds/parquet/by_year"
+DEFAULT_MEMORY_LIMIT = "2GB"
+# Winters with fewer SNOW reports than this are left out of the statistics,
+# as their totals would be missing much of the season
+DEFAULT_MIN_DAYS = 120
+# The current WMO climate normal period, and how many of its winters a
+# station needs for a normal
+DEFAULT_NORMALS = (1991, 2020)
+DEFAULT_MIN_NORMAL_WINTERS = 20
+DEFAULT_TOP = 10
+
+TOTALS_DIR = "winter_totals"
+
+_YEAR_IN_PATH = re.compile(r"YEAR=(\d+)")
+
+_WINTER_TOTALS_SQL = """
+SELECT
+    ID,
+    sum(DATA_VALUE)::INTEGER AS SNOW,
+    count(*)::SMALLINT AS DAYS,
+    max(DATA_VALUE)::SMALLINT AS MAX_DAILY
+FROM read_parquet({files})
+WHERE DATE >= '{start}' AND DATE < '{end}'
+    -- Readings that failed a quality check
+    AND NULLIF(TRIM(Q_FLAG), '') IS NULL
+GROUP BY ID
+ORDER BY ID
+"""
+
+_PERCENTILE_RANKS_SQL = """
+WITH ranked AS (
+    SELECT
+        ID,
+        WINTER_YEAR,
+        SNOW,
+        count(*) OVER (PARTITION BY ID) AS WINTERS,
+        percent_rank() OVER (PARTITION BY ID ORDER BY SNOW) AS PERCENT_RANK
+    FROM {totals}
+    WHERE DAYS >= $min_days
+)
+SELECT ID, SNOW, WINTERS, PERCENT_RANK
+FROM ranked
+WHERE WINTER_YEAR = $winter
+ORDER BY ID
+"""
+
+_ANOMALIES_SQL = """
+WITH normals AS (
+    SELECT ID, avg(SNOW) AS NORMAL, count(*) AS NORMAL_WINTERS
+    FROM {totals}
+    WHERE DAYS >= $min_days AND WINTER_YEAR BETWEEN $normal_start AND $normal_end
+    GROUP BY ID
+    HAVING count(*) >= $min_normal_winters
+)
+SELECT
+    ID,
+    SNOW,
+    NORMAL,
+    SNOW - NORMAL AS ANOMALY,
+    (SNOW - NORMAL) / NULLIF(NORMAL, 0) AS ANOMALY_FRACTION,
+    NORMAL_WINTERS
+FROM {totals}
+JOIN normals USING (ID)
+WHERE WINTER_YEAR = $winter AND DAYS >= $min_days
+ORDER BY ID
+"""
+
+_TOP_WINTERS_SQL = """
+SELECT
+    STATE,
+    row_number() OVER (
+        PARTITION BY STATE ORDER BY SNOW DESC, ID, WINTER_YEAR
+    ) AS RANK,
+    ID,
+    NAME,
+    WINTER_YEAR,
+    SNOW
+FROM {totals}
+JOIN stations USING (ID)
+WHERE STATE IS NOT NULL AND DAYS >= $min_days
+QUALIFY RANK <= $n
+ORDER BY STATE, RANK
+"""
+
+
+class SnowAnalytics:
+    """Per station winter snow totals under output_dir and statistics over
+    them, computed by DuckDB within memory_limit and threads"""
+
+    def __init__(
+        self,
+        output_dir: str,
+        memory_limit: str = DEFAULT_MEMORY_LIMIT,
+        threads: Optional[int] = None,
+    ) -> None:
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self._con = duckdb.connect()
+        self._con.execute(f"SET memory_limit = {_quote(memory_limit)}")
+        if threads:
+            self._con.execute(f"SET threads = {int(threads)}")
+        # Where large aggregates and sorts spill to
+        spill = os.path.join(output_dir, ".spill")
+        self._con.execute(f"SET temp_directory = {_quote(spill)}")
+        # Lets results stream out without being buffered to keep their order
+        self._con.execute("SET preserve_insertion_order = false")
+
+    def close(self) -> None:
+        self._con.close()
+
+    def totals_path(self, winter: int) -> str:
+        return os.path.join(
+            self.output_dir, TOTALS_DIR, f"WINTER_YEAR={winter}", "data.parquet"
+        )
+
+    def build_winter_totals(
+        self,
+        source: str = NOAA_BY_YEAR_URL,
+        start_winter: Optional[int] = None,
+        end_winter: Optional[int] = None,
+        refresh: bool = False,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> list[int]:
+        """Writes each winter's totals from the by_year partitions under
+        source, skipping winters already written unless refresh. The latest
+        winter may still be open, so it's always rebuilt. Returns the winters
+        written."""
+        files = self._snow_files(source)
+        years = set(files)
+        winters = sorted(years | {year - 1 for year in years})
+        winters = [
+            w
+            for w in winters
+            if (start_winter is None or w >= start_winter)
+            and (end_winter is None or w <= end_winter)
+        ]
+        written = []
+        for winter in winters:
+            path = self.totals_path(winter)
+            if os.path.exists(path) and not refresh and winter != winters[-1]:
+                continue
+            with profiling.span("winter_totals") as span:
+                winter_files = files.get(winter, []) + files.get(winter + 1, [])
+                self._copy(
+                    _WINTER_TOTALS_SQL.format(
+                        files=_list(winter_files),
+                        start=f"{winter}{WINTER_START_MONTH:02d}01",
+                        end=f"{winter + 1}{WINTER_START_MONTH:02d}01",
+                    ),
+                    path,
+                )
+                span.rows = len(winter_files)
+            written.append(winter)
+            if on_progress:
+                on_progress(winter)
+        return written
+
+    def winters(self) -> list[int]:
+        """Winters with totals written"""
+        directory = os.path.join(self.output_dir, TOTALS_DIR)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            int(name.removeprefix("WINTER_YEAR="))
+            for name in os.listdir(directory)
+            if name.startswith("WINTER_YEAR=")
+        )
+
+    def percentile_ranks(
+        self, winter: int, min_days: int = DEFAULT_MIN_DAYS
+    ) -> pa.Table:
+        """Each station's total for the winter with its percentile rank among
+        all the station's winters, from 0 for its least snowy to 1 for its
+        snowiest"""
+        return self._query(
+            _PERCENTILE_RANKS_SQL, {"winter": winter, "min_days": min_days}
+        )
+
+    def anomalies(
+        self,
+        winter: int,
+        normals: tuple[int, int] = DEFAULT_NORMALS,
+        min_normal_winters: int = DEFAULT_MIN_NORMAL_WINTERS,
+        min_days: int = DEFAULT_MIN_DAYS,
+    ) -> pa.Table:
+        """Each station's total for the winter against its mean over the
+        normals period, for stations with at least min_normal_winters then"""
+        return self._query(
+            _ANOMALIES_SQL,
+            {
+                "winter": winter,
+                "normal_start": normals[0],
+                "normal_end": normals[1],
+                "min_normal_winters": min_normal_winters,
+                "min_days": min_days,
+            },
+        )
+
+    def top_winters(
+        self,
+        stations: pa.Table,
+        n: int = DEFAULT_TOP,
+        min_days: int = DEFAULT_MIN_DAYS,
+    ) -> pa.Table:
+        """The n snowiest station winters in each state. stations needs ID,
+        NAME and STATE columns, like the catalog."""
+        self._con.register("stations", stations.select(["ID", "NAME", "STATE"]))
+        try:
+            return self._query(_TOP_WINTERS_SQL, {"n": n, "min_days": min_days})
+        finally:
+            self._con.unregister("stations")
+
+    def _snow_files(self, source: str) -> dict[int, list[str]]:
+        """SNOW partition files under source by YEAR, listed once up front"""
+        if "://" in source:
+            self._con.execute("INSTALL httpfs")
+            self._con.execute("LOAD httpfs")
+            # The NOAA bucket is public
+            self._con.execute("SET s3_region = 'us-east-1'")
+        pattern = f"{source.rstrip('/')}/YEAR=*/ELEMENT=SNOW/*.parquet"
+        files: dict[int, list[str]] = defaultdict(list)
+        with profiling.span("list_objects") as span:
+            for (path,) in self._con.execute(
+                f"SELECT file FROM glob({_quote(pattern)})"
+            ).fetchall():
+                match = _YEAR_IN_PATH.search(path)
+                if match:
+                    files[int(match.group(1))].append(path)
+            span.rows = sum(len(paths) for paths in files.values())
+        return files
+
+    def _copy(self, query: str, path: str) -> None:
+        """Streams the query's result to a parquet file, replacing it only
+        once it's complete"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + ".partial"
+        self._con.execute(f"COPY ({query}) TO {_quote(partial)} (FORMAT parquet)")
+        os.replace(partial, path)
+
+    def _query(self, sql: str, params: dict) -> pa.Table:
+        pattern = os.path.join(
+            self.output_dir, TOTALS_DIR, "WINTER_YEAR=*", "data.parquet"
+        )
+        totals = (
+            f"read_parquet({_quote(pattern)}, hive_partitioning = true, "
+            "hive_types = {'WINTER_YEAR': INTEGER})"
+        )
+        result = self._con.execute(sql.format(totals=totals), params)
+        # A Table before DuckDB 1.5 and a RecordBatchReader after
+        return pa.table(result.arrow())
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _list(values: Sequence[str]) -> str:
+    return "[" + ", ".join(_quote(v) for v in values) + "]"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import pyarrow.parquet as pq
+
+    from cumulative_snow import catalog
+    from cumulative_snow.cache import StationCache
+
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--output_dir", required=True, help="Where totals and results are written"
+    )
+    parser.add_argument(
+        "--source",
+        default=NOAA_BY_YEAR_URL,
+        help="The by_year partitions, a local directory or S3 URL",
+    )
+    parser.add_argument("--start_winter", type=int)
+    parser.add_argument("--end_winter", type=int)
+    parser.add_argument(
+        "--winter",
+        type=int,
+        help="Winter to rank and compare to normals. Defaults to the latest",
+    )
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP)
+    parser.add_argument("--memory_limit", default=DEFAULT_MEMORY_LIMIT)
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args(argv)
+
+    analytics = SnowAnalytics(args.output_dir, args.memory_limit, args.threads)
+    try:
+        analytics.build_winter_totals(
+            args.source,
+            args.start_winter,
+            args.end_winter,
+            on_progress=lambda winter: print(f"Winter {winter} totals written"),
+        )
+        winters = analytics.winters()
+        if not winters:
+            parser.error(f"No SNOW partitions found in {args.source}")
+        winter = args.winter or winters[-1]
+        stations = catalog.load_catalog(StationCache()).to_arrow()
+        results = {
+            f"percentile_ranks_{winter}": analytics.percentile_ranks(winter),
+            f"anomalies_{winter}": analytics.anomalies(winter),
+            f"top_{args.top}_winters_per_state": analytics.top_winters(
+                stations, args.top
+            ),
+        }
+        for name, table in results.items():
+            path = os.path.join(args.output_dir, f"{name}.parquet")
+            pq.write_table(table, path)
+            print(f"Wrote {table.num_rows} rows to {path}")
+    finally:
+        analytics.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,11 @@ class Args:
     end_year: Optional[datetime] = None
     station: Optional[str] = None
     list_stations: bool = False
+    output_dir: Optional[str] = None
+    stations: Optional[str] = None
+    station_filter: Optional[str] = None
+    workers: Optional[int] = None
+    profile: bool = False
 
 
 def _get_parser() -> ArgumentParser:
@@ -41,6 +46,32 @@ def _get_parser() -> ArgumentParser:
         help="List stations and numbers of datapoints for each station in the csv "
         "file and exit",
     )
+    parser.add_argument(
+        "--output_dir",
+        help="Write an HTML report per station to this directory instead of "
+        "a single --output_path",
+    )
+    parser.add_argument(
+        "--stations",
+        help="Comma separated station IDs to write reports for with --output_dir",
+    )
+    parser.add_argument(
+        "--station_filter",
+        help="Regex matched against station IDs and names to choose the stations "
+        "to write reports for with --output_dir",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes writing reports with --output_dir. Defaults to "
+        "the number of CPUs",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time, rows, bytes and peak memory of each stage as JSON to "
+        "stderr when done",
+    )
     return parser
 
 
@@ -0,0 +1,217 @@
+"""Writes HTML reports for many stations in a CSV export at once.
+
+The CSV is streamed once in the main process. Rows must be grouped by
+station, as NCEI exports are, so each station is handed to a worker process
+as soon as its last row has been read, and figure building, HTML writing and
+SVG export for different stations run in parallel. Reading stops while a few
+stations per worker are waiting, so memory doesn't grow with the CSV when
+workers are slower than reading. A station that fails is reported without
+stopping the rest.
+"""
+
+import functools
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, Sequence
+
+import polars as pl
+
+from cumulative_snow import load_data, profiling
+from cumulative_snow.args import Args
+
+logger = logging.getLogger(__name__)
+
+# Stations read ahead of the workers, per worker
+PENDING_PER_WORKER = 2
+
+
+@dataclass
+class StationReport:
+    station: str
+    output_path: str
+    seconds: float = 0.0
+    # Formatted traceback when writing the report failed
+    error: Optional[str] = None
+    # The worker's profiling spans when profiling was enabled
+    spans: Optional[list[dict]] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# Called in the main process as each station finishes
+ProgressCallback = Callable[[StationReport, int], None]
+
+
+def write_reports(
+    csv_path: str,
+    output_dir: str,
+    stations: Optional[Sequence[str]] = None,
+    station_filter: Optional[str] = None,
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+    save_svgs: bool = False,
+    max_workers: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> list[StationReport]:
+    """Writes <output_dir>/<station>.html for each station in the CSV.
+
+    Stations are all of those in the CSV, limited to the given station IDs
+    and to those whose ID or NAME matches the station_filter regex, in
+    polars' regex syntax. Raises ValueError when a station's rows aren't
+    together in the CSV.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if station_filter:
+        # Fail before starting any workers, with the regex engine that's used
+        try:
+            pl.select(pl.lit("").str.contains(station_filter))
+        except pl.exceptions.ComputeError as e:
+            raise ValueError(f"Invalid station_filter {station_filter!r}") from e
+    wanted = set(stations) if stations else None
+    reports: list[StationReport] = []
+
+    def done(station: str, output_path: str, future: "Future[StationReport]") -> None:
+        try:
+            report = future.result()
+        except BrokenProcessPool:
+            # The worker process died rather than the report failing
+            report = StationReport(station, output_path, error=traceback.format_exc())
+        reports.append(report)
+        if report.ok:
+            logger.info("Wrote %s in %.1fs", report.output_path, report.seconds)
+        else:
+            logger.error("Failed %s:\n%s", report.station, report.error)
+        if on_progress:
+            on_progress(report, len(reports))
+
+    # Each submitted station's frame waits in the pool's queue until a worker
+    # is free, so only this many are read ahead
+    max_pending = PENDING_PER_WORKER * (max_workers or os.cpu_count() or 1)
+    pending: set[Future] = set()
+    # Spawned rather than forked, as forking after polars has started its
+    # thread pool can deadlock
+    with ProcessPoolExecutor(
+        max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        for station, frame in _iter_stations(
+            csv_path, wanted, station_filter, start_year, end_year
+        ):
+            if len(pending) >= max_pending:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            output_path = os.path.join(output_dir, f"{station}.html")
+            future = pool.submit(
+                _write_report,
+                station,
+                frame,
+                output_path,
+                save_svgs,
+                profiling.current() is not None,
+            )
+            future.add_done_callback(functools.partial(done, station, output_path))
+            pending.add(future)
+    return reports
+
+
+def write_reports_from_args(args: Args) -> list[StationReport]:
+    assert args.output_dir
+    return write_reports(
+        args.csv_path,
+        args.output_dir,
+        stations=args.stations.split(",") if args.stations else None,
+        station_filter=args.station_filter,
+        start_year=args.start_year.year if args.start_year else None,
+        end_year=args.end_year.year if args.end_year else None,
+        save_svgs=args.save_svgs,
+        max_workers=args.workers,
+        on_progress=lambda report, n: print(
+            f"[{n}] {report.station}: "
+            + (report.output_path if report.ok else "FAILED"),
+            flush=True,
+        ),
+    )
+
+
+def _iter_stations(
+    csv_path: str,
+    wanted: Optional[set[str]],
+    station_filter: Optional[str],
+    start_year: Optional[int],
+    end_year: Optional[int],
+) -> Iterator[tuple[str, pl.DataFrame]]:
+    """Each station's complete rows, yielded once a later station is seen"""
+    pending: list[pl.DataFrame] = []
+    seen: set[str] = set()
+
+    def complete(frames: list[pl.DataFrame]) -> tuple[str, pl.DataFrame]:
+        station, frame = _complete(frames)
+        if station in seen:
+            raise ValueError(
+                f"{station} appears again later in {csv_path}, "
+                "its rows must be together"
+            )
+        seen.add(station)
+        return station, frame
+
+    for chunk in load_data.iter_noaa_csv(
+        csv_path, start_year=start_year, end_year=end_year
+    ):
+        if wanted is not None:
+            chunk = chunk.filter(pl.col("STATION").is_in(wanted))
+        if station_filter:
+            chunk = chunk.filter(
+                pl.col("STATION").str.contains(station_filter)
+                | pl.col("NAME").fill_null("").str.contains(station_filter)
+            )
+        if chunk.is_empty():
+            continue
+        parts = chunk.partition_by("STATION", maintain_order=True)
+        if pending and pending[0]["STATION"][0] != parts[0]["STATION"][0]:
+            yield complete(pending)
+            pending = []
+        pending.append(parts[0])
+        for part in parts[1:]:
+            yield complete(pending)
+            pending = [part]
+    if pending:
+        yield complete(pending)
+
+
+def _complete(frames: list[pl.DataFrame]) -> tuple[str, pl.DataFrame]:
+    frame = pl.concat(frames)
+    return frame["STATION"][0], frame
+
+
+def _write_report(
+    station: str,
+    frame: pl.DataFrame,
+    output_path: str,
+    save_svgs: bool,
+    profile: bool,
+) -> StationReport:
+    """Runs in a worker process, returning failures instead of raising them"""
+    start = time.perf_counter()
+    report = StationReport(station, output_path)
+    profiler = profiling.enable() if profile else None
+    try:
+        # Only the workers plot, so the main process never imports plotly
+        from cumulative_snow import plot
+
+        plot.write_report(frame, output_path, save_svgs)
+    except Exception:
+        # Whatever goes wrong with one station's data or plots is reported
+        # for that station rather than ending the whole batch
+        report.error = traceback.format_exc()
+    finally:
+        profiling.disable()
+    report.seconds = time.perf_counter() - start
+    if profiler is not None:
+        report.spans = profiler.records()
+    return report
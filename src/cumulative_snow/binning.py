@@ -0,0 +1,111 @@
+"""Aggregates computed up front so figures are built from bins, not points.
+
+Plotly's histogram, density heatmap and violin traces bin and estimate
+densities in the browser, which means every raw point is serialized into the
+figure, once per trace using it. These compute the same aggregates in NumPy so
+the figure size depends on the number of bins rather than the record length.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+DEFAULT_BINS = 30
+# Raw points still drawn over the aggregates, at most
+DEFAULT_SAMPLE_POINTS = 2000
+# Points along each violin's outline
+KDE_POINTS = 32
+
+
+@dataclass
+class Histogram:
+    counts: np.ndarray
+    edges: np.ndarray
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self.edges[:-1] + np.diff(self.edges) / 2
+
+
+@dataclass
+class Histogram2D:
+    # Indexed [y bin, x bin] like plotly's heatmap z
+    counts: np.ndarray
+    x_edges: np.ndarray
+    y_edges: np.ndarray
+
+
+@dataclass
+class Distribution:
+    """What a box and violin trace draw for one group of values"""
+
+    count: int
+    mean: float
+    q1: float
+    median: float
+    q3: float
+    lowerfence: float
+    upperfence: float
+    # Gaussian KDE outline, density normalized to a peak of 1
+    grid: np.ndarray
+    density: np.ndarray
+
+
+def histogram(values: np.ndarray, bins: int = DEFAULT_BINS) -> Histogram:
+    counts, edges = np.histogram(_finite(values), bins=bins)
+    return Histogram(counts, edges)
+
+
+def histogram2d(x: np.ndarray, y: np.ndarray, bins: int = DEFAULT_BINS) -> Histogram2D:
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(x[finite], y[finite], bins=bins)
+    return Histogram2D(counts.T.astype(np.int64), x_edges, y_edges)
+
+
+def distribution(values: np.ndarray, points: int = KDE_POINTS) -> Distribution:
+    values = _finite(values)
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    # Whiskers stop at the furthest values within 1.5 IQR, like plotly's
+    iqr = q3 - q1
+    lowerfence = values[values >= q1 - 1.5 * iqr].min()
+    upperfence = values[values <= q3 + 1.5 * iqr].max()
+
+    # Scott's rule, with a floor for groups of identical values
+    spread = values.std() if len(values) > 1 else 0.0
+    bandwidth = max(1.06 * spread * len(values) ** -0.2, 1e-3 * max(abs(median), 1))
+    # Extends past the data by two bandwidths like plotly's "soft" span
+    grid = np.linspace(
+        values.min() - 2 * bandwidth, values.max() + 2 * bandwidth, points
+    )
+    density = np.exp(-0.5 * ((grid[:, None] - values[None, :]) / bandwidth) ** 2).sum(
+        axis=1
+    )
+    return Distribution(
+        count=len(values),
+        mean=float(values.mean()),
+        q1=float(q1),
+        median=float(median),
+        q3=float(q3),
+        lowerfence=float(lowerfence),
+        upperfence=float(upperfence),
+        grid=grid,
+        density=density / density.max(),
+    )
+
+
+def sample(
+    data: pl.DataFrame, max_rows: int = DEFAULT_SAMPLE_POINTS, seed: int = 0
+) -> pl.DataFrame:
+    """At most max_rows rows of data picked uniformly, in their original order.
+    Seeded so a figure doesn't change between renders."""
+    if len(data) <= max_rows:
+        return data
+    rng = np.random.default_rng(seed)
+    return data[np.sort(rng.choice(len(data), max_rows, replace=False))]
+
+
+def _finite(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return values[np.isfinite(values)]
@@ -0,0 +1,99 @@
+"""Keeps the WASM build's cache directory in the browser's IndexedDB.
+
+Pyodide's filesystem lives in memory, so without this every page load
+downloads the station catalog and station data again. The cache directory is
+mounted on Emscripten's IDBFS, which copies files to and from IndexedDB only
+when asked: once after mounting to restore the last visit's files, and after
+each expensive step to save the new ones.
+
+Under CPython the directory is already on disk and only the version check
+applies.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+from typing import Optional
+
+from cumulative_snow.fetch import is_pyodide
+
+logger = logging.getLogger(__name__)
+
+# Bump when what's kept in the directory changes in a way the cache, catalog
+# snapshot and store don't detect themselves, so older copies are dropped
+STORAGE_VERSION = 1
+VERSION_NAME = ".storage_version"
+
+_mounted: set[str] = set()
+# IDBFS can't run two syncs at once
+_sync_lock: Optional[asyncio.Lock] = None
+
+
+async def mount_persistent(path: str) -> str:
+    """Mounts path on IndexedDB under pyodide and restores its files from the
+    last visit, then drops them if they were saved by another version.
+    Returns path."""
+    os.makedirs(path, exist_ok=True)
+    if is_pyodide() and path not in _mounted:
+        fs = _fs()
+        fs.mount(fs.filesystems.IDBFS, {}, path)
+        _mounted.add(path)
+        await _syncfs(populate=True)
+    _check_version(path)
+    return path
+
+
+async def sync() -> bool:
+    """Saves the mounted directories to IndexedDB. Returns whether anything
+    was mounted to save."""
+    if not _mounted:
+        return False
+    await _syncfs(populate=False)
+    return True
+
+
+def _check_version(path: str) -> None:
+    version_path = os.path.join(path, VERSION_NAME)
+    try:
+        with open(version_path) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        version = None
+    if version == str(STORAGE_VERSION):
+        return
+    if version is not None:
+        logger.info("Dropping %s saved by storage version %s", path, version)
+        for name in os.listdir(path):
+            child = os.path.join(path, name)
+            if os.path.isdir(child):
+                shutil.rmtree(child)
+            else:
+                os.remove(child)
+    with open(version_path, "w") as f:
+        f.write(f"{STORAGE_VERSION}\n")
+
+
+def _fs():
+    import pyodide_js  # pyright: ignore[reportMissingImports]
+
+    return pyodide_js.FS
+
+
+async def _syncfs(populate: bool) -> None:
+    from pyodide.ffi import create_once_callable  # pyright: ignore[reportMissingImports]
+
+    global _sync_lock
+    if _sync_lock is None:
+        _sync_lock = asyncio.Lock()
+    async with _sync_lock:
+        done = asyncio.get_running_loop().create_future()
+
+        def callback(error) -> None:
+            if error:
+                done.set_exception(OSError(f"IndexedDB sync failed: {error}"))
+            else:
+                done.set_result(None)
+
+        _fs().syncfs(populate, create_once_callable(callback))
+        await done
@@ -0,0 +1,218 @@
+"""On-disk cache for station data downloaded from NOAA.
+
+Each cached file has a JSON sidecar holding its ETag/Last-Modified so it can
+be revalidated with a conditional GET, and when it was last used so the cache
+can evict least recently used files once it goes over its byte budget.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Iterable, Mapping, Optional
+
+from cumulative_snow import profiling
+from cumulative_snow.fetch import (
+    DEFAULT_MAX_WORKERS,
+    Fetcher,
+    FetchResult,
+    default_fetcher,
+    is_pyodide,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(), "cumulative_snow")
+DEFAULT_MAX_BYTES = 1 << 30
+# NOAA updates GHCNd once a day, so there's no point checking more often
+DEFAULT_MAX_AGE_SECONDS = 6 * 60 * 60
+
+_META_SUFFIX = ".meta.json"
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+    used_at: float
+
+
+class StationCache:
+    """Size bounded cache of remote files under a local directory.
+
+    Files are stored at root/key so that hive partitioned keys like
+    parquet/by_station/STATION=.../file.parquet keep their layout for readers.
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_ROOT,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+        fetch: Optional[Fetcher] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_workers = max_workers
+        self._fetch = fetch or default_fetcher()
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, url: str, key: str) -> str:
+        """Local path for url, downloading or revalidating it if needed"""
+        return self.get_many({key: url})[key]
+
+    def get_many(self, urls: Mapping[str, str]) -> dict[str, str]:
+        """Like get() for a mapping of key -> url, fetching up to max_workers
+        files at once. None of the requested files will be evicted to make
+        room for each other."""
+        with profiling.span("download") as span:
+            if len(urls) <= 1 or self.max_workers <= 1 or is_pyodide():
+                paths = {key: self._refresh(key, url) for key, url in urls.items()}
+            else:
+                with ThreadPoolExecutor(self.max_workers) as pool:
+                    futures = {
+                        key: pool.submit(self._refresh, key, url)
+                        for key, url in urls.items()
+                    }
+                    paths = {key: future.result() for key, future in futures.items()}
+            span.rows = len(paths)
+        self.evict(keep=urls.keys())
+        return paths
+
+    def entry(self, key: str) -> Optional[CacheEntry]:
+        return self._read_meta(self.path(key))
+
+    def entries(self) -> dict[str, CacheEntry]:
+        entries = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(_META_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, filename[: -len(_META_SUFFIX)])
+                entry = self._read_meta(path)
+                if entry:
+                    entries[os.path.relpath(path, self.root)] = entry
+        return entries
+
+    def evict(self, keep: Iterable[str] = ()) -> None:
+        """Removes least recently used files until the cache fits in max_bytes"""
+        keep = {os.path.normpath(key) for key in keep}
+        with self._lock:
+            entries = self.entries()
+            total = sum(entry.size for entry in entries.values())
+            for key, entry in sorted(entries.items(), key=lambda e: e[1].used_at):
+                if total <= self.max_bytes:
+                    break
+                if key in keep:
+                    continue
+                logger.info("Evicting %s (%d bytes) from cache", key, entry.size)
+                self._remove(self.path(key))
+                total -= entry.size
+
+    def _refresh(self, key: str, url: str) -> str:
+        headers = self._revalidation_headers(key, url)
+        if headers is None:
+            return self.path(key)
+        try:
+            result = self._fetch(url, headers)
+        except OSError:
+            # Only a revalidation can fall back to the cached copy
+            if not headers:
+                raise
+            return self._stale(key, url)
+        return self._store(key, url, result)
+
+    def _revalidation_headers(self, key: str, url: str) -> Optional[dict[str, str]]:
+        """Headers to fetch key with, or None if the cached copy is fresh"""
+        path = self.path(key)
+        entry = self._read_meta(path)
+        if not entry or entry.url != url or not os.path.exists(path):
+            return {}
+
+        now = time.time()
+        if now - entry.checked_at < self.max_age_seconds:
+            entry.used_at = now
+            self._write_meta(path, entry)
+            return None
+
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _stale(self, key: str, url: str) -> str:
+        logger.warning("Failed to revalidate %s, using cached copy", url)
+        return self.path(key)
+
+    def _store(self, key: str, url: str, result: FetchResult) -> str:
+        path = self.path(key)
+        now = time.time()
+        if result.body is None:
+            entry = self._read_meta(path)
+            if entry is None:
+                raise RuntimeError(f"Got 304 Not Modified for uncached {url}")
+            entry.checked_at = entry.used_at = now
+            self._write_meta(path, entry)
+            return path
+
+        atomic_write(path, result.body)
+        self._write_meta(
+            path,
+            CacheEntry(
+                url=url,
+                size=len(result.body),
+                etag=result.etag,
+                last_modified=result.last_modified,
+                checked_at=now,
+                used_at=now,
+            ),
+        )
+        return path
+
+    def _read_meta(self, path: str) -> Optional[CacheEntry]:
+        try:
+            with open(path + _META_SUFFIX) as f:
+                return CacheEntry(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write_meta(self, path: str, entry: CacheEntry) -> None:
+        atomic_write(path + _META_SUFFIX, json.dumps(asdict(entry)).encode())
+
+    def _remove(self, path: str) -> None:
+        # Remove the metadata first so a crash never leaves a file that looks
+        # valid but isn't accounted for
+        for p in (path + _META_SUFFIX, path):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Writes to a temporary file in the same directory then renames it into
+    place so readers never see a partially written file"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
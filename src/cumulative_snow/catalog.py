@@ -0,0 +1,152 @@
+"""The GHCNd station catalog: station metadata joined with the years each
+station recorded snowfall.
+
+The source files are fixed width text, and ghcnd-inventory.txt is large, so
+they are parsed by slicing whole columns of lines at once. The joined catalog
+is saved as an Arrow IPC snapshot that later runs memory-map instead of
+parsing again, until NOAA updates either source file.
+"""
+
+import io
+import json
+import os
+from typing import Mapping, Optional
+
+import polars as pl
+import pyarrow as pa
+
+from cumulative_snow import profiling
+from cumulative_snow.cache import StationCache, atomic_write
+
+STATIONS_URL = "https://www.ncei.noaa.gov/pub/data/ghcn/daily/ghcnd-stations.txt"
+INVENTORY_URL = "https://www.ncei.noaa.gov/pub/data/ghcn/daily/ghcnd-inventory.txt"
+
+# (start, end, dtype) of each column, end exclusive
+ColSpecs = Mapping[str, tuple[int, int, type[pl.DataType]]]
+
+STATION_COLSPECS: ColSpecs = {
+    "ID": (0, 11, pl.String),
+    "LATITUDE": (12, 20, pl.Float64),
+    "LONGITUDE": (21, 30, pl.Float64),
+    "ELEVATION": (31, 37, pl.Float64),
+    "STATE": (38, 40, pl.String),
+    "NAME": (41, 71, pl.String),
+}
+INVENTORY_COLSPECS: ColSpecs = {
+    "ID": (0, 11, pl.String),
+    "ELEMENT": (31, 35, pl.String),
+    "FIRSTYEAR": (36, 40, pl.Int32),
+    "LASTYEAR": (41, 45, pl.Int32),
+}
+
+CATALOG_COLUMNS = (
+    "ID",
+    "NAME",
+    "STATE",
+    "FIRSTYEAR",
+    "LASTYEAR",
+    "NUM_YEARS",
+    "LATITUDE",
+    "LONGITUDE",
+    "ELEVATION",
+)
+
+SNAPSHOT_NAME = "catalog.arrow"
+# Bump when the snapshot's contents change so old snapshots are rebuilt
+SNAPSHOT_FORMAT = 1
+
+
+def parse_fixed_width(data: bytes, colspecs: ColSpecs) -> pl.DataFrame:
+    """Parses fixed width text by slicing every line at once"""
+    lines = pl.read_csv(
+        io.BytesIO(data),
+        has_header=False,
+        new_columns=["line"],
+        schema_overrides={"line": pl.String},
+        # Any byte that never appears in the files, so each line is one field
+        separator="\x1f",
+        quote_char=None,
+    )["line"]
+    columns = {}
+    for name, (start, end, dtype) in colspecs.items():
+        column = lines.str.slice(start, end - start).str.strip_chars()
+        columns[name] = (
+            pl.when(column.str.len_bytes() > 0).then(column).otherwise(None)
+        ).cast(dtype)
+    return pl.select(**columns)
+
+
+def build_catalog(stations: pl.DataFrame, inventory: pl.DataFrame) -> pl.DataFrame:
+    """Stations that record snowfall with the years they recorded it"""
+    return (
+        stations.join(
+            inventory.filter(pl.col("ELEMENT") == "SNOW").select(
+                "ID", "FIRSTYEAR", "LASTYEAR"
+            ),
+            on="ID",
+        )
+        .with_columns(NUM_YEARS=pl.col("LASTYEAR") - pl.col("FIRSTYEAR") + 1)
+        .select(CATALOG_COLUMNS)
+    )
+
+
+def load_catalog(
+    cache: StationCache,
+    stations_url: str = STATIONS_URL,
+    inventory_url: str = INVENTORY_URL,
+) -> pl.DataFrame:
+    """The station catalog, memory-mapped from the snapshot if it was built
+    from the current versions of the source files"""
+    with profiling.span("load_catalog") as span:
+        catalog = _load_catalog(cache, stations_url, inventory_url)
+        span.rows = len(catalog)
+    return catalog
+
+
+def _load_catalog(
+    cache: StationCache, stations_url: str, inventory_url: str
+) -> pl.DataFrame:
+    keys = {"ghcnd-stations.txt": stations_url, "ghcnd-inventory.txt": inventory_url}
+    paths = cache.get_many(keys)
+    version = {
+        "format": SNAPSHOT_FORMAT,
+        "sources": {key: _entry_version(cache, key) for key in keys},
+    }
+
+    snapshot = cache.path(SNAPSHOT_NAME)
+    if _read_version(snapshot) == version and os.path.exists(snapshot):
+        return read_snapshot(snapshot)
+
+    with open(paths["ghcnd-stations.txt"], "rb") as f:
+        stations = parse_fixed_width(f.read(), STATION_COLSPECS)
+    with open(paths["ghcnd-inventory.txt"], "rb") as f:
+        inventory = parse_fixed_width(f.read(), INVENTORY_COLSPECS)
+    catalog = build_catalog(stations, inventory)
+
+    buf = io.BytesIO()
+    # Uncompressed so it can be memory-mapped
+    catalog.write_ipc(buf, compression="uncompressed")
+    atomic_write(snapshot, buf.getvalue())
+    atomic_write(snapshot + ".version.json", json.dumps(version).encode())
+    return catalog
+
+
+def read_snapshot(path: str) -> pl.DataFrame:
+    """Memory-maps the snapshot so columns are paged in only when used"""
+    with pa.memory_map(path) as source:
+        return pl.DataFrame(pa.ipc.open_file(source).read_all())
+
+
+def _entry_version(cache: StationCache, key: str) -> Optional[list]:
+    entry = cache.entry(key)
+    if entry is None:
+        return None
+    return [entry.etag, entry.last_modified, entry.size]
+
+
+def _read_version(snapshot: str) -> Optional[dict]:
+    try:
+        with open(snapshot + ".version.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
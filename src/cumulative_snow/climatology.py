@@ -0,0 +1,100 @@
+"""Monthly climatology: per (station, year, month) aggregates of daily data.
+
+The cube is small, about 12 rows per station per year, and holds sums and
+counts alongside means so months can be combined without going back to the
+daily rows. Monthly averages for any station and year range are reductions
+over it.
+"""
+
+import calendar
+from typing import Optional, Sequence
+
+import polars as pl
+
+from cumulative_snow.load_data import (
+    WINTER_START_MONTH,
+    FrameLike,
+    station_column,
+    to_lazy,
+)
+
+TEMPERATURE_COLUMNS = ("TAVG", "TMAX", "TMIN")
+# Months in the order of a winter season, Jul through Jun
+SEASON_MONTHS = [(WINTER_START_MONTH - 1 + i) % 12 + 1 for i in range(12)]
+
+
+def monthly_cube(data: FrameLike) -> pl.DataFrame:
+    """Aggregates daily rows into one row per (station, YEAR, MONTH) with
+    DAYS, the SNOW sum and a mean and count of each temperature"""
+    frame = to_lazy(data)
+    schema = frame.collect_schema()
+    station = station_column(schema)
+    temperatures = [c for c in TEMPERATURE_COLUMNS if c in schema]
+    keys = [station] if station else []
+
+    return (
+        frame.group_by(
+            *keys,
+            pl.col("DATE").dt.year().cast(pl.Int32).alias("YEAR"),
+            pl.col("DATE").dt.month().cast(pl.Int8).alias("MONTH"),
+        )
+        .agg(
+            pl.len().cast(pl.Int32).alias("DAYS"),
+            pl.col("SNOW").sum(),
+            *(pl.col(c).mean().alias(f"{c}_MEAN") for c in temperatures),
+            *(
+                pl.col(c).count().cast(pl.Int32).alias(f"{c}_COUNT")
+                for c in temperatures
+            ),
+        )
+        .sort(*keys, "YEAR", "MONTH")
+        .collect()
+    )
+
+
+def monthly_averages(
+    cube: FrameLike,
+    stations: Optional[Sequence[str]] = None,
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+) -> pl.DataFrame:
+    """Average monthly SNOW total and temperatures over the years in the cube,
+    one row per month in season order with MONTH as its abbreviated name.
+
+    Each (station, year) month counts once, so a month's temperature is the
+    mean of its yearly means, and months with no temperature readings are
+    left out of that month's average.
+    """
+    frame = to_lazy(cube)
+    schema = frame.collect_schema()
+    station = station_column(schema)
+    if stations is not None and station:
+        frame = frame.filter(pl.col(station).is_in(list(stations)))
+    if start_year is not None:
+        frame = frame.filter(pl.col("YEAR") >= start_year)
+    if end_year is not None:
+        frame = frame.filter(pl.col("YEAR") <= end_year)
+    temperatures = [c for c in TEMPERATURE_COLUMNS if f"{c}_MEAN" in schema]
+
+    averages = (
+        frame.group_by("MONTH")
+        .agg(
+            pl.col("SNOW").mean(),
+            *(
+                pl.col(f"{c}_MEAN").filter(pl.col(f"{c}_COUNT") > 0).mean().alias(c)
+                for c in temperatures
+            ),
+        )
+        .collect()
+    )
+    months = pl.DataFrame(
+        {
+            "MONTH": pl.Series(SEASON_MONTHS, dtype=pl.Int8),
+            "NAME": [calendar.month_abbr[m] for m in SEASON_MONTHS],
+        }
+    )
+    return (
+        months.join(averages, on="MONTH", how="left", maintain_order="left")
+        .drop("MONTH")
+        .rename({"NAME": "MONTH"})
+    )
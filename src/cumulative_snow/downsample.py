@@ -0,0 +1,121 @@
+"""Downsampling of line traces to about as many points as there are pixels.
+
+Daily cumulative snow is mostly flat between snow days, so flat runs are
+reduced to their end points first, which doesn't change the drawn line at all.
+What's left is reduced with largest-triangle-three-buckets (LTTB), always
+keeping each trace's first, last and highest points so season-end totals and
+peaks are drawn exactly.
+"""
+
+import math
+
+import numpy as np
+import polars as pl
+
+# Matches the default width plot_to_html() writes figures at
+DEFAULT_WIDTH_PX = 1000
+# A line vertex every couple of pixels is indistinguishable from more
+PIXELS_PER_POINT = 2
+# Keeps the shape of traces that only cover a sliver of the x axis
+MIN_POINTS_PER_TRACE = 16
+
+
+def downsample_lines(
+    data: pl.DataFrame,
+    x: str,
+    y: str,
+    group: str,
+    width_px: int = DEFAULT_WIDTH_PX,
+) -> pl.DataFrame:
+    """Rows of data to draw for each group's line, sized for width_px.
+
+    Each group gets a share of the points proportional to how much of the
+    x axis it spans, so traces side by side and overlapping traces both end up
+    with about one point per PIXELS_PER_POINT pixels.
+    """
+    if data.is_empty():
+        return data
+    xs = _as_float(data[x])
+    ys = _as_float(data[y])
+    span = np.nanmax(xs) - np.nanmin(xs) or 1.0
+    points = width_px / PIXELS_PER_POINT
+
+    keep = []
+    for positions in group_positions(data[group].to_numpy()):
+        positions = positions[np.argsort(xs[positions], kind="stable")]
+        gx, gy = xs[positions], ys[positions]
+        n = max(
+            MIN_POINTS_PER_TRACE,
+            math.ceil(points * (gx[-1] - gx[0]) / span),
+        )
+        keep.append(positions[_downsample(gx, gy, n)])
+    if not keep:
+        return data
+    # The only rows copied out of data
+    return data[np.sort(np.concatenate(keep))]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Indices of n points picked by largest-triangle-three-buckets, always
+    including the first and last point. x must be sorted."""
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1])
+
+    # Interior points split into n - 2 buckets, one point picked from each
+    edges = np.linspace(1, size - 1, n - 1).astype(np.intp)
+    picked = np.empty(n, dtype=np.intp)
+    picked[0], picked[-1] = 0, size - 1
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        # The next bucket's average, or the last point for the last bucket
+        if i + 2 < len(edges):
+            next_x = x[end : edges[i + 2]].mean()
+            next_y = y[end : edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        prev_x, prev_y = x[picked[i]], y[picked[i]]
+        areas = np.abs(
+            (prev_x - next_x) * (y[start:end] - prev_y)
+            - (prev_x - x[start:end]) * (next_y - prev_y)
+        )
+        picked[i + 1] = start + int(np.argmax(areas))
+    return picked
+
+
+def _downsample(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the points to keep from one trace"""
+    corners = _corners(y)
+    if len(corners) > n:
+        corners = corners[lttb(x[corners], y[corners], n)]
+    if len(y) and not np.isnan(y).all():
+        corners = np.union1d(corners, [np.nanargmax(y), np.nanargmin(y)])
+    return corners
+
+
+def _corners(y: np.ndarray) -> np.ndarray:
+    """Indices of the points that aren't in the middle of a flat run"""
+    if len(y) <= 2:
+        return np.arange(len(y))
+    # NaN != NaN keeps gaps in the line where they are
+    middle = (y[1:-1] == y[:-2]) & (y[1:-1] == y[2:])
+    return np.flatnonzero(~np.concatenate([[False], middle, [False]]))
+
+
+def group_positions(groups: np.ndarray) -> list[np.ndarray]:
+    """Row positions of each group's rows, groups in sorted order"""
+    if len(groups) == 0:
+        return []
+    order = np.argsort(groups, kind="stable")
+    _, starts = np.unique(groups[order], return_index=True)
+    return np.split(order, starts[1:])
+
+
+def _as_float(values: pl.Series) -> np.ndarray:
+    """Dates and datetimes as their integer days or time units since the
+    epoch, as only distances along the axis matter"""
+    if values.dtype.is_temporal():
+        values = values.to_physical()
+    return values.to_numpy().astype(np.float64, copy=False)
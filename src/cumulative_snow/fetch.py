@@ -0,0 +1,321 @@
+"""Listing and downloading objects from the public NOAA GHCNd S3 bucket.
+
+Under CPython downloads run on a thread pool, with each thread keeping its
+HTTP connections open between requests. Under pyodide there are no threads or
+sockets, so the same requests are made concurrently with asyncio and the
+browser's fetch API.
+"""
+
+import asyncio
+import http.client
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator, Mapping, Optional, TypeVar
+from urllib.parse import urlencode, urlsplit
+
+from cumulative_snow import profiling
+
+logger = logging.getLogger(__name__)
+
+NOAA_BUCKET_URL = "https://noaa-ghcn-pds.s3.amazonaws.com"
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_ATTEMPTS = 4
+DEFAULT_BACKOFF_SECONDS = 0.25
+
+_S3_NS = {"s3": "http://s3.amazonaws.com/doc/2006-03-01/"}
+# Worth retrying, anything else is a real answer
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+T = TypeVar("T")
+
+
+class HttpError(OSError):
+    def __init__(self, url: str, status: int) -> None:
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+
+@dataclass
+class FetchResult:
+    # None means the server responded 304 Not Modified
+    body: Optional[bytes]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+# Called with the URL and any conditional request headers
+Fetcher = Callable[[str, Mapping[str, str]], FetchResult]
+
+
+@dataclass(frozen=True)
+class ObjectInfo:
+    key: str
+    etag: str
+    size: int
+
+
+@dataclass
+class Response:
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+
+def is_pyodide() -> bool:
+    return "pyodide" in sys.modules
+
+
+def default_fetcher() -> Fetcher:
+    # pyodide patches urllib to make synchronous browser requests, but
+    # http.client has no sockets to work with
+    return urllib_fetch if is_pyodide() else HttpClient().fetch
+
+
+def urllib_fetch(url: str, headers: Mapping[str, str]) -> FetchResult:
+    request = urllib.request.Request(url, headers=dict(headers))
+    try:
+        with urllib.request.urlopen(request) as response:
+            return FetchResult(
+                response.read(),
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return FetchResult(None)
+        raise
+
+
+class HttpClient:
+    """Minimal thread-safe HTTP GET client that reuses one connection per host
+    per thread and retries transient failures with exponential backoff"""
+
+    def __init__(
+        self,
+        attempts: int = DEFAULT_ATTEMPTS,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        timeout: float = 30.0,
+    ) -> None:
+        self.attempts = attempts
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self, url: str, headers: Optional[Mapping[str, str]] = None) -> Response:
+        return retry(
+            lambda: self._get_once(url, headers or {}),
+            self.attempts,
+            self.backoff_seconds,
+        )
+
+    def fetch(self, url: str, headers: Mapping[str, str]) -> FetchResult:
+        """Conditional GET for the StationCache"""
+        response = self.get(url, headers)
+        if response.status == 304:
+            return FetchResult(None)
+        if response.status != 200:
+            raise HttpError(url, response.status)
+        return FetchResult(
+            response.body,
+            response.headers.get("etag"),
+            response.headers.get("last-modified"),
+        )
+
+    def range_get(self, url: str, start: int, end: Optional[int]) -> tuple[bytes, int]:
+        """Bytes [start, end) of url and the total size of the object. A
+        negative start with no end reads from the end of the object."""
+        response = self.get(url, {"Range": range_header(start, end)})
+        if response.status not in (200, 206):
+            raise HttpError(url, response.status)
+        return slice_range_response(
+            response.status,
+            response.headers.get("content-range"),
+            response.body,
+            start,
+            end,
+        )
+
+    def _get_once(self, url: str, headers: Mapping[str, str]) -> Response:
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        conn = self._connection(parts.scheme, parts.netloc)
+        try:
+            conn.request("GET", path, headers=dict(headers))
+            response = conn.getresponse()
+            # Always read the body so the connection can be reused
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self._drop_connection(parts.scheme, parts.netloc)
+            raise
+        if response.status in _RETRY_STATUSES:
+            raise HttpError(url, response.status)
+        return Response(
+            response.status,
+            {k.lower(): v for k, v in response.getheaders()},
+            body,
+        )
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        conns: dict[tuple[str, str], http.client.HTTPConnection] = getattr(
+            self._local, "conns", {}
+        )
+        self._local.conns = conns
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str) -> None:
+        conn = getattr(self._local, "conns", {}).pop((scheme, netloc), None)
+        if conn:
+            conn.close()
+
+
+def retry(fn: Callable[[], T], attempts: int, backoff_seconds: float) -> T:
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except (OSError, http.client.HTTPException) as e:
+            if attempt == attempts - 1 or not _is_transient(e):
+                raise
+            delay = backoff_seconds * 2**attempt * random.uniform(0.5, 1.5)
+            logger.info("Retrying in %.2fs after %s", delay, e)
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def list_objects(
+    prefix: str,
+    bucket_url: str = NOAA_BUCKET_URL,
+    client: Optional[HttpClient] = None,
+) -> Iterator[ObjectInfo]:
+    """Every object with the prefix, following all ListObjectsV2 pages"""
+    client = client or HttpClient()
+    token = None
+    while True:
+        url = _list_url(bucket_url, prefix, token)
+        with profiling.span("list_objects") as span:
+            response = client.get(url)
+            if response.status != 200:
+                raise HttpError(url, response.status)
+            objects, token = _parse_list_page(response.body)
+            span.rows, span.bytes = len(objects), len(response.body)
+        yield from objects
+        if not token:
+            return
+
+
+async def list_objects_async(
+    prefix: str, bucket_url: str = NOAA_BUCKET_URL
+) -> AsyncIterator[ObjectInfo]:
+    """list_objects() for pyodide"""
+    token = None
+    while True:
+        objects, token = _parse_list_page(
+            await _pyfetch_bytes(_list_url(bucket_url, prefix, token))
+        )
+        for obj in objects:
+            yield obj
+        if not token:
+            return
+
+
+async def pyfetch(url: str, headers: Mapping[str, str]) -> FetchResult:
+    """The async counterpart of HttpClient.fetch() using the browser's fetch"""
+    from pyodide.http import pyfetch as _pyfetch  # pyright: ignore[reportMissingImports]
+
+    async def once() -> FetchResult:
+        response = await _pyfetch(url, headers=dict(headers))
+        if response.status == 304:
+            return FetchResult(None)
+        if response.status != 200:
+            raise HttpError(url, response.status)
+        return FetchResult(
+            await response.bytes(),
+            response.headers.get("etag"),
+            response.headers.get("last-modified"),
+        )
+
+    for attempt in range(DEFAULT_ATTEMPTS):
+        try:
+            return await once()
+        except OSError as e:
+            if attempt == DEFAULT_ATTEMPTS - 1 or not _is_transient(e):
+                raise
+            await asyncio.sleep(DEFAULT_BACKOFF_SECONDS * 2**attempt)
+    raise AssertionError("unreachable")
+
+
+def range_header(start: int, end: Optional[int]) -> str:
+    if start < 0:
+        return f"bytes={start}"
+    return f"bytes={start}-{'' if end is None else end - 1}"
+
+
+def slice_range_response(
+    status: int,
+    content_range: Optional[str],
+    body: bytes,
+    start: int,
+    end: Optional[int],
+) -> tuple[bytes, int]:
+    """Handles servers that ignore the Range header and send the whole file"""
+    if status == 206 and content_range:
+        match = _CONTENT_RANGE.fullmatch(content_range.strip())
+        if match:
+            return body, int(match.group(3))
+    size = len(body)
+    if start < 0:
+        return body[start:], size
+    return body[start:end], size
+
+
+def _list_url(bucket_url: str, prefix: str, token: Optional[str]) -> str:
+    params = {"list-type": "2", "prefix": prefix}
+    if token:
+        params["continuation-token"] = token
+    return f"{bucket_url}/?{urlencode(params)}"
+
+
+def _parse_list_page(body: bytes) -> tuple[list[ObjectInfo], Optional[str]]:
+    root = ET.fromstring(body)
+    objects = [
+        ObjectInfo(
+            contents.findtext("s3:Key", "", _S3_NS),
+            contents.findtext("s3:ETag", "", _S3_NS),
+            int(contents.findtext("s3:Size", "0", _S3_NS)),
+        )
+        for contents in root.iterfind("s3:Contents", _S3_NS)
+    ]
+    truncated = root.findtext("s3:IsTruncated", "false", _S3_NS) == "true"
+    token = root.findtext("s3:NextContinuationToken", None, _S3_NS)
+    return objects, token if truncated else None
+
+
+async def _pyfetch_bytes(url: str) -> bytes:
+    result = await pyfetch(url, {})
+    assert result.body is not None
+    return result.body
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, HttpError):
+        return e.status in _RETRY_STATUSES
+    return True
@@ -1,12 +1,16 @@
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable
 
-import matplotlib.pyplot as pl
 import numpy as np
 import pandas as pd
 
+if TYPE_CHECKING:
+    # Axes are passed in, so matplotlib, which isn't a dependency, is only
+    # needed by callers that already have it
+    import matplotlib.pyplot as pl
+
 
 def label_all(
-    ax: pl.Axes,
+    ax: "pl.Axes",
     fontsize: int = None,
     xoffset: float = -0.01,
     yoffset: float = 0.03,
@@ -1,47 +1,295 @@
-import pandas as pd
+import os
+import sys
+from datetime import date
+from typing import TYPE_CHECKING, Iterator, Optional, Union
 
+import polars as pl
+import pyarrow as pa
 
-def load_noaa_data(data: pd.DataFrame) -> pd.DataFrame:
-    """Loads NOAA data from file path.
+from cumulative_snow import profiling
+from cumulative_snow.args import Args
 
-    Output dataframe has columns:
-    - WINTER_YEAR = The year the winter started in
-    - STATION = Station number?
+if TYPE_CHECKING:
+    # Only imported by the functions returning pandas frames, as it's slow to
+    # import and neither the notebook nor the plots need it
+    import pandas as pd
+
+FrameLike = Union["pd.DataFrame", pl.DataFrame, pl.LazyFrame, pa.Table]
+
+# Winter seasons run from July 1st through June 30th and are named after the
+# year they start in e.g. winter of 2009 is July 2009 through June 2010
+WINTER_START_MONTH = 7
+# DAY_OF_SEASON counts days from the start of this winter, which includes a
+# Feb 29th, so each calendar day has the same DAY_OF_SEASON every winter
+NORMALIZED_SEASON_START = date(1999, WINTER_START_MONTH, 1)
+_SEASON_DAY_OFFSETS = {
+    month: (
+        date(1999 + (month < WINTER_START_MONTH), month, 1) - NORMALIZED_SEASON_START
+    ).days
+    for month in range(1, 13)
+}
+
+# Columns that identify a station, in order of preference. CSV exports from
+# NCEI use STATION while the S3 parquet files use ID.
+STATION_COLUMNS = ("STATION", "ID")
+
+# Columns read from NCEI CSV exports. Missing snow measurements are treated as
+# zero, missing temperatures are left null.
+CSV_ZERO_FILLED_COLUMNS = ("SNOW", "SNWD", "WESD", "WESF")
+CSV_COLUMN_TYPES = {
+    "STATION": pa.string(),
+    "NAME": pa.string(),
+    "DATE": pa.date32(),
+    **{col: pa.float64() for col in CSV_ZERO_FILLED_COLUMNS},
+    "TAVG": pa.float64(),
+    "TMAX": pa.float64(),
+    "TMIN": pa.float64(),
+}
+
+# Bytes of CSV parsed per chunk. Peak memory is a small multiple of this no
+# matter how large the file is.
+CSV_BLOCK_SIZE = 16 << 20
+
+
+def load_noaa_data(data: FrameLike) -> pl.DataFrame:
+    """Loads NOAA data from a pandas, polars or Arrow frame. Polars and Arrow
+    input is only materialized once, as the frame the plots read directly.
+
+    Output dataframe has the input's columns, sorted by STATION (or ID) and
+    DATE with DATE parsed to pl.Date, plus:
+    - WINTER_YEAR = The year the winter started in (Int32)
+    - DAY_OF_SEASON = Days since Jul 1st, 0 through 365 (Int16)
+    - WINTER_SEASON_START = Jun 30th of WINTER_YEAR
+    - CUMULATIVE_SNOW = Snowfall (inches) so far that winter, unless the
+      input already has it
+
+    Usually the input has these NCEI columns:
+    - STATION = Station ID, or ID for raw GHCNd data
     - NAME = Station name
     - SNOW = Snowfall (inches)
     - SNWD = Snow depth (inches)
     - WESD = Water equivalent of snow on the ground (inches)
     - WESF = Water equivalent of snowfall (inches)
+    - TAVG, TMAX, TMIN = Temperatures (degrees F)
 
     Additional dataset documentation: https://bit.ly/2Rs3Xyb
     """
-    # data = pd.read_csv(
-    #     args.csv_path,
-    #     converters={
-    #         "SNOW": _fill_zeroes,
-    #         "SNWD": _fill_zeroes,
-    #         "WESD": _fill_zeroes,
-    #         "WESF": _fill_zeroes,
-    #     },
-    #     parse_dates=["DATE"],
-    # )
-
-    # Assigns year periods as being from July to the end of June e.g. winter of
-    # 2010 is July 2009 through June 2019
-    offset = pd.tseries.offsets.YearEnd(month=6)
-    data["WINTER_SEASON_START"] = data["DATE"] - offset
-
-    # Pretty printable year the winter started in
-    data["WINTER_YEAR"] = pd.Categorical((data["DATE"] - offset).dt.year, ordered=True)
-
-    # Cumulative snow for the year
-    data["CUMULATIVE_SNOW"] = data.groupby("WINTER_YEAR")["SNOW"].cumsum()
-
-    return data
-
-
-def _fill_zeroes(s: str) -> float:
-    if s == "":
-        return 0.0
-    else:
-        return float(s)
+    with profiling.span("load_noaa_data") as span:
+        df = load_noaa_frame(data)
+        span.rows = len(df)
+    return df
+
+
+def load_noaa_csv(args: Args) -> pl.DataFrame:
+    """Streams the CSV at args.csv_path, keeping only rows matching the
+    --station, --start_year and --end_year filters"""
+    with profiling.span("read_csv") as span:
+        chunks = list(
+            iter_noaa_csv(
+                args.csv_path,
+                station=args.station,
+                start_year=args.start_year.year if args.start_year else None,
+                end_year=args.end_year.year if args.end_year else None,
+            )
+        )
+        if not chunks:
+            raise ValueError(f"No matching rows in {args.csv_path}")
+        # Contiguous, so the plots get NumPy views of its columns
+        df = pl.concat(chunks, rechunk=True)
+        span.rows = len(df)
+        span.bytes = os.path.getsize(args.csv_path)
+    return df
+
+
+def iter_noaa_csv(
+    path: str,
+    station: Optional[str] = None,
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+    block_size: int = CSV_BLOCK_SIZE,
+) -> Iterator[pl.DataFrame]:
+    """Reads an NCEI daily CSV export in chunks, yielding the same columns as
+    load_noaa_frame() for each chunk.
+
+    Rows are expected to be grouped by station, as NCEI exports are, and
+    stations keep the order they're in in the file, each sorted by date.
+    Cumulative snow carries over between chunks so concatenating the
+    chunks gives the same result as loading the whole file at once. Filters
+    apply to each chunk as it is read.
+    """
+    import pyarrow.csv as pv
+
+    reader = pv.open_csv(
+        path,
+        read_options=pv.ReadOptions(block_size=block_size),
+        convert_options=pv.ConvertOptions(
+            column_types=CSV_COLUMN_TYPES,
+            include_columns=list(CSV_COLUMN_TYPES),
+            include_missing_columns=True,
+        ),
+    )
+    keys = ["STATION", "WINTER_YEAR"]
+    # Running total for the latest winter seen for each station
+    carry = pl.DataFrame(
+        schema={"STATION": pl.String, "WINTER_YEAR": pl.Int32, "CARRY": pl.Float64}
+    )
+
+    for batch in reader:
+        chunk = pl.DataFrame(pa.Table.from_batches([batch])).lazy()
+        if station:
+            chunk = chunk.filter(pl.col("STATION") == station)
+        chunk = add_winter_columns(
+            chunk.with_columns(pl.col(CSV_ZERO_FILLED_COLUMNS).fill_null(0.0)),
+            keep_station_order=True,
+        )
+        if start_year is not None:
+            chunk = chunk.filter(pl.col("WINTER_YEAR") >= start_year)
+        if end_year is not None:
+            chunk = chunk.filter(pl.col("WINTER_YEAR") <= end_year)
+
+        df = (
+            chunk.join(carry.lazy(), on=keys, how="left")
+            .with_columns(pl.col("CUMULATIVE_SNOW") + pl.col("CARRY").fill_null(0.0))
+            .drop("CARRY")
+            .collect()
+        )
+        if df.is_empty():
+            continue
+
+        latest = df.group_by("STATION").agg(
+            pl.col("WINTER_YEAR").last(),
+            pl.col("CUMULATIVE_SNOW").last().alias("CARRY"),
+        )
+        carry = pl.concat([carry.join(latest, on="STATION", how="anti"), latest])
+        yield df
+
+
+def count_csv_stations(path: str) -> "pd.DataFrame":
+    """Number of datapoints for each station in the CSV, most first"""
+    counts = [
+        chunk.group_by("STATION", "NAME").len("Number of Datapoints")
+        for chunk in iter_noaa_csv(path)
+    ]
+    return (
+        pl.concat(counts)
+        .group_by("STATION", "NAME")
+        .agg(pl.col("Number of Datapoints").sum())
+        .sort("Number of Datapoints", descending=True)
+        .to_pandas()
+        .set_index(["STATION", "NAME"])
+    )
+
+
+def load_noaa_frame(data: FrameLike) -> pl.DataFrame:
+    """Eager polars version of load_noaa_data()"""
+    return add_winter_columns(to_lazy(data)).collect()
+
+
+def to_lazy(data: FrameLike) -> pl.LazyFrame:
+    """Wraps any supported frame type in a polars LazyFrame without copying
+    where possible"""
+    if isinstance(data, pl.LazyFrame):
+        return data
+    if isinstance(data, pl.DataFrame):
+        return data.lazy()
+    if isinstance(data, pa.Table):
+        return pl.DataFrame(data).lazy()
+    # Anything given a pandas frame has already imported pandas
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(data, pd.DataFrame):
+        return pl.from_pandas(data).lazy()
+    raise TypeError(f"Can't load NOAA data from {type(data)}")
+
+
+def station_column(schema: pl.Schema) -> Optional[str]:
+    """The column identifying the station, or None for single station data"""
+    for col in STATION_COLUMNS:
+        if col in schema:
+            return col
+    return None
+
+
+def add_winter_columns(
+    frame: pl.LazyFrame, keep_station_order: bool = False
+) -> pl.LazyFrame:
+    """Adds WINTER_SEASON_START, WINTER_YEAR, DAY_OF_SEASON and CUMULATIVE_SNOW
+    columns, sorting by station and DATE. With keep_station_order, stations
+    stay in the order they first appear and only their rows are sorted.
+
+    Everything is computed from the integer year and month of each DATE, and
+    cumulative snow is summed per (station, winter) so multiple stations can
+    be processed at once. A CUMULATIVE_SNOW column that's already there, like
+    the one the DailyStore keeps up to date, is used as is.
+    """
+    schema = frame.collect_schema()
+    station = station_column(schema)
+    sort_keys = [station, "DATE"] if station else ["DATE"]
+    group_keys = [station, "WINTER_YEAR"] if station else ["WINTER_YEAR"]
+
+    if station and keep_station_order:
+        # The row each station first appears at, in place of its ID
+        frame = frame.with_row_index("_ROW").with_columns(
+            pl.col("_ROW").min().over(station)
+        )
+        sort_keys = ["_ROW", "DATE"]
+    frame = (
+        frame.with_columns(_date_expr(schema["DATE"]))
+        .sort(sort_keys)
+        .with_columns(winter_year_expr(), day_of_season_expr())
+        .with_columns(
+            # The day before the season starts, matching the old
+            # pd.tseries.offsets.YearEnd(month=6) based calculation
+            WINTER_SEASON_START=pl.date(
+                pl.col("WINTER_YEAR"), WINTER_START_MONTH - 1, 30
+            ),
+        )
+    )
+    if "_ROW" in sort_keys:
+        frame = frame.drop("_ROW")
+    if "CUMULATIVE_SNOW" not in schema:
+        # Cumulative snow for the year
+        frame = frame.with_columns(
+            CUMULATIVE_SNOW=pl.col("SNOW").cum_sum().over(group_keys)
+        )
+    return frame
+
+
+def winter_year_expr(column: str = "DATE") -> pl.Expr:
+    """The year the winter containing each date started in"""
+    date = pl.col(column)
+    return (
+        date.dt.year().cast(pl.Int32)
+        - (date.dt.month() < WINTER_START_MONTH).cast(pl.Int32)
+    ).alias("WINTER_YEAR")
+
+
+def day_of_season_expr(column: str = "DATE") -> pl.Expr:
+    """Days since the start of the winter, 0 for Jul 1st through 365 for
+    Jun 30th. Mar 1st is 244 whether or not the winter has a Feb 29th."""
+    date = pl.col(column)
+    return (
+        date.dt.month().replace_strict(_SEASON_DAY_OFFSETS, return_dtype=pl.Int16)
+        + date.dt.day().cast(pl.Int16)
+        - 1
+    ).alias("DAY_OF_SEASON")
+
+
+def to_pandas(frame: pl.DataFrame) -> "pd.DataFrame":
+    """Converts a frame with winter columns to pandas, with WINTER_YEAR as an
+    ordered categorical"""
+    import pandas as pd
+
+    df = frame.to_pandas()
+    df["WINTER_YEAR"] = pd.Categorical(df["WINTER_YEAR"], ordered=True)
+    return df
+
+
+def _date_expr(dtype: pl.DataType) -> pl.Expr:
+    date = pl.col("DATE")
+    if dtype == pl.String:
+        # Raw GHCN files use YYYYMMDD, NCEI CSV exports use YYYY-MM-DD
+        stripped = date.str.replace_all("-", "", literal=True)
+        return stripped.str.to_date("%Y%m%d")
+    if dtype == pl.Date:
+        return date
+    return date.cast(pl.Date)
@@ -1,24 +1,58 @@
 #!/usr/bin/env python
 
-from cumulative_snow import load_data, plot
-from cumulative_snow.args import parse_args
+import sys
+from typing import TYPE_CHECKING
+
+from cumulative_snow import profiling
+from cumulative_snow.args import Args, parse_args
+
+if TYPE_CHECKING:
+    from cumulative_snow.batch import StationReport
+
+# Each command imports only what it uses, so e.g. --list_stations doesn't wait
+# for plotly to import
 
 
 def main() -> None:
     args = parse_args()
+    profiler = profiling.enable() if args.profile else None
+    reports: list[StationReport] = []
+    try:
+        reports = _run(args)
+    finally:
+        if profiler:
+            # Batch reports are written in other processes with their own spans
+            stations = {r.station: r.spans for r in reports if r.spans}
+            profiler.write_json(
+                sys.stderr, **({"stations": stations} if stations else {})
+            )
+
+    if any(not r.ok for r in reports):
+        sys.exit(1)
+
+
+def _run(args: Args) -> list["StationReport"]:
     if args.list_stations:
-        data = load_data.load_noaa_data(args)
-        print(
-            data[["STATION", "NAME", "SNOW"]]
-            .groupby(["STATION", "NAME"])
-            .count()
-            .sort_values(by="SNOW", ascending=False)
-            .rename({"SNOW": "Number of Datapoints"}, axis="columns")
-        )
-        return
+        from cumulative_snow import load_data
+
+        print(load_data.count_csv_stations(args.csv_path))
+        return []
+
+    if args.output_dir:
+        from cumulative_snow import batch
+
+        reports = batch.write_reports_from_args(args)
+        failed = [r.station for r in reports if not r.ok]
+        print(f"Wrote {len(reports) - len(failed)} of {len(reports)} reports")
+        if failed:
+            print(f"Failed: {', '.join(failed)}")
+        return reports
 
     if not args.output_path:
-        print("Use either --list_stations or set --output_path.")
-        return
+        print("Use either --list_stations or set --output_path or --output_dir.")
+        return []
+
+    from cumulative_snow import plot
 
     plot.plot_to_html(args)
+    return []
@@ -1,209 +1,462 @@
 from textwrap import dedent
+from typing import Optional, Sequence, TextIO
 
-import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import polars as pl
+from plotly.subplots import make_subplots
 
-from cumulative_snow import load_data
+from cumulative_snow import (
+    binning,
+    climatology,
+    downsample,
+    load_data,
+    profiling,
+    seasons,
+)
 from cumulative_snow.args import Args
 
+_SNOW_LABEL = "Snowfall (inches)"
+_WINTER_DATE_LABEL = "Date in Winter Season"
+
+# Names of the figures in a report, in the order they're shown
+FIGURES = ("continuous", "overlapping", "scatter", "heatmap", "violin", "monthly")
+
 
 def plot_to_html(args: Args) -> None:
     if not args.output_path:
         return
 
-    data = load_data.load_noaa_data(args)
+    data = load_data.load_noaa_csv(args)
+    write_report(data, args.output_path, args.save_svgs)
+
 
-    bool_mask = pd.Series(True, data.index)
-    if args.start_year:
-        bool_mask &= data["WINTER_YEAR"] >= args.start_year.year
-    if args.end_year:
-        bool_mask &= data["WINTER_YEAR"] <= args.end_year.year
-    data = data[bool_mask]
+def write_report(data: pl.DataFrame, output_path: str, save_svgs: bool = False) -> None:
+    """Writes every figure for one station's data to an HTML page"""
+    location_name = data["NAME"][0]
+    location_id = data["STATION"][0]
+    page_title = f"Cumulative Snow per Winter Season at {location_name} ({location_id})"
+
+    with open(output_path, "w") as f:
+        write_html(
+            f,
+            list(build_figures(data).values()),
+            page_title,
+            svg_prefix=output_path if save_svgs else None,
+        )
 
+
+def build_figures(
+    data: pl.DataFrame,
+    cube: Optional[load_data.FrameLike] = None,
+    packed: bool = False,
+    bands: bool = False,
+) -> dict[str, go.Figure]:
+    """Every figure of a report by name, see FIGURES"""
     figs = [
-        plot_continuous(data),
-        *plot_overlapping(data),
-        plot_monthly_averages(data),
+        plot_continuous(data, packed=packed),
+        *plot_overlapping(data, packed=packed, bands=bands),
+        plot_monthly_averages(data, cube),
     ]
+    return dict(zip(FIGURES, figs))
 
-    first_idx = data.first_valid_index()
-    location_name = data["NAME"][first_idx]
-    location_id = data["STATION"][first_idx]
-    page_title = f"Cumulative Snow per Winter Season at {location_name} ({location_id})"
 
-    with open(args.output_path, "w") as f:
-        f.write(
-            dedent(f"""\
-            <html>
-                <head>
-                    <title>{page_title}</title>
-                    <style>
-
-                    h1 {{
-                        text-align: center;
-                    }}
-
-                    #graphs {{
-                        display: flex;
-                        margin: auto;
-                        flex-wrap: wrap;
-                        justify-content: center;
-                    }}
-
-                    </style>
-                </head>
-                <body>
-                    <h1>{page_title}</h1>
-                    <div id="graphs">
-            """)
-        )
-        for i, fig in enumerate(figs):
-            # Include the JS engine only once to keep the file small
-            include_js = "cdn" if i == 0 else False
+def write_html(
+    f: TextIO, figs: list[go.Figure], title: str, svg_prefix: Optional[str] = None
+) -> None:
+    """Writes the figures as an HTML page to f, and each to
+    <svg_prefix>.<i>.svg when given"""
+    f.write(
+        dedent(f"""\
+        <html>
+            <head>
+                <title>{title}</title>
+                <style>
+
+                h1 {{
+                    text-align: center;
+                }}
+
+                #graphs {{
+                    display: flex;
+                    margin: auto;
+                    flex-wrap: wrap;
+                    justify-content: center;
+                }}
+
+                </style>
+            </head>
+            <body>
+                <h1>{title}</h1>
+                <div id="graphs">
+        """)
+    )
+    for i, fig in enumerate(figs):
+        # Include the JS engine only once to keep the file small
+        include_js = "cdn" if i == 0 else False
+        with profiling.span("write_html") as span:
+            start = f.tell()
             fig.write_html(
                 f,
                 default_height=800,
-                default_width=1000,
+                default_width=downsample.DEFAULT_WIDTH_PX,
                 full_html=False,
                 include_plotlyjs=include_js,
             )
-            if args.save_svgs:
+            span.bytes = f.tell() - start
+        if svg_prefix:
+            with profiling.span("write_svg"):
                 fig.write_image(
-                    f"{args.output_path}.{i}.svg", format="svg", height=600, width=1000
+                    f"{svg_prefix}.{i}.svg",
+                    format="svg",
+                    height=600,
+                    width=downsample.DEFAULT_WIDTH_PX,
                 )
 
-        f.write(
-            dedent("""\
-                    </div>
-                </body>
-            </html>
-            """)
-        )
+    f.write(
+        dedent("""\
+                </div>
+            </body>
+        </html>
+        """)
+    )
 
 
-def plot_continuous(data: pd.DataFrame) -> go.Figure:
+@profiling.timed()
+def plot_continuous(
+    data: pl.DataFrame,
+    width_px: int = downsample.DEFAULT_WIDTH_PX,
+    packed: bool = False,
+) -> go.Figure:
+    """Each winter's cumulative snow over time. packed draws all the winters
+    in a few WebGL traces instead of one trace per winter."""
+    lines = downsample.downsample_lines(
+        data, "DATE", "CUMULATIVE_SNOW", "WINTER_YEAR", width_px
+    )
+    title = "Cumulative Snow per Winter Season"
+    if packed:
+        return _packed_figure(
+            packed_lines(
+                lines["DATE"].to_numpy(),
+                lines["CUMULATIVE_SNOW"].to_numpy(),
+                lines["WINTER_YEAR"].to_numpy(),
+            ),
+            title,
+            "Date",
+        )
     return px.line(
-        data,
+        lines,
         x="DATE",
         y="CUMULATIVE_SNOW",
         color="WINTER_YEAR",
-        title="Cumulative Snow per Winter Season",
-        labels={"CUMULATIVE_SNOW": "Snowfall (inches)", "DATE": "Date"},
+        title=title,
+        labels={"CUMULATIVE_SNOW": _SNOW_LABEL, "DATE": "Date"},
     )
 
 
+@profiling.timed()
 def plot_overlapping(
-    data: pd.DataFrame,
+    data: pl.DataFrame,
+    width_px: int = downsample.DEFAULT_WIDTH_PX,
+    sample_points: int = binning.DEFAULT_SAMPLE_POINTS,
+    packed: bool = False,
+    bands: bool = False,
 ) -> tuple[go.Figure, go.Figure, go.Figure, go.Figure]:
-    data = data.copy()
-
-    # Normalize to the 1999-2000 winter year. Note 2000 includes the leap day.
-    data["NORMALIZED_WINTER_DATE"] = pd.to_datetime(
-        pd.DataFrame(
-            {
-                "year": (
-                    data["DATE"].dt.year - data["WINTER_SEASON_START"].dt.year + 1999
-                ),
-                "month": data["DATE"].dt.month,
-                "day": data["DATE"].dt.day,
-            }
+    """The winters overlapped on one season, and figures of every snow day.
+    packed draws the overlapped winters like plot_continuous(), and bands
+    draws the 10th to 90th percentile and median winter under them."""
+    lines = downsample.downsample_lines(
+        data, "DAY_OF_SEASON", "CUMULATIVE_SNOW", "WINTER_YEAR", width_px
+    )
+    # Only the points drawn are turned into dates
+    season_dates = _season_dates(lines["DAY_OF_SEASON"].to_numpy())
+    title = "Cumulative Snow per Winter Season (Overlapping Years)"
+    if packed:
+        fig_overlapping = _packed_figure(
+            packed_lines(
+                season_dates,
+                lines["CUMULATIVE_SNOW"].to_numpy(),
+                lines["WINTER_YEAR"].to_numpy(),
+            ),
+            title,
+            _WINTER_DATE_LABEL,
+        )
+    else:
+        fig_overlapping = px.line(
+            lines.with_columns(NORMALIZED_WINTER_DATE=pl.Series(season_dates)),
+            x="NORMALIZED_WINTER_DATE",
+            y="CUMULATIVE_SNOW",
+            color="WINTER_YEAR",
+            title=title,
+            labels={
+                "CUMULATIVE_SNOW": _SNOW_LABEL,
+                "NORMALIZED_WINTER_DATE": _WINTER_DATE_LABEL,
+            },
+        )
+    if bands:
+        # Drawn first so the winters are on top
+        fig_overlapping = go.Figure(
+            [
+                *_percentile_bands(seasons.SeasonMatrix.from_frame(data)),
+                *fig_overlapping.data,
+            ],
+            fig_overlapping.layout,
         )
+    fig_overlapping.update_xaxes(tickformat="%b %d")
+
+    data_days_with_snow = data.filter(pl.col("SNOW") > 0)
+    # Built from bins computed here, with at most sample_points raw points, so
+    # the figures don't grow with the length of the record
+    sampled = binning.sample(data_days_with_snow, sample_points)
+    fig_scatter = _scatter_with_marginals(data_days_with_snow, sampled)
+    fig_heatmap = _snow_heatmap(data_days_with_snow)
+    fig_violin = _snow_violins(data_days_with_snow, sampled)
+
+    return fig_overlapping, fig_scatter, fig_heatmap, fig_violin
+
+
+_MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def packed_lines(
+    x: np.ndarray,
+    y: np.ndarray,
+    winters: np.ndarray,
+    colors: Sequence[str] = px.colors.qualitative.Plotly,
+) -> list[go.Scattergl]:
+    """One line per winter, packed into a WebGL trace per color.
+
+    Winters are colored in order, cycling through colors like px.line() does,
+    and the winters sharing a color are one trace with a NaN between each
+    winter's points, which breaks the line. So the browser draws as many
+    traces as there are colors however many winters there are. Each point's
+    winter is its customdata, shown on hover.
+    """
+    positions = downsample.group_positions(winters)
+    traces = []
+    for i, color in enumerate(colors[: len(positions)]):
+        segments = positions[i :: len(colors)]
+        # -1 after each winter marks the breaks
+        index = np.concatenate([np.append(p, -1) for p in segments], dtype=np.intp)[:-1]
+        breaks = index < 0
+        trace_y = y[index].astype(np.float64)
+        trace_y[breaks] = np.nan
+        # The same x as the point before so a break doesn't stretch the axis
+        index[breaks] = index[np.flatnonzero(breaks) - 1]
+        traces.append(
+            go.Scattergl(
+                x=x[index],
+                y=trace_y,
+                customdata=winters[index],
+                mode="lines",
+                line_color=color,
+                name=", ".join(str(winters[p[0]]) for p in segments),
+                hovertemplate="Winter %{customdata}<br>%{x}<br>%{y}<extra></extra>",
+                showlegend=False,
+            )
+        )
+    return traces
+
+
+def _percentile_bands(matrix: seasons.SeasonMatrix) -> tuple[go.Scatter, ...]:
+    low, median, high = matrix.percentiles((10, 50, 90))
+    dates = _season_dates(np.arange(seasons.DAYS_IN_SEASON))
+    band = {"mode": "lines", "line_color": "rgba(128, 128, 128, 0.3)"}
+    return (
+        go.Scatter(x=dates, y=low, name="10th percentile", showlegend=False, **band),
+        go.Scatter(
+            x=dates,
+            y=high,
+            name="10th to 90th percentile",
+            fill="tonexty",
+            fillcolor="rgba(128, 128, 128, 0.2)",
+            **band,
+        ),
+        go.Scatter(
+            x=dates,
+            y=median,
+            mode="lines",
+            line={"color": "gray", "dash": "dash"},
+            name="Median",
+        ),
     )
 
-    fig_overlapping = px.line(
-        data,
-        x="NORMALIZED_WINTER_DATE",
-        y="CUMULATIVE_SNOW",
-        color="WINTER_YEAR",
-        title="Cumulative Snow per Winter Season (Overlapping Years)",
-        labels={
-            "CUMULATIVE_SNOW": "Snowfall (inches)",
-            "NORMALIZED_WINTER_DATE": "Date in Winter Season",
-        },
-    ).update_xaxes(tickformat="%b %d")
-
-    data_days_with_snow = data[data["SNOW"] > 0]
-    fig_scatter = px.scatter(
-        data_days_with_snow,
-        x="NORMALIZED_WINTER_DATE",
-        y="SNOW",
-        marginal_x="histogram",
-        marginal_y="histogram",
-        title="Scatter all Snow Days in all Years",
-        labels={
-            "SNOW": "Snowfall (inches)",
-            "NORMALIZED_WINTER_DATE": "Date in Winter Season",
-        },
-    ).update_xaxes(tickformat="%b %d")
-
-    fig_heatmap = px.density_heatmap(
-        data_days_with_snow,
-        x="NORMALIZED_WINTER_DATE",
-        y="SNOW",
-        text_auto=True,
-        nbinsx=30,
-        nbinsy=30,
-        color_continuous_scale="Blues",
-        title="Heatmap of Snow",
-        labels={
-            "SNOW": "Snowfall (inches)",
-            "NORMALIZED_WINTER_DATE": "Date in Winter Season",
-        },
-    ).update_xaxes(tickformat="%b %d")
 
-    fig_violin = px.violin(
-        data_days_with_snow,
-        x="WINTER_YEAR",
-        y="SNOW",
-        points="all",
-        color="WINTER_YEAR",
-        title="Distribution of Snowfall events per Year",
-        labels={
-            "SNOW": "Snowfall (inches)",
-            "WINTER_YEAR": "Winter Year",
-        },
+def _packed_figure(traces: list[go.Scattergl], title: str, x_label: str) -> go.Figure:
+    return go.Figure(traces).update_layout(
+        title=title, xaxis_title=x_label, yaxis_title=_SNOW_LABEL
     )
 
-    return fig_overlapping, fig_scatter, fig_heatmap, fig_violin
 
+def _season_dates(days: np.ndarray) -> np.ndarray:
+    """DAY_OF_SEASON values, which may be fractional, as datetimes in the
+    normalized winter so date axes label them by month and day"""
+    start = np.datetime64(load_data.NORMALIZED_SEASON_START, "ms")
+    offsets = np.round(np.asarray(days, dtype=np.float64) * _MS_PER_DAY)
+    return start + offsets.astype("timedelta64[ms]")
 
-def plot_monthly_averages(data: pd.DataFrame) -> go.Figure:
-    month_order = [
-        "Jul",
-        "Aug",
-        "Sep",
-        "Oct",
-        "Nov",
-        "Dec",
-        "Jan",
-        "Feb",
-        "Mar",
-        "Apr",
-        "May",
-        "Jun",
-    ]
 
-    # 1. Sum daily data into specific month-year buckets
-    # (e.g., Total snow in Jan 2020, Total snow in Jan 2021...)
-    monthly_summaries = (
-        data.groupby(
-            [
-                data["DATE"].dt.year.rename("YEAR"),
-                data["DATE"].dt.strftime("%b").rename("MONTH"),
-            ]
+def _scatter_with_marginals(data: pl.DataFrame, sampled: pl.DataFrame) -> go.Figure:
+    dates = binning.histogram(data["DAY_OF_SEASON"].to_numpy())
+    snow = binning.histogram(data["SNOW"].to_numpy())
+
+    fig = make_subplots(
+        rows=2,
+        cols=2,
+        shared_xaxes=True,
+        shared_yaxes=True,
+        column_widths=[0.8, 0.2],
+        row_heights=[0.2, 0.8],
+        horizontal_spacing=0.01,
+        vertical_spacing=0.01,
+    )
+    fig.add_trace(
+        go.Scattergl(
+            x=_season_dates(sampled["DAY_OF_SEASON"].to_numpy()),
+            y=sampled["SNOW"].to_numpy(),
+            mode="markers",
+            name="Snow days",
+        ),
+        row=2,
+        col=1,
+    )
+    fig.add_trace(
+        go.Bar(
+            x=_season_dates(dates.centers),
+            y=dates.counts,
+            # Milliseconds on a date axis
+            width=np.diff(dates.edges) * _MS_PER_DAY,
+            name="Days",
+        ),
+        row=1,
+        col=1,
+    )
+    fig.add_trace(
+        go.Bar(
+            x=snow.counts,
+            y=snow.centers,
+            width=np.diff(snow.edges),
+            orientation="h",
+            name="Days",
+        ),
+        row=2,
+        col=2,
+    )
+    fig.update_traces(marker_color=px.colors.qualitative.Plotly[0])
+    fig.update_layout(
+        title="Scatter all Snow Days in all Years", showlegend=False, bargap=0
+    )
+    fig.update_xaxes(title=_WINTER_DATE_LABEL, tickformat="%b %d", row=2, col=1)
+    fig.update_yaxes(title=_SNOW_LABEL, row=2, col=1)
+    return fig
+
+
+def _snow_heatmap(data: pl.DataFrame) -> go.Figure:
+    hist = binning.histogram2d(
+        data["DAY_OF_SEASON"].to_numpy(),
+        data["SNOW"].to_numpy(),
+    )
+    x_centers = hist.x_edges[:-1] + np.diff(hist.x_edges) / 2
+    y_centers = hist.y_edges[:-1] + np.diff(hist.y_edges) / 2
+    fig = go.Figure(
+        go.Heatmap(
+            x=_season_dates(x_centers),
+            y=y_centers,
+            z=hist.counts,
+            texttemplate="%{z}",
+            colorscale="Blues",
+            colorbar_title="count",
+        )
+    )
+    fig.update_layout(
+        title="Heatmap of Snow",
+        xaxis_title=_WINTER_DATE_LABEL,
+        yaxis_title=_SNOW_LABEL,
+    )
+    return fig.update_xaxes(tickformat="%b %d")
+
+
+def _snow_violins(data: pl.DataFrame, sampled: pl.DataFrame) -> go.Figure:
+    """One violin per winter year from its precomputed KDE and quartiles"""
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    years, dists = [], []
+    for i, (year, values) in enumerate(_by_winter(data, "SNOW")):
+        dist = binning.distribution(values)
+        years.append(int(year))
+        dists.append(dist)
+        half_width = dist.density * 0.4
+        fig.add_trace(
+            go.Scatter(
+                # Single precision is plenty for an outline and half the size
+                x=np.concatenate(
+                    [years[-1] - half_width, (years[-1] + half_width)[::-1]]
+                ).astype(np.float32),
+                y=np.concatenate([dist.grid, dist.grid[::-1]]).astype(np.float32),
+                fill="toself",
+                mode="lines",
+                line_color=colors[i % len(colors)],
+                name=str(year),
+                hoverinfo="name",
+            )
+        )
+
+    # All the boxes in one trace, which is much smaller than one per year
+    fig.add_trace(
+        go.Box(
+            x=years,
+            q1=[d.q1 for d in dists],
+            median=[d.median for d in dists],
+            q3=[d.q3 for d in dists],
+            lowerfence=[d.lowerfence for d in dists],
+            upperfence=[d.upperfence for d in dists],
+            mean=[d.mean for d in dists],
+            width=0.15,
+            marker_color="black",
+            name="Quartiles",
+            showlegend=False,
+        )
+    )
+    fig.add_trace(
+        go.Scattergl(
+            x=sampled["WINTER_YEAR"].to_numpy(),
+            y=sampled["SNOW"].to_numpy(),
+            mode="markers",
+            marker={"size": 3, "color": "gray"},
+            name="Snow days",
+            showlegend=False,
         )
-        .agg({"TAVG": "mean", "TMAX": "mean", "TMIN": "mean", "SNOW": "sum"})
-        # move grouped index into regular columns
-        .reset_index()
     )
+    fig.update_layout(
+        title="Distribution of Snowfall events per Year",
+        xaxis_title="Winter Year",
+        yaxis_title=_SNOW_LABEL,
+    )
+    return fig
+
+
+def _by_winter(data: pl.DataFrame, column: str) -> list[tuple[int, np.ndarray]]:
+    """Each winter's values of column, oldest winter first"""
+    years = data["WINTER_YEAR"].to_numpy()
+    values = data[column].to_numpy()
+    return [(years[p[0]], values[p]) for p in downsample.group_positions(years)]
+
 
-    final_data = monthly_summaries.groupby("MONTH").mean(numeric_only=True)
-    final_data = final_data.reindex(month_order)
+@profiling.timed()
+def plot_monthly_averages(
+    data: pl.DataFrame, cube: Optional[load_data.FrameLike] = None
+) -> go.Figure:
+    """Bars of average monthly snowfall and temperatures. A precomputed
+    monthly cube, like the one the DailyStore keeps, is used instead of
+    aggregating the daily data when given."""
+    if cube is None:
+        cube = climatology.monthly_cube(data)
+    final_data = climatology.monthly_averages(cube)
 
     fig = px.bar(
         final_data,
-        x=final_data.index,
+        x="MONTH",
         y=["SNOW", "TAVG", "TMAX", "TMIN"],
         title="Monthly Averages",
         barmode="group",
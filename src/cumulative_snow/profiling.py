@@ -0,0 +1,242 @@
+"""Lightweight per-stage timing of the pipeline.
+
+Stages are wrapped in spans that record wall time, optional row and byte
+counts and the process' peak resident memory when the stage ended. Nothing is
+recorded unless a Profiler is enabled, and a disabled span costs a global
+lookup and returns a shared no-op object.
+
+    with profiling.profile() as profiler:
+        ...
+    print(profiler.to_frame())
+"""
+
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import polars as pl
+    from typing_extensions import Self
+
+try:
+    import resource
+except ImportError:  # Windows and pyodide
+    resource = None
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Span:
+    """A timed stage. Set rows and bytes inside the with block to record how
+    much the stage processed."""
+
+    __slots__ = (
+        "_profiler",
+        "bytes",
+        "depth",
+        "error",
+        "name",
+        "peak_rss_bytes",
+        "rows",
+        "seconds",
+        "start",
+        "thread",
+    )
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.name = name
+        self.rows: Optional[int] = None
+        self.bytes: Optional[int] = None
+        self.error: Optional[str] = None
+        self._profiler = profiler
+
+    def __enter__(self) -> "Self":
+        stack = self._profiler._stack()
+        self.depth = len(stack)
+        self.thread = threading.current_thread().name
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.seconds = time.perf_counter() - self.start
+        self.peak_rss_bytes = peak_rss()
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self._profiler._stack().pop()
+        self._profiler._record(self)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "thread": self.thread,
+            "start_seconds": self.start - self._profiler.started,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "error": self.error,
+        }
+
+
+class _NullSpan:
+    """Stands in for a Span when profiling is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "Self":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def records(self) -> list[dict[str, Any]]:
+        """Finished spans in the order they started"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [s.as_dict() for s in spans]
+
+    def to_frame(self) -> "pl.DataFrame":
+        # Imported here so enabling profiling doesn't import polars
+        import polars as pl
+
+        return pl.DataFrame(
+            self.records(),
+            schema={
+                "name": pl.String,
+                "depth": pl.Int32,
+                "thread": pl.String,
+                "start_seconds": pl.Float64,
+                "seconds": pl.Float64,
+                "rows": pl.Int64,
+                "bytes": pl.Int64,
+                "peak_rss_bytes": pl.Int64,
+                "error": pl.String,
+            },
+        )
+
+    def summary(self) -> "pl.DataFrame":
+        """Totals per stage name, slowest first"""
+        import polars as pl
+
+        return (
+            self.to_frame()
+            .group_by("name")
+            .agg(
+                pl.len().alias("calls"),
+                pl.col("seconds").sum(),
+                pl.col("rows", "bytes").sum(),
+                pl.col("peak_rss_bytes").max(),
+            )
+            .sort("seconds", descending=True)
+        )
+
+    def write_json(self, f: IO[str], **extra: Any) -> None:
+        """Writes the spans and any extra keys as a JSON object"""
+        json.dump({"spans": self.records(), **extra}, f, indent=2)
+        f.write("\n")
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enable() -> Profiler:
+    """Starts recording spans into a new Profiler"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable() -> None:
+    global _profiler
+    _profiler = None
+
+
+def current() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def profile() -> Iterator[Profiler]:
+    """Records spans for the duration of the with block"""
+    global _profiler
+    previous = _profiler
+    profiler = enable()
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+
+
+def span(name: str) -> Union[Span, _NullSpan]:
+    profiler = _profiler
+    return profiler.span(name) if profiler is not None else _NULL_SPAN
+
+
+def timed(name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorator recording a span named after the function for each call"""
+
+    def decorate(fn: F) -> F:
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return fn(*args, **kwargs)
+            with profiler.span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper  # pyright: ignore[reportReturnType]
+
+    return decorate
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of the process so far in bytes"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
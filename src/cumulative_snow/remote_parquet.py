@@ -0,0 +1,288 @@
+"""Reads only the needed parts of remote parquet files with HTTP Range requests.
+
+A parquet file keeps its metadata in a footer at the end of the file, so
+reading the footer first is enough to decide which row groups and column
+chunks are needed, and only those bytes are then fetched.
+"""
+
+import io
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Callable, Iterable, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cumulative_snow import profiling
+from cumulative_snow.fetch import (
+    DEFAULT_MAX_WORKERS,
+    HttpClient,
+    HttpError,
+    is_pyodide,
+    range_header,
+    slice_range_response,
+)
+
+logger = logging.getLogger(__name__)
+
+# Called with the URL and a [start, end) byte range, where a negative start
+# with no end requests that many bytes from the end of the file. Returns the
+# bytes and the total size of the file.
+RangeGetter = Callable[[str, int, Optional[int]], tuple[bytes, int]]
+
+# Column chunks for a single station's row group are often only a few KB, so
+# small blocks avoid fetching the unused columns around them
+DEFAULT_BLOCK_SIZE = 16 << 10
+DEFAULT_MAX_BLOCKS = 4096
+# Big enough to hold the footer of the GHCNd files in a single request
+DEFAULT_FOOTER_BYTES = 16 << 10
+
+# The columns and elements the notebook's pivot query uses
+DEFAULT_COLUMNS = ("ID", "DATE", "ELEMENT", "DATA_VALUE")
+DEFAULT_ELEMENTS = ("TMAX", "TAVG", "TMIN", "PRCP", "SNOW", "SNWD")
+# Types of the by_station files' columns, for results without any files.
+# Columns that aren't listed, like hive partitions, are strings.
+COLUMN_TYPES = {"ID": pa.string(), "DATE": pa.string(), "DATA_VALUE": pa.int64()}
+
+
+class HttpRangeFile(io.RawIOBase):
+    """Seekable read-only file backed by HTTP Range requests.
+
+    Reads are served from a cache of fixed size blocks, and runs of missing
+    blocks are fetched with one request each.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        range_get: Optional[RangeGetter] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_blocks: int = DEFAULT_MAX_BLOCKS,
+        footer_bytes: int = DEFAULT_FOOTER_BYTES,
+    ) -> None:
+        super().__init__()
+        self.url = url
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self._range_get = range_get or default_range_getter()
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+        self._pos = 0
+
+        # Learn the size and prefetch the footer with the same request
+        self._tail, self.size = self._range_get(url, -footer_bytes, None)
+        self._tail_start = self.size - len(self._tail)
+        self.bytes_fetched = len(self._tail)
+        self.requests = 1
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        return self._pos
+
+    def readinto(self, buffer) -> int:  # pyright: ignore[reportIncompatibleMethodOverride]
+        data = self._read_range(self._pos, min(self._pos + len(buffer), self.size))
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def _read_range(self, start: int, end: int) -> bytes:
+        if start >= end:
+            return b""
+        if start >= self._tail_start:
+            offset = start - self._tail_start
+            return self._tail[offset : offset + end - start]
+
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        self._fetch_blocks(b for b in range(first, last + 1) if b not in self._blocks)
+        data = b"".join(self._block(b) for b in range(first, last + 1))
+        # Only once joined, so a read spanning more than max_blocks works
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        offset = start - first * self.block_size
+        return data[offset : offset + end - start]
+
+    def _fetch_blocks(self, missing: Iterable[int]) -> None:
+        for run_start, run_end in _runs(missing):
+            start = run_start * self.block_size
+            end = min((run_end + 1) * self.block_size, self.size)
+            data, _ = self._range_get(self.url, start, end)
+            self.bytes_fetched += len(data)
+            self.requests += 1
+            for b in range(run_start, run_end + 1):
+                offset = (b - run_start) * self.block_size
+                self._blocks[b] = data[offset : offset + self.block_size]
+
+    def _block(self, b: int) -> bytes:
+        self._blocks.move_to_end(b)
+        return self._blocks[b]
+
+
+def default_range_getter() -> RangeGetter:
+    return xhr_range_get if is_pyodide() else HttpClient().range_get
+
+
+def xhr_range_get(url: str, start: int, end: Optional[int]) -> tuple[bytes, int]:
+    """Synchronous range request for pyodide, which runs in a web worker where
+    synchronous XMLHttpRequests may return binary data"""
+    import js  # pyright: ignore[reportMissingImports]
+
+    xhr = js.XMLHttpRequest.new()
+    xhr.open("GET", url, False)
+    xhr.responseType = "arraybuffer"
+    xhr.setRequestHeader("Range", range_header(start, end))
+    xhr.send(None)
+    if xhr.status not in (200, 206):
+        raise HttpError(url, xhr.status)
+    body = js.Uint8Array.new(xhr.response).to_bytes()
+    return slice_range_response(
+        xhr.status, xhr.getResponseHeader("Content-Range"), body, start, end
+    )
+
+
+def read_station_parquet(
+    urls: Sequence[str],
+    elements: Sequence[str] = DEFAULT_ELEMENTS,
+    min_year: Optional[int] = None,
+    columns: Sequence[str] = DEFAULT_COLUMNS,
+    range_get: Optional[RangeGetter] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    min_date: Optional[date] = None,
+) -> pa.Table:
+    """Reads the requested columns of a station's partition files, skipping
+    files, row groups and rows that can't match elements or are before
+    min_year or min_date.
+
+    Hive partition values in the URLs (e.g. ELEMENT=SNOW) are added as columns
+    when the files don't contain them.
+    """
+    range_get = range_get or default_range_getter()
+    urls = [url for url in urls if _partition_matches(url, elements)]
+    # GHCNd dates are YYYYMMDD strings, which sort like the dates
+    starts = [f"{min_year:04d}0101"] if min_year is not None else []
+    if min_date is not None:
+        starts.append(min_date.strftime("%Y%m%d"))
+    start = max(starts, default=None)
+
+    def read(url: str) -> tuple[pa.Table, int]:
+        return _read_filtered(url, elements, start, columns, range_get)
+
+    with profiling.span("read_parquet") as span:
+        if is_pyodide() or max_workers <= 1:
+            results = [read(url) for url in urls]
+        else:
+            with ThreadPoolExecutor(max_workers) as pool:
+                results = list(pool.map(read, urls))
+        if results:
+            tables = [t for t, _ in results]
+            table = pa.concat_tables(tables, promote_options="permissive")
+        else:
+            schema = pa.schema((c, COLUMN_TYPES.get(c, pa.string())) for c in columns)
+            table = schema.empty_table()
+        span.rows = table.num_rows
+        span.bytes = sum(fetched for _, fetched in results)
+    return table
+
+
+def _read_filtered(
+    url: str,
+    elements: Sequence[str],
+    min_date: Optional[str],
+    columns: Sequence[str],
+    range_get: RangeGetter,
+) -> tuple[pa.Table, int]:
+    """The matching rows and the bytes fetched"""
+    f = HttpRangeFile(url, range_get)
+    pf = pq.ParquetFile(f)
+    names = pf.schema_arrow.names
+
+    row_groups = [
+        i
+        for i in range(pf.metadata.num_row_groups)
+        if _row_group_matches(pf.metadata.row_group(i), names, elements, min_date)
+    ]
+    if not row_groups:
+        logger.info("Skipped %s after reading %d bytes", url, f.bytes_fetched)
+        # Typed like the rows would have been, from the footer
+        fields = [
+            pf.schema_arrow.field(c) if c in names else pa.field(c, pa.string())
+            for c in columns
+            if c in names or c in _hive_partitions(url)
+        ]
+        return pa.schema(fields).empty_table(), f.bytes_fetched
+
+    table = pf.read_row_groups(row_groups, columns=[c for c in columns if c in names])
+    for key, value in _hive_partitions(url).items():
+        if key in columns and key not in names:
+            table = table.append_column(key, pa.array([value] * len(table)))
+    if "ELEMENT" in table.column_names:
+        table = table.filter(pc.is_in(table["ELEMENT"], pa.array(elements)))
+    if min_date and "DATE" in table.column_names:
+        table = table.filter(pc.greater_equal(table["DATE"], min_date))
+
+    logger.info(
+        "Read %d of %d bytes of %s in %d requests",
+        f.bytes_fetched,
+        f.size,
+        url,
+        f.requests,
+    )
+    return table.select(
+        [c for c in columns if c in table.column_names]
+    ), f.bytes_fetched
+
+
+def _row_group_matches(
+    row_group: pq.RowGroupMetaData,
+    names: Sequence[str],
+    elements: Sequence[str],
+    min_date: Optional[str],
+) -> bool:
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        name = column.path_in_schema
+        stats = column.statistics
+        if name not in names or stats is None or not stats.has_min_max:
+            continue
+        if name == "DATE" and min_date and str(stats.max) < min_date:
+            return False
+        if name == "ELEMENT" and stats.min == stats.max and stats.min not in elements:
+            return False
+    return True
+
+
+def _partition_matches(url: str, elements: Sequence[str]) -> bool:
+    element = _hive_partitions(url).get("ELEMENT")
+    return element is None or element in elements
+
+
+def _hive_partitions(url: str) -> dict[str, str]:
+    return dict(segment.split("=", 1) for segment in url.split("/") if "=" in segment)
+
+
+def _runs(blocks: Iterable[int]) -> list[tuple[int, int]]:
+    """Groups sorted block numbers into inclusive (first, last) runs"""
+    runs: list[tuple[int, int]] = []
+    for b in blocks:
+        if runs and runs[-1][1] == b - 1:
+            runs[-1] = (runs[-1][0], b)
+        else:
+            runs.append((b, b))
+    return runs
@@ -0,0 +1,179 @@
+"""Typeahead search over the station catalog.
+
+Each station's ID, state and the words of its name are tokens in one sorted
+array, so the stations with a token starting with a prefix are one contiguous
+slice found by binary search. A query matches the stations that have a token
+starting with each of its words. Matches are ranked by how many words matched
+a whole token, then whether the name starts with the first word, then by the
+length of the station's record.
+
+Short or common prefixes match much of the catalog, and scattering that many
+stations into a dense array takes most of a millisecond. So the stations of
+every slice holding more than DENSE_FRACTION of the catalog are found when the
+index is built and kept as bitsets. Stations are numbered by rank, so the best
+matches with each score are its first set bits.
+"""
+
+import re
+from typing import Optional
+
+import numpy as np
+import polars as pl
+
+DEFAULT_LIMIT = 20
+# Token slices at least this share of the catalog long are kept as bitsets
+DENSE_FRACTION = 1 / 64
+
+_WORD = re.compile(r"[A-Z0-9]+")
+# Sorts after every character a token can have
+_PREFIX_END = "\U0010ffff"
+
+
+def words(text: str) -> list[str]:
+    return _WORD.findall(text.upper())
+
+
+class StationSearch:
+    """Prefix index over station ID, STATE and NAME, built once per catalog"""
+
+    def __init__(
+        self,
+        ids: list[str],
+        names: list[Optional[str]],
+        states: list[Optional[str]],
+        num_years: np.ndarray,
+    ) -> None:
+        tokens, rows, leading = [], [], []
+        for row, (id, name, state) in enumerate(zip(ids, names, states)):
+            name_words = words(name or "")
+            row_tokens = [id.upper(), *name_words, *([state.upper()] if state else [])]
+            tokens += row_tokens
+            rows += [row] * len(row_tokens)
+            leading += [i == 1 and bool(name_words) for i in range(len(row_tokens))]
+
+        # Stations with the longest records first
+        self._by_rank = np.argsort(-np.asarray(num_years), kind="stable").astype(
+            np.int32
+        )
+        self._rank = np.empty_like(self._by_rank)
+        self._rank[self._by_rank] = np.arange(len(self._by_rank), dtype=np.int32)
+
+        order = np.argsort(np.array(tokens, dtype=str), kind="stable")
+        self._tokens = np.array(tokens, dtype=str)[order]
+        self._width = self._tokens.dtype.itemsize // np.dtype("U1").itemsize
+        self._ranks = self._rank[np.array(rows, dtype=np.int32)[order]]
+        # Where the tokens that are the first word of a station's name are
+        self._leading = np.flatnonzero(np.array(leading, dtype=bool)[order])
+        # Packed stations and leading stations, by (start, end) token slice
+        self._bitsets: dict[tuple[int, int], tuple[np.ndarray, np.ndarray]] = {}
+        min_size = max(int(len(self) * DENSE_FRACTION), 1)
+        for start, end in self._large_slices(min_size):
+            self._bitsets[start, end] = (
+                np.packbits(self._stations(start, end)),
+                np.packbits(self._stations(start, end, leading=True)),
+            )
+
+    @classmethod
+    def from_catalog(cls, catalog: pl.DataFrame) -> "StationSearch":
+        return cls(
+            catalog["ID"].to_list(),
+            catalog["NAME"].to_list(),
+            catalog["STATE"].to_list(),
+            catalog["NUM_YEARS"].fill_null(0).to_numpy(),
+        )
+
+    def __len__(self) -> int:
+        return len(self._rank)
+
+    def search(
+        self,
+        query: str,
+        limit: int = DEFAULT_LIMIT,
+        mask: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Catalog row indices of the best limit matches for query, best
+        first. mask limits the matches to rows where it's True. An empty query
+        matches every station."""
+        query_words = words(query)
+        if not query_words:
+            rows = self._by_rank if mask is None else self._by_rank[mask[self._by_rank]]
+            return rows[:limit]
+
+        # Scores are summed over dense per-station arrays, which is faster than
+        # intersecting sets of matches when a short prefix matches thousands
+        n = len(self)
+        matched = np.ones(n, dtype=bool) if mask is None else mask[self._by_rank]
+        score = np.zeros(n, dtype=np.int8)
+        for i, word in enumerate(query_words):
+            if len(word) > self._width:
+                # Longer than every token. Also keeps searchsorted from
+                # copying the tokens to widen them.
+                return self._by_rank[:0]
+            # Tokens equal to the word sort first among those it prefixes
+            start = self._tokens.searchsorted(word, "left")
+            exact = self._tokens.searchsorted(word, "right")
+            end = self._tokens.searchsorted(
+                (word + _PREFIX_END)[: self._width], "right"
+            )
+            # Each station's best token: whole token matches count double, and
+            # the name starting with the first word once more
+            prefixed = self._stations(start, end)
+            whole = self._stations(start, exact)
+            # Booleans viewed as int8, as mixing them with ints makes int64s
+            word_score = prefixed.view(np.int8) - 1 + whole.view(np.int8) * 2
+            if i == 0:
+                word_score += self._stations(start, exact, leading=True).view(np.int8)
+                leading = self._stations(start, end, leading=True) & ~whole
+                word_score += leading.view(np.int8)
+            matched &= prefixed
+            score += word_score
+
+        # Highest score first, then the longest record
+        # -1 for stations that didn't match, without masked assignment or
+        # np.where, which are each slower than the whole search otherwise
+        score = (score + 1) * matched.view(np.int8) - 1
+        found = [np.empty(0, dtype=np.intp)]
+        remaining = limit
+        for level in range(score.max(initial=-1), -1, -1):
+            if remaining <= 0:
+                break
+            found.append(np.flatnonzero(score == level)[:remaining])
+            remaining -= len(found[-1])
+        return self._by_rank[np.concatenate(found)]
+
+    def _stations(self, start: int, end: int, leading: bool = False) -> np.ndarray:
+        """Whether each station, by rank, has a token in the slice, or a
+        leading token if leading"""
+        bitsets = self._bitsets.get((start, end))
+        if bitsets is not None:
+            return np.unpackbits(bitsets[leading], count=len(self)).view(bool)
+        if leading:
+            lo, hi = self._leading.searchsorted([start, end])
+            positions = self._leading[lo:hi]
+        else:
+            positions = slice(start, end)
+        stations = np.zeros(len(self), dtype=bool)
+        stations[self._ranks[positions]] = True
+        return stations
+
+    def _large_slices(self, min_size: int) -> list[tuple[int, int]]:
+        """The slices of tokens with each prefix, and of tokens equal to each
+        prefix, that have at least min_size tokens"""
+        # Each token's characters as code points, 0 past its end
+        codes = self._tokens.view(np.uint32).reshape(len(self._tokens), self._width)
+        found = []
+        # Slices sharing a prefix depth characters long, to split by the next
+        stack = [(0, len(self._tokens), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if depth == self._width:
+                continue
+            splits = lo + 1 + np.flatnonzero(np.diff(codes[lo:hi, depth]))
+            for start, end in zip([lo, *splits], [*splits, hi]):
+                if end - start < min_size:
+                    continue
+                found.append((start, end))
+                # Otherwise tokens equal to the prefix, which end here
+                if codes[start, depth]:
+                    stack.append((start, end, depth + 1))
+        return found
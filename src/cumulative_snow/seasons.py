@@ -0,0 +1,102 @@
+"""One station's winters as a dense winter year by season day matrix.
+
+Rows are winters, oldest first, and columns are DAY_OF_SEASON, so each
+calendar day is the same column every winter and comparing winters on a date
+is a reduction down a column. A 150 winter record is 150 x 366 floats, small
+enough that percentiles over every day take milliseconds.
+
+Winters without a Feb 29th get the Feb 28th value in its column, which for
+cumulative snow is what it would have been. Days without data are NaN and
+every statistic ignores them.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Sequence
+
+import numpy as np
+import polars as pl
+
+from cumulative_snow.load_data import NORMALIZED_SEASON_START, station_column
+
+DAYS_IN_SEASON = 366
+LEAP_DAY = (
+    date(NORMALIZED_SEASON_START.year + 1, 2, 29) - NORMALIZED_SEASON_START
+).days
+DEFAULT_PERCENTILES = (10, 50, 90)
+
+
+@dataclass
+class SeasonMatrix:
+    winters: np.ndarray
+    # Indexed [winter, DAY_OF_SEASON]
+    values: np.ndarray
+
+    @classmethod
+    def from_frame(
+        cls, data: pl.DataFrame, column: str = "CUMULATIVE_SNOW"
+    ) -> "SeasonMatrix":
+        """Built from one station's load_noaa_data() output"""
+        station = station_column(data.schema)
+        if station and data[station].n_unique() > 1:
+            raise ValueError("A SeasonMatrix holds one station's winters")
+        years = data["WINTER_YEAR"].to_numpy()
+        winters, rows = np.unique(years, return_inverse=True)
+        values = np.full((len(winters), DAYS_IN_SEASON), np.nan)
+        values[rows, data["DAY_OF_SEASON"].to_numpy()] = data[column].to_numpy()
+
+        spring = winters + 1
+        leap = (spring % 4 == 0) & ((spring % 100 != 0) | (spring % 400 == 0))
+        values[~leap, LEAP_DAY] = values[~leap, LEAP_DAY - 1]
+        return cls(winters, values)
+
+    def row(self, winter: int) -> np.ndarray:
+        """The winter's values for each season day"""
+        index = np.searchsorted(self.winters, winter)
+        if index == len(self.winters) or self.winters[index] != winter:
+            raise KeyError(f"No data for winter {winter}")
+        return self.values[index]
+
+    def between(
+        self, start: Optional[int] = None, end: Optional[int] = None
+    ) -> "SeasonMatrix":
+        """The winters from start through end, as a view"""
+        lo = 0 if start is None else np.searchsorted(self.winters, start, "left")
+        hi = len(self.winters)
+        if end is not None:
+            hi = np.searchsorted(self.winters, end, "right")
+        return SeasonMatrix(self.winters[lo:hi], self.values[lo:hi])
+
+    def percentiles(
+        self, percentiles: Sequence[float] = DEFAULT_PERCENTILES
+    ) -> np.ndarray:
+        """Each percentile of the winters on each season day, indexed
+        [percentile, DAY_OF_SEASON]. NaN for days no winter has data for."""
+        # Linear interpolation like np.percentile, but for every day at once.
+        # np.nanpercentile goes one day at a time when there are NaNs.
+        ordered = np.sort(self.values, axis=0)  # NaNs last
+        counts = (~np.isnan(self.values)).sum(axis=0)
+        positions = np.outer(np.asarray(percentiles) / 100, np.maximum(counts - 1, 0))
+        below = np.floor(positions).astype(np.intp)
+        above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+        days = np.arange(DAYS_IN_SEASON)
+        low, high = ordered[below, days], ordered[above, days]
+        out = low + (high - low) * (positions - below)
+        out[:, counts == 0] = np.nan
+        return out
+
+    def anomaly(
+        self, winter: int, normals: Optional[tuple[int, int]] = None
+    ) -> np.ndarray:
+        """How far the winter is above the median of the normals winters on
+        each season day, every winter by default"""
+        normal = self.between(*normals) if normals else self
+        return self.row(winter) - normal.percentiles([50])[0]
+
+    def rank(self, winter: int) -> np.ndarray:
+        """The winter's rank among the winters on each season day, 1 for the
+        highest. NaN on days the winter has no data for."""
+        row = self.row(winter)
+        ranks = (self.values > row).sum(axis=0) + 1.0
+        ranks[np.isnan(row)] = np.nan
+        return ranks
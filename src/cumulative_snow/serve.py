@@ -0,0 +1,392 @@
+"""Serves station reports and their figures from a long-running local process.
+
+Running the CLI once per report pays for imports, loading, pivoting and
+building the figures every time. This keeps the process, and the most
+recently used stations' frames and figures, in memory up to a byte budget, so
+asking again for a station is answered from memory. Entries expire after as
+long as the DailyStore goes without checking NOAA's files, so the next
+request reloads a station whose data may have changed. Concurrent requests for a
+station that's still being built wait for the same build rather than starting
+their own, and figures are built in worker processes so the event loop keeps
+answering other requests.
+
+    uv run python -m cumulative_snow.serve --port 8000
+
+    GET /station/<ID>                  the report page
+    GET /station/<ID>/<figure>.json    one figure, named in plot.FIGURES
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import re
+import time
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Hashable,
+    Optional,
+    Sequence,
+    TypeVar,
+    cast,
+)
+from urllib.parse import urlsplit
+
+import polars as pl
+import pyarrow as pa
+
+from cumulative_snow import cache, load_data, units
+
+if TYPE_CHECKING:
+    from cumulative_snow.store import DailyStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_BYTES = 512 << 20
+
+# Reads a station's daily table in GHCNd units and its monthly cube, raising
+# KeyError for stations without data
+StationLoader = Callable[[str], tuple[pa.Table, pa.Table]]
+
+_ROUTE = re.compile(r"/station/(?P<station>[A-Za-z0-9_]+)(?:/(?P<figure>\w+)\.json)?")
+
+_PAGE = """\
+<html>
+    <head>
+        <title>{title}</title>
+        <script src="{plotly_js}"></script>
+        <style>
+        h1 {{
+            text-align: center;
+        }}
+        #graphs {{
+            display: flex;
+            margin: auto;
+            flex-wrap: wrap;
+            justify-content: center;
+        }}
+        #graphs > div {{
+            width: 1000px;
+            height: 800px;
+        }}
+        </style>
+    </head>
+    <body>
+        <h1>{title}</h1>
+        <div id="graphs"></div>
+        <script>
+        for (const name of {figures}) {{
+            const div = document.createElement("div");
+            document.getElementById("graphs").appendChild(div);
+            fetch(`/station/{station}/${{name}}.json`)
+                .then((response) => response.json())
+                .then((fig) => Plotly.newPlot(div, fig.data, fig.layout));
+        }}
+        </script>
+    </body>
+</html>
+"""
+
+
+@dataclass
+class Frame:
+    """A station's daily data in display units, as the plots take it"""
+
+    data: pl.DataFrame
+    monthly: pa.Table
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.estimated_size()) + self.monthly.nbytes
+
+
+@dataclass
+class Figures:
+    # JSON of each figure in plot.FIGURES
+    json: dict[str, bytes]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(body) for body in self.json.values())
+
+
+T = TypeVar("T", Frame, Figures)
+
+
+class MemoryLRU:
+    """Values by key, dropping the least recently used past max_bytes and
+    any older than max_age_seconds"""
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.clock = clock
+        self.nbytes = 0
+        # Value, size and when it was put
+        self._entries: OrderedDict[Hashable, tuple[object, int, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[object]:
+        if key not in self._entries:
+            return None
+        value, _, put_at = self._entries[key]
+        if (
+            self.max_age_seconds is not None
+            and self.clock() - put_at > self.max_age_seconds
+        ):
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: object, nbytes: int) -> None:
+        """Keeps value unless it's larger than the whole budget"""
+        self.pop(key)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes, self.clock())
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            evicted, (_, size, _) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            logger.debug("Evicted %s", evicted)
+
+    def pop(self, key: Hashable) -> None:
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+
+
+class ReportServer:
+    """Answers HTTP requests for station reports, see the module docstring"""
+
+    def __init__(
+        self,
+        load_station: StationLoader,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        executor: Optional[Executor] = None,
+        max_age_seconds: Optional[float] = cache.DEFAULT_MAX_AGE_SECONDS,
+    ) -> None:
+        self.cache = MemoryLRU(max_bytes, max_age_seconds)
+        self._load_station = load_station
+        # Spawned rather than forked, as forking after polars has started its
+        # thread pool can deadlock
+        self._executor = executor or ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._pending: dict[Hashable, asyncio.Future] = {}
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    async def frame(self, station: str) -> Frame:
+        return await self._cached(
+            ("frame", station), lambda: asyncio.to_thread(self._read, station)
+        )
+
+    async def figures(self, station: str) -> Figures:
+        return await self._cached(("figures", station), lambda: self._build(station))
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answers one HTTP/1.1 request and closes the connection"""
+        try:
+            request_line = await reader.readline()
+            # Headers aren't needed for anything
+            while (await reader.readline()).strip():
+                pass
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            status, content_type, body = await self._respond(method, target)
+        except ValueError:
+            status, content_type, body = _error(HTTPStatus.BAD_REQUEST)
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, target: str) -> tuple[HTTPStatus, str, bytes]:
+        if method != "GET":
+            return _error(HTTPStatus.METHOD_NOT_ALLOWED)
+        match = _ROUTE.fullmatch(urlsplit(target).path)
+        if match is None:
+            return _error(HTTPStatus.NOT_FOUND)
+        station, figure = match["station"], match["figure"]
+        try:
+            # Built before the page is sent too, so the page's requests for
+            # each figure are answered from memory
+            figures = await self.figures(station)
+        except KeyError:
+            return _error(HTTPStatus.NOT_FOUND)
+        except Exception:
+            logger.exception("Failed building %s", station)
+            return _error(HTTPStatus.INTERNAL_SERVER_ERROR)
+        if figure is None:
+            return HTTPStatus.OK, "text/html; charset=utf-8", _page(station)
+        if figure not in figures.json:
+            return _error(HTTPStatus.NOT_FOUND)
+        return HTTPStatus.OK, "application/json", figures.json[figure]
+
+    def _read(self, station: str) -> Frame:
+        daily, monthly = self._load_station(station)
+        return Frame(load_data.load_noaa_data(units.to_display_units(daily)), monthly)
+
+    async def _build(self, station: str) -> Figures:
+        frame = await self.frame(station)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, build_figures, frame.data, frame.monthly
+        )
+
+    async def _cached(self, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        """The cached value for key, or the result of the one compute()
+        every caller asking for key meanwhile waits for"""
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cast(T, cached)
+
+        async def run() -> T:
+            try:
+                value = await compute()
+                self.cache.put(key, value, value.nbytes)
+                return value
+            finally:
+                del self._pending[key]
+
+        if key not in self._pending:
+            self._pending[key] = asyncio.ensure_future(run())
+        # A client hanging up doesn't cancel the build for the others waiting
+        return await asyncio.shield(self._pending[key])
+
+
+def build_figures(data: pl.DataFrame, monthly: pa.Table) -> Figures:
+    """Runs in a worker process"""
+    from cumulative_snow import plot
+
+    figs = plot.build_figures(data, monthly, packed=True, bands=True)
+    return Figures({name: fig.to_json().encode() for name, fig in figs.items()})
+
+
+def noaa_loader(daily_store: "DailyStore") -> StationLoader:
+    """Loads stations from NOAA's bucket through daily_store, like the
+    notebook does"""
+    from cumulative_snow import fetch, remote_parquet, store
+
+    def load(station: str) -> tuple[pa.Table, pa.Table]:
+        daily = daily_store.get_recent(
+            station, max_age_seconds=cache.DEFAULT_MAX_AGE_SECONDS
+        )
+        if daily is None:
+            prefix = f"parquet/by_station/STATION={station}"
+            objects = list(fetch.list_objects(prefix))
+            if not objects:
+                raise KeyError(f"No objects found with prefix: {prefix}")
+            daily = daily_store.load(
+                station,
+                store.source_hash(objects),
+                lambda since: remote_parquet.read_station_parquet(
+                    [f"{fetch.NOAA_BUCKET_URL}/{obj.key}" for obj in objects],
+                    min_date=since,
+                ),
+            )
+        return daily, daily_store.monthly(station)
+
+    return load
+
+
+async def serve(server: ReportServer, host: str, port: int) -> None:
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving on http://{host}:{port}/station/<ID>", flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def _page(station: str) -> bytes:
+    from plotly.offline import get_plotlyjs_version
+
+    from cumulative_snow import plot
+
+    return _PAGE.format(
+        title=f"Cumulative Snow per Winter Season at {station}",
+        plotly_js=f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js",
+        figures=json.dumps(plot.FIGURES),
+        station=station,
+    ).encode()
+
+
+def _error(status: HTTPStatus) -> tuple[HTTPStatus, str, bytes]:
+    return status, "text/plain; charset=utf-8", f"{status.phrase}\n".encode()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from cumulative_snow.store import DEFAULT_DB_PATH, DailyStore
+
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--max_mib",
+        type=int,
+        default=DEFAULT_MAX_BYTES >> 20,
+        help="Memory kept for recently used station frames and figures",
+    )
+    parser.add_argument(
+        "--max_age_seconds",
+        type=float,
+        default=cache.DEFAULT_MAX_AGE_SECONDS,
+        help="How long a station's report is served before reloading it",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes building figures. Defaults to the number of CPUs",
+    )
+    parser.add_argument("--db_path", default=DEFAULT_DB_PATH)
+    args = parser.parse_args(argv)
+
+    daily_store = DailyStore(args.db_path)
+    server = ReportServer(
+        noaa_loader(daily_store),
+        max_bytes=args.max_mib << 20,
+        max_age_seconds=args.max_age_seconds,
+        executor=ProcessPoolExecutor(
+            args.workers, mp_context=multiprocessing.get_context("spawn")
+        ),
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        daily_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Spatial index over station coordinates for the map.
+
+Stations are bucketed into a fixed grid of latitude/longitude cells and sorted
+by cell, so every row of cells in a bounding box is one contiguous slice of
+the sorted stations. The map then only gets points inside the viewport,
+aggregated into clusters at the current zoom level.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import polars as pl
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Clusters are roughly this many screen pixels across
+CLUSTER_PIXELS = 48
+# Web mercator tiles are 256 pixels and the world is 2**zoom tiles wide
+TILE_PIXELS = 256
+
+
+@dataclass(frozen=True)
+class BBox:
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @classmethod
+    def around(cls, lat: float, lon: float, radius_km: float) -> "BBox":
+        dlat = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+        if cos_lat < 1e-6 or dlat / cos_lat >= 180.0:
+            return cls(lat - dlat, -180.0, lat + dlat, 180.0)
+        dlon = dlat / cos_lat
+        # Wrap around the antimeridian, leaving west > east
+        west = (lon - dlon + 540.0) % 360.0 - 180.0
+        east = (lon + dlon + 540.0) % 360.0 - 180.0
+        return cls(lat - dlat, west, lat + dlat, east)
+
+
+WORLD = BBox(-90.0, -180.0, 90.0, 180.0)
+
+
+class StationIndex:
+    """Grid index over station LATITUDE/LONGITUDE, built once per catalog"""
+
+    def __init__(
+        self, latitude: np.ndarray, longitude: np.ndarray, cell_degrees: float = 1.0
+    ) -> None:
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        self._rows = math.ceil(180 / cell_degrees)
+        self._cols = math.ceil(360 / cell_degrees)
+
+        cells = self._cell(self.latitude, self.longitude)
+        # Station indices ordered by cell, and where each cell starts in them
+        self._order = np.argsort(cells, kind="stable")
+        self._starts = np.searchsorted(
+            cells[self._order], np.arange(self._rows * self._cols + 1)
+        )
+
+    @classmethod
+    def from_catalog(cls, catalog: pl.DataFrame, cell_degrees: float = 1.0):
+        return cls(
+            catalog["LATITUDE"].to_numpy(),
+            catalog["LONGITUDE"].to_numpy(),
+            cell_degrees,
+        )
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+    def within(self, bbox: BBox) -> np.ndarray:
+        """Indices of stations inside the bounding box. West may be greater
+        than east for boxes crossing the antimeridian."""
+        if bbox.west > bbox.east:
+            return np.concatenate(
+                [
+                    self.within(BBox(bbox.south, bbox.west, bbox.north, 180.0)),
+                    self.within(BBox(bbox.south, -180.0, bbox.north, bbox.east)),
+                ]
+            )
+        south, north = max(bbox.south, -90.0), min(bbox.north, 90.0)
+        west, east = max(bbox.west, -180.0), min(bbox.east, 180.0)
+        if south > north or west > east:
+            return np.empty(0, dtype=np.intp)
+
+        first_row, last_row = self._row(south), self._row(north)
+        first_col, last_col = self._col(west), self._col(east)
+        row_starts = np.arange(first_row, last_row + 1) * self._cols
+        starts = self._starts[row_starts + first_col]
+        ends = self._starts[row_starts + last_col + 1]
+        candidates = self._order[_ranges(starts, ends)]
+
+        lat, lon = self.latitude[candidates], self.longitude[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return candidates[inside]
+
+    def nearest(self, lat: float, lon: float, n: int = 10) -> np.ndarray:
+        """Indices of the n stations closest to the point, closest first"""
+        n = min(n, len(self))
+        if n == 0:
+            return np.empty(0, dtype=np.intp)
+        radius_km = 4 * self.cell_degrees * KM_PER_DEGREE
+        while radius_km < math.pi * EARTH_RADIUS_KM:
+            candidates = self.within(BBox.around(lat, lon, radius_km))
+            if len(candidates) < n:
+                radius_km *= 4
+                continue
+            distances = haversine_km(
+                lat, lon, self.latitude[candidates], self.longitude[candidates]
+            )
+            closest = np.argsort(distances, kind="stable")[:n]
+            # Anything outside the box is further than radius_km away
+            if distances[closest[-1]] <= radius_km:
+                return candidates[closest]
+            radius_km = float(distances[closest[-1]])
+
+        distances = haversine_km(lat, lon, self.latitude, self.longitude)
+        return np.argsort(distances, kind="stable")[:n]
+
+    def clusters(
+        self,
+        catalog: pl.DataFrame,
+        bbox: BBox = WORLD,
+        zoom: float = 2,
+        mask: Optional[np.ndarray] = None,
+    ) -> pl.DataFrame:
+        """Stations in the viewport aggregated into clusters for the zoom level.
+
+        Clusters of a single station keep that station's ID, NAME, STATE and
+        NUM_YEARS so they can be selected. Larger clusters have a null ID and
+        COUNT stations.
+        """
+        indices = self.within(bbox)
+        if mask is not None:
+            indices = indices[mask[indices]]
+        cell_degrees = 360 / (2**zoom * TILE_PIXELS / CLUSTER_PIXELS)
+
+        return (
+            catalog[indices]
+            .with_columns(
+                CELL_ROW=((pl.col("LATITUDE") + 90) // cell_degrees).cast(pl.Int32),
+                CELL_COL=((pl.col("LONGITUDE") + 180) // cell_degrees).cast(pl.Int32),
+            )
+            .group_by("CELL_ROW", "CELL_COL")
+            .agg(
+                pl.len().alias("COUNT"),
+                pl.col("LATITUDE", "LONGITUDE").mean(),
+                pl.col("ID", "NAME", "STATE").first(),
+                pl.col("NUM_YEARS").max(),
+                pl.col("LATITUDE").min().alias("SOUTH"),
+                pl.col("LATITUDE").max().alias("NORTH"),
+                pl.col("LONGITUDE").min().alias("WEST"),
+                pl.col("LONGITUDE").max().alias("EAST"),
+            )
+            .with_columns(
+                pl.when(pl.col("COUNT") > 1)
+                .then(pl.lit(None))
+                .otherwise(pl.col(c))
+                .alias(c)
+                for c in ["ID", "STATE"]
+            )
+            .with_columns(
+                NAME=pl.when(pl.col("COUNT") > 1)
+                .then(pl.format("{} stations", pl.col("COUNT")))
+                .otherwise(pl.col("NAME"))
+            )
+            .drop("CELL_ROW", "CELL_COL")
+            .sort("COUNT", descending=True)
+        )
+
+    def _cell(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        return self._row(lat) * self._cols + self._col(lon)
+
+    def _row(self, lat):
+        return np.clip(
+            np.floor((np.asarray(lat) + 90) / self.cell_degrees), 0, self._rows - 1
+        ).astype(np.intp)
+
+    def _col(self, lon):
+        return np.clip(
+            np.floor((np.asarray(lon) + 180) / self.cell_degrees), 0, self._cols - 1
+        ).astype(np.intp)
+
+
+def zoom_for(bbox: BBox) -> float:
+    """Map zoom level that roughly fits the bounding box"""
+    span = max(bbox.east - bbox.west, (bbox.north - bbox.south) * 2, 1e-3)
+    return float(np.clip(math.log2(360 / span), 0, 16))
+
+
+def haversine_km(
+    lat: float, lon: float, lats: np.ndarray, lons: np.ndarray
+) -> np.ndarray:
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) for each pair, without a loop"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.intp)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return (np.arange(total) + offsets).astype(np.intp)
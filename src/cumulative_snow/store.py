@@ -0,0 +1,409 @@
+"""Local DuckDB database of already pivoted daily data.
+
+Pivoting a station's raw GHCNd rows (one row per element per day) into one row
+per day is the slowest step between downloading and plotting. The result is
+stored per station along with a hash of the source partitions it was built
+from, so revisiting a station reads an indexed table until NOAA changes the
+station's files.
+
+NOAA updates the files daily, and usually the only rows that change are in
+the current winter. So a station that was already stored only has rows from
+the start of its latest stored winter onward re-read and replaced, and
+CUMULATIVE_SNOW is recomputed for those winters alone.
+
+Daily values stay in GHCNd's integer units and are converted when plotted
+(see units.py). A monthly climatology cube (see climatology.monthly_cube) in
+inches and degrees F is kept alongside the daily rows and updated with them.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+import duckdb
+import pyarrow as pa
+
+from cumulative_snow import profiling
+from cumulative_snow.fetch import ObjectInfo
+from cumulative_snow.load_data import WINTER_START_MONTH
+from cumulative_snow.units import ELEMENTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "cumulative_snow", "daily.db")
+
+DEFAULT_MIN_YEAR = 1971
+# Bump when the tables change so older databases are rebuilt
+SCHEMA_VERSION = 3
+
+# Called with the first date needed, returns raw GHCNd rows from then on
+RawReader = Callable[[date], pa.Table]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    ID VARCHAR NOT NULL,
+    DATE DATE NOT NULL,
+    -- GHCNd units, NULL when missing. Tenths of degrees C
+    TMAX SMALLINT,
+    TAVG SMALLINT,
+    TMIN SMALLINT,
+    -- Tenths of mm
+    PRCP SMALLINT,
+    -- mm
+    SNOW SMALLINT,
+    SNWD SMALLINT,
+    -- mm since the start of the winter
+    CUMULATIVE_SNOW INTEGER NOT NULL,
+    PRIMARY KEY (ID, DATE)
+);
+CREATE TABLE IF NOT EXISTS materialized (
+    ID VARCHAR PRIMARY KEY,
+    SOURCE_HASH VARCHAR NOT NULL,
+    MIN_YEAR INTEGER NOT NULL,
+    -- Last DATE stored
+    HIGH_WATER DATE,
+    -- When SOURCE_HASH was last compared with NOAA's files
+    CHECKED_AT TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS monthly (
+    ID VARCHAR NOT NULL,
+    YEAR INTEGER NOT NULL,
+    MONTH TINYINT NOT NULL,
+    DAYS INTEGER NOT NULL,
+    SNOW DECIMAL(8, 2) NOT NULL,
+    TAVG_MEAN DOUBLE,
+    TAVG_COUNT INTEGER NOT NULL,
+    TMAX_MEAN DOUBLE,
+    TMAX_COUNT INTEGER NOT NULL,
+    TMIN_MEAN DOUBLE,
+    TMIN_COUNT INTEGER NOT NULL,
+    PRIMARY KEY (ID, YEAR, MONTH)
+);
+CREATE TABLE IF NOT EXISTS schema_version (VERSION INTEGER NOT NULL);
+"""
+
+# Reads raw GHCNd rows from the relation named raw. DATE is parsed once per
+# row before pivoting. Every real reading fits in a SMALLINT in GHCNd's units,
+# so anything that doesn't is a bad value and left NULL.
+_PIVOT_SQL = """
+WITH
+    parsed AS (
+        SELECT
+            ID,
+            strptime(DATE, '%Y%m%d')::DATE AS DATE,
+            ELEMENT,
+            TRY_CAST(DATA_VALUE AS SMALLINT) AS DATA_VALUE
+        FROM raw
+        WHERE ELEMENT IN {elements}
+    )
+PIVOT (
+    SELECT ID, DATE, ELEMENT, DATA_VALUE
+    FROM parsed
+    WHERE DATE >= make_date({min_year}, 1, 1)
+) ON ELEMENT IN {elements} USING FIRST(DATA_VALUE)
+GROUP BY ID, DATE
+ORDER BY ID, DATE
+"""
+
+_WINTER_YEAR_SQL = f"(year(DATE) - (month(DATE) < {WINTER_START_MONTH})::INTEGER)"
+
+# Replaces CUMULATIVE_SNOW for the station's rows from $start on, which must
+# be the start of a winter
+_CUMULATIVE_SQL = f"""
+UPDATE daily
+SET CUMULATIVE_SNOW = running.TOTAL
+FROM (
+    SELECT
+        DATE,
+        COALESCE(
+            SUM(SNOW) OVER (PARTITION BY {_WINTER_YEAR_SQL} ORDER BY DATE), 0
+        ) AS TOTAL
+    FROM daily
+    WHERE ID = $id AND DATE >= $start
+) running
+WHERE daily.ID = $id AND daily.DATE = running.DATE
+"""
+
+# Rebuilds the station's monthly rows from $start on, which must be the
+# start of a month. Converted to inches and degrees F like plots show them.
+_MONTHLY_SQL = """
+INSERT INTO monthly
+SELECT
+    ID,
+    year(DATE) AS YEAR,
+    month(DATE) AS MONTH,
+    count(*) AS DAYS,
+    ROUND(COALESCE(sum(SNOW), 0) / 25.4, 2) AS SNOW,
+    avg(TAVG) / 10 * 1.8 + 32,
+    count(TAVG),
+    avg(TMAX) / 10 * 1.8 + 32,
+    count(TMAX),
+    avg(TMIN) / 10 * 1.8 + 32,
+    count(TMIN)
+FROM daily
+WHERE ID = $id AND DATE >= $start
+GROUP BY ID, YEAR, MONTH
+"""
+
+_SELECT_MONTHLY = """
+SELECT * REPLACE (SNOW::DOUBLE AS SNOW)
+FROM monthly
+WHERE ID = $id AND YEAR BETWEEN $start_year AND $end_year
+ORDER BY YEAR, MONTH
+"""
+
+_SELECT_STATION = f"""
+SELECT ID, DATE, {", ".join(ELEMENTS)}, CUMULATIVE_SNOW
+FROM daily
+WHERE ID = $id AND DATE >= make_date($min_year, 1, 1)
+ORDER BY DATE
+"""
+
+
+def pivot_sql(min_year: int = DEFAULT_MIN_YEAR) -> str:
+    """Query pivoting the raw GHCNd relation named raw into one row per day"""
+    elements = "(" + ", ".join(f"'{e}'" for e in ELEMENTS) + ")"
+    return _PIVOT_SQL.format(elements=elements, min_year=int(min_year))
+
+
+def winter_start(day: date) -> date:
+    """First day of the winter the day is in"""
+    year = day.year - (day.month < WINTER_START_MONTH)
+    return date(year, WINTER_START_MONTH, 1)
+
+
+def source_hash(objects: Iterable[ObjectInfo]) -> str:
+    """Content hash of a station's partition files from their S3 ETags"""
+    h = hashlib.sha256()
+    for obj in sorted(objects, key=lambda o: o.key):
+        h.update(f"{obj.key}\0{obj.etag}\0{obj.size}\n".encode())
+    return h.hexdigest()
+
+
+class DailyStore:
+    """Per station pivoted daily data in GHCNd units in a DuckDB database file"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._con = duckdb.connect(path)
+        self._migrate()
+        # DuckDB connections aren't safe to share between threads
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._con.close()
+
+    def checkpoint(self) -> None:
+        """Writes everything in the write-ahead log to the database file, so
+        copying the file alone captures it"""
+        with self._lock:
+            self._con.execute("CHECKPOINT")
+
+    def get(
+        self, station: str, source: str, min_year: int = DEFAULT_MIN_YEAR
+    ) -> Optional[pa.Table]:
+        """The station's daily data if it was materialized from the same source
+        partitions and covers min_year, else None"""
+        with self._lock:
+            row = self._status(station)
+            if row is None or row[0] != source or row[1] > min_year:
+                return None
+            # The caller just listed the source files, so they're current
+            self._con.execute(
+                "UPDATE materialized SET CHECKED_AT = ? WHERE ID = ?",
+                [datetime.now(), station],
+            )
+            return self._read(station, min_year)
+
+    def get_recent(
+        self, station: str, max_age_seconds: float, min_year: int = DEFAULT_MIN_YEAR
+    ) -> Optional[pa.Table]:
+        """The station's daily data if it covers min_year and was checked
+        against NOAA's files within max_age_seconds, without listing them"""
+        with self._lock:
+            row = self._status(station)
+            if row is None or row[1] > min_year:
+                return None
+            if datetime.now() - row[3] > timedelta(seconds=max_age_seconds):
+                return None
+            return self._read(station, min_year)
+
+    def high_water(self, station: str) -> Optional[date]:
+        """The last DATE stored for the station"""
+        with self._lock:
+            row = self._status(station)
+            return row[2] if row else None
+
+    def monthly(
+        self,
+        station: str,
+        start_year: Optional[int] = None,
+        end_year: Optional[int] = None,
+    ) -> pa.Table:
+        """The station's monthly climatology cube rows for the years"""
+        with self._lock:
+            result = self._con.execute(
+                _SELECT_MONTHLY,
+                {
+                    "id": station,
+                    "start_year": start_year if start_year is not None else 0,
+                    "end_year": end_year if end_year is not None else 9999,
+                },
+            )
+            return pa.table(result.arrow())
+
+    def put(
+        self,
+        station: str,
+        source: str,
+        raw: pa.Table,
+        min_year: int = DEFAULT_MIN_YEAR,
+    ) -> pa.Table:
+        """Pivots the station's raw GHCNd rows and replaces what's stored"""
+        with self._lock, profiling.span("pivot") as span:
+            self._replace(station, source, raw, min_year, since=date.min)
+            table = self._select(station, min_year)
+            span.rows = table.num_rows
+            return table
+
+    def update(
+        self,
+        station: str,
+        source: str,
+        raw: pa.Table,
+        since: date,
+        min_year: int = DEFAULT_MIN_YEAR,
+    ) -> pa.Table:
+        """Replaces the station's rows from since on with the pivoted raw rows,
+        returning its data from min_year on. since must be the start of a
+        winter, as CUMULATIVE_SNOW is only recomputed from then on."""
+        with self._lock:
+            row = self._status(station)
+            if row is None:
+                raise KeyError(f"{station} isn't stored")
+            with profiling.span("pivot") as span:
+                # Stored from the year it was first stored from, not min_year
+                self._replace(station, source, raw, row[1], since)
+                table = self._select(station, min_year)
+                span.rows = raw.num_rows
+            return table
+
+    def load(
+        self,
+        station: str,
+        source: str,
+        read_raw: RawReader,
+        min_year: int = DEFAULT_MIN_YEAR,
+    ) -> pa.Table:
+        """The station's daily data, calling read_raw to read only what isn't
+        already stored.
+
+        When the source files changed since the station was stored, only rows
+        from the start of the latest stored winter are read again.
+        """
+        table = self.get(station, source, min_year)
+        if table is not None:
+            return table
+
+        with self._lock:
+            row = self._status(station)
+        if row is not None and row[1] <= min_year and row[2] is not None:
+            since = winter_start(row[2])
+            logger.info("Updating %s from %s", station, since)
+            return self.update(station, source, read_raw(since), since, min_year)
+
+        logger.info("Storing %s from %d", station, min_year)
+        return self.put(station, source, read_raw(date(min_year, 1, 1)), min_year)
+
+    def _replace(
+        self,
+        station: str,
+        source: str,
+        raw: pa.Table,
+        min_year: int,
+        since: date,
+    ) -> None:
+        con = self._con
+        con.begin()
+        try:
+            con.register("raw", raw)
+            con.execute(
+                "DELETE FROM daily WHERE ID = ? AND DATE >= ?", [station, since]
+            )
+            con.execute(
+                f"INSERT INTO daily SELECT *, 0 FROM ({pivot_sql(min_year)}) "
+                "WHERE ID = ? AND DATE >= ?",
+                [station, since],
+            )
+            con.execute(_CUMULATIVE_SQL, {"id": station, "start": since})
+            con.execute(
+                "DELETE FROM monthly WHERE ID = ? AND make_date(YEAR, MONTH, 1) >= ?",
+                [station, since],
+            )
+            con.execute(_MONTHLY_SQL, {"id": station, "start": since})
+            con.execute(
+                """
+                INSERT OR REPLACE INTO materialized
+                SELECT ?, ?, ?, max(DATE), ? FROM daily WHERE ID = ?
+                """,
+                [station, source, min_year, datetime.now(), station],
+            )
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            con.unregister("raw")
+
+    def _read(self, station: str, min_year: int) -> pa.Table:
+        with profiling.span("read_store") as span:
+            table = self._select(station, min_year)
+            span.rows = table.num_rows
+        return table
+
+    def _status(
+        self, station: str
+    ) -> Optional[tuple[str, int, Optional[date], datetime]]:
+        return self._con.execute(
+            "SELECT SOURCE_HASH, MIN_YEAR, HIGH_WATER, CHECKED_AT FROM materialized "
+            "WHERE ID = ?",
+            [station],
+        ).fetchone()  # pyright: ignore[reportReturnType]
+
+    def _migrate(self) -> None:
+        # Everything here can be rebuilt from NOAA, so older databases are
+        # dropped rather than migrated
+        tables = {
+            name
+            for (name,) in self._con.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE database_name = "
+                "current_database()"
+            ).fetchall()
+        }
+        version = None
+        if "schema_version" in tables:
+            row = self._con.execute(
+                "SELECT max(VERSION) FROM schema_version"
+            ).fetchone()
+            version = row[0] if row else None
+        if tables and version != SCHEMA_VERSION:
+            for name in tables:
+                self._con.execute(f"DROP TABLE {name}")
+        self._con.execute(_SCHEMA)
+        if version != SCHEMA_VERSION:
+            self._con.execute("INSERT INTO schema_version VALUES (?)", [SCHEMA_VERSION])
+
+    def _select(self, station: str, min_year: int) -> pa.Table:
+        result = self._con.execute(
+            _SELECT_STATION, {"id": station, "min_year": min_year}
+        )
+        # A Table before DuckDB 1.5 and a RecordBatchReader after
+        table = pa.table(result.arrow())
+        # Every row has the same ID
+        return table.set_column(0, "ID", table["ID"].dictionary_encode())
@@ -0,0 +1,208 @@
+"""Deterministic synthetic GHCNd-shaped data for tests and benchmarks.
+
+Each station gets a seasonal temperature cycle, precipitation events that
+fall as snow below freezing, and a snow depth that builds up and melts. The
+same seed always gives the same data, and every station's values depend only
+on the seed and the station's index, so any subset can be regenerated.
+
+Data is written like the real sources: raw GHCNd rows to by-station or
+by-year parquet files partitioned by ELEMENT, or converted units to an NCEI
+style CSV export.
+"""
+
+import os
+from datetime import date
+from typing import Optional, Sequence
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cumulative_snow.units import ELEMENTS
+
+DEFAULT_END_YEAR = 2020
+DEFAULT_SEED = 0
+
+
+def station_id(index: int) -> str:
+    return f"SYN{index:08d}"
+
+
+def stations(n: int, seed: int = DEFAULT_SEED) -> pl.DataFrame:
+    """n stations with the columns of ghcnd-stations.txt"""
+    rng = np.random.default_rng([seed, n])
+    states = np.array(["CO", "UT", "MT", "WY", "ID", "VT", "NH", "ME", "NY", "MI"])
+    return pl.DataFrame(
+        {
+            "ID": [station_id(i) for i in range(n)],
+            "LATITUDE": rng.uniform(25, 70, n).round(4),
+            "LONGITUDE": rng.uniform(-160, -60, n).round(4),
+            "ELEVATION": rng.uniform(0, 3500, n).round(1),
+            "STATE": states[rng.integers(0, len(states), n)],
+            "NAME": [f"SYNTHETIC STATION {i}" for i in range(n)],
+        }
+    )
+
+
+def raw_daily(
+    index: int,
+    years: int,
+    end_year: int = DEFAULT_END_YEAR,
+    seed: int = DEFAULT_SEED,
+    station: Optional[str] = None,
+) -> pa.Table:
+    """The station's raw GHCNd rows (ID, DATE, ELEMENT, DATA_VALUE) in GHCNd
+    units: tenths of degrees C, tenths of mm of precipitation and mm of snow.
+    Covers whole winters ending June 30th of end_year. The rows' ID is
+    station, or station_id(index) by default."""
+    rng = np.random.default_rng([seed, index])
+    days = np.arange(
+        np.datetime64(date(end_year - years, 7, 1)),
+        np.datetime64(date(end_year, 7, 1)),
+    )
+    n = len(days)
+    day_of_year = (days - days.astype("datetime64[Y]")).astype(np.int64)
+
+    # Warmest in late July, colder and wetter for stations further down the list
+    mean_c = 8 - (index % 7) + 14 * np.cos(2 * np.pi * (day_of_year - 200) / 365.25)
+    tavg = mean_c + rng.normal(0, 4, n)
+    spread = rng.uniform(3, 8, n)
+    precip_mm = np.where(rng.random(n) < 0.3, rng.gamma(1.2, 6.0, n), 0.0)
+    # Roughly 10:1 snow to liquid ratio when below freezing
+    snow_mm = np.where(tavg < 0, precip_mm * 10, 0.0)
+    snwd_mm = _snow_depth(snow_mm, tavg)
+
+    values = {
+        "TMAX": np.round((tavg + spread) * 10),
+        "TAVG": np.round(tavg * 10),
+        "TMIN": np.round((tavg - spread) * 10),
+        "PRCP": np.round(precip_mm * 10),
+        "SNOW": np.round(snow_mm),
+        "SNWD": np.round(snwd_mm),
+    }
+    # Like real stations, some readings are missing
+    present = {e: rng.random(n) > 0.02 for e in ELEMENTS}
+    dates = np.char.replace(np.datetime_as_string(days, unit="D"), "-", "")
+    elements = np.concatenate([np.full(present[e].sum(), e) for e in ELEMENTS])
+
+    return pa.table(
+        {
+            "ID": pa.array(np.full(len(elements), station or station_id(index))),
+            "DATE": np.concatenate([dates[present[e]] for e in ELEMENTS]),
+            "ELEMENT": elements,
+            "DATA_VALUE": np.concatenate(
+                [values[e][present[e]].astype(np.int32) for e in ELEMENTS]
+            ),
+        }
+    )
+
+
+def ncei_daily(
+    index: int,
+    years: int,
+    end_year: int = DEFAULT_END_YEAR,
+    seed: int = DEFAULT_SEED,
+) -> pl.DataFrame:
+    """The station's data as an NCEI CSV export has it: one row per day in
+    inches and degrees F, with missing readings left empty"""
+    raw = pl.DataFrame(raw_daily(index, years, end_year, seed))
+    wide = raw.pivot(on="ELEMENT", index=["ID", "DATE"], values="DATA_VALUE")
+    return wide.sort("DATE").select(
+        pl.col("ID").alias("STATION"),
+        pl.lit(f"SYNTHETIC STATION {index}, XX US").alias("NAME"),
+        pl.col("DATE").str.to_date("%Y%m%d"),
+        (pl.col("SNOW") / 25.4).round(1).alias("SNOW"),
+        (pl.col("SNWD") / 25.4).round(1).alias("SNWD"),
+        *(
+            (pl.col(t) / 10 * 1.8 + 32).round(0).alias(t)
+            for t in ("TAVG", "TMAX", "TMIN")
+        ),
+    )
+
+
+def write_parquet(
+    root: str,
+    n_stations: int,
+    years: int,
+    end_year: int = DEFAULT_END_YEAR,
+    seed: int = DEFAULT_SEED,
+    ids: Optional[Sequence[str]] = None,
+) -> list[str]:
+    """Writes root/parquet/by_station/STATION=<ID>/ELEMENT=<E>/data.parquet
+    like the NOAA bucket, returning the paths written. ids replaces the
+    synthetic station IDs, e.g. to stand in for real stations."""
+    paths = []
+    for index in range(n_stations):
+        station = ids[index] if ids is not None else station_id(index)
+        raw = raw_daily(index, years, end_year, seed, station)
+        for element in ELEMENTS:
+            rows = raw.filter(pc.equal(raw["ELEMENT"], element))
+            directory = os.path.join(
+                root,
+                "parquet",
+                "by_station",
+                f"STATION={station}",
+                f"ELEMENT={element}",
+            )
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "data.parquet")
+            pq.write_table(
+                rows.drop_columns(["ELEMENT"]), path, row_group_size=366 * 10
+            )
+            paths.append(path)
+    return paths
+
+
+def write_by_year(
+    root: str,
+    n_stations: int,
+    years: int,
+    end_year: int = DEFAULT_END_YEAR,
+    seed: int = DEFAULT_SEED,
+    elements: Sequence[str] = ELEMENTS,
+) -> list[str]:
+    """Writes root/YEAR=<Y>/ELEMENT=<E>/data.parquet with every station's
+    rows, like the NOAA bucket's parquet/by_year, returning the paths written"""
+    raw = pa.concat_tables(
+        raw_daily(index, years, end_year, seed) for index in range(n_stations)
+    )
+    year = pc.utf8_slice_codeunits(raw["DATE"], 0, 4)
+    raw = raw.append_column("Q_FLAG", pa.nulls(raw.num_rows, pa.string()))
+    paths = []
+    for y in pc.unique(year).to_pylist():
+        for element in elements:
+            mask = pc.and_(pc.equal(year, y), pc.equal(raw["ELEMENT"], element))
+            directory = os.path.join(root, f"YEAR={y}", f"ELEMENT={element}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "data.parquet")
+            pq.write_table(raw.filter(mask).drop_columns(["ELEMENT"]), path)
+            paths.append(path)
+    return paths
+
+
+def write_csv(
+    path: str,
+    n_stations: int,
+    years: int,
+    end_year: int = DEFAULT_END_YEAR,
+    seed: int = DEFAULT_SEED,
+) -> None:
+    """Writes an NCEI style CSV export of all the stations, one station at a
+    time so memory stays flat at any scale"""
+    with open(path, "w", newline="") as f:
+        for index in range(n_stations):
+            frame = ncei_daily(index, years, end_year, seed).with_columns(
+                pl.col("DATE").dt.strftime("%Y-%m-%d")
+            )
+            f.write(frame.write_csv(include_header=index == 0, quote_style="always"))
+
+
+def _snow_depth(snow_mm: np.ndarray, tavg: np.ndarray) -> np.ndarray:
+    """Depth that grows with snowfall and melts a few mm per degree above
+    freezing, never going below zero"""
+    change = snow_mm - np.clip(tavg, 0, None) * 4
+    # The running total less the lowest it has been below zero so far
+    total = np.cumsum(change)
+    return total - np.minimum.accumulate(np.minimum(total, 0))
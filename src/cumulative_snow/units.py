@@ -0,0 +1,50 @@
+"""GHCNd's native units and their conversion to the units plots show.
+
+Stored daily data keeps GHCNd's integers: tenths of degrees C for
+temperatures, tenths of mm for precipitation and mm for snow, as int16 Arrow
+columns whose nulls are validity bitmasks, with DATE as int32 days since the
+Unix epoch (date32). That's about a third of the size of the same rows as
+float64 inches and degrees F, and since rows are sorted by DATE a winter is a
+zero-copy table.slice(). Values are only converted when plotting.
+"""
+
+from typing import Union
+
+import polars as pl
+import pyarrow as pa
+
+TEMPERATURE_ELEMENTS = ("TMAX", "TAVG", "TMIN")
+# Missing readings count as no precipitation or snow
+ZERO_FILLED_ELEMENTS = ("PRCP", "SNOW", "SNWD")
+# Elements pivoted into columns of the daily table
+ELEMENTS = TEMPERATURE_ELEMENTS + ZERO_FILLED_ELEMENTS
+
+# Native units per display unit: tenths of mm or mm per inch
+_PER_INCH = {"PRCP": 254.0, "SNOW": 25.4, "SNWD": 25.4, "CUMULATIVE_SNOW": 25.4}
+
+
+def fahrenheit(column: str) -> pl.Expr:
+    """Tenths of degrees C to degrees F"""
+    return (pl.col(column) / 10 * 1.8 + 32).round(2)
+
+
+def inches(column: str) -> pl.Expr:
+    """Tenths of mm for PRCP, mm for snow columns, to inches"""
+    return (pl.col(column) / _PER_INCH[column]).round(2)
+
+
+def to_display_units(data: Union[pa.Table, pl.DataFrame, pl.LazyFrame]) -> pl.LazyFrame:
+    """Converts native unit daily rows to inches and degrees F as float64,
+    with missing precipitation and snow as 0 and station IDs as strings"""
+    frame = pl.DataFrame(data).lazy() if isinstance(data, pa.Table) else data.lazy()
+    schema = frame.collect_schema()
+    return frame.with_columns(
+        *(
+            pl.col(c).cast(pl.String)
+            for c in ("ID", "STATION")
+            if c in schema and schema[c] != pl.String
+        ),
+        *(fahrenheit(c) for c in TEMPERATURE_ELEMENTS if c in schema),
+        *(inches(c).fill_null(0.0) for c in ZERO_FILLED_ELEMENTS if c in schema),
+        *(inches(c) for c in ["CUMULATIVE_SNOW"] if c in schema),
+    )
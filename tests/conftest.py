@@ -2,19 +2,32 @@ import logging
 import socket
 import subprocess
 import threading
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from collections import Counter
+from datetime import date
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+    SimpleHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, Optional
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
 
+import numpy as np
+import polars as pl
 import pytest
 
+from cumulative_snow import load_data
+
 logger = logging.getLogger(__name__)
 
 
 REPO_ROOT = Path(__file__).parent / ".."
 
 
-@pytest.fixture(scope="session", autouse=True)
+@pytest.fixture(scope="session")
 def build_wasm():
     # Run ../build_wasm.sh
     script = REPO_ROOT / "build_wasm.sh"
@@ -22,6 +35,17 @@ def build_wasm():
     logger.info("Built WASM: %s", res.stdout)
 
 
+@pytest.fixture(scope="session")
+def century_of_snow() -> pl.DataFrame:
+    """A hundred winters at one station, loaded with load_noaa_data()"""
+    dates = pl.date_range(date(1920, 7, 1), date(2020, 6, 30), eager=True)
+    rng = np.random.default_rng(0)
+    snow = np.where(rng.random(len(dates)) < 0.1, rng.gamma(2.0, 2.0, len(dates)), 0)
+    return load_data.load_noaa_data(
+        pl.DataFrame({"STATION": "X", "DATE": dates, "SNOW": snow.round(1)})
+    )
+
+
 @pytest.fixture(scope="session")
 def port() -> int:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -29,8 +53,8 @@ def port() -> int:
         return s.getsockname()[1]
 
 
-@pytest.fixture(scope="session", autouse=True)
-def local_server(port: int):
+@pytest.fixture(scope="session")
+def local_server(build_wasm: None, port: int):
     def handler(*args: Any, **kwargs: Any):
         return SimpleHTTPRequestHandler(*args, directory=REPO_ROOT / "build", **kwargs)
 
@@ -41,3 +65,120 @@ def local_server(port: int):
     yield
     server.shutdown()
     server_thread.join()
+
+
+class FakeBucket:
+    """Local stand-in for the public NOAA S3 bucket.
+
+    Serves objects with ETags, answers ListObjectsV2 a few keys per page and
+    can be told to fail requests to test retries.
+    """
+
+    page_size = 2
+
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = {}
+        self.requests: Counter[str] = Counter()
+        self.failures: Counter[str] = Counter()
+        self.connections = 0
+        self.bytes_sent = 0
+        self.url = ""
+
+    def etag(self, key: str) -> str:
+        return f'"{hash(self.objects[key]) & 0xFFFFFFFF:x}"'
+
+    def list_page(self, prefix: str, token: str) -> bytes:
+        keys = sorted(k for k in self.objects if k.startswith(prefix))
+        start = int(token or 0)
+        page = keys[start : start + self.page_size]
+        truncated = start + self.page_size < len(keys)
+        contents = "".join(
+            f"<Contents><Key>{escape(k)}</Key><ETag>{escape(self.etag(k))}</ETag>"
+            f"<Size>{len(self.objects[k])}</Size></Contents>"
+            for k in page
+        )
+        next_token = (
+            f"<NextContinuationToken>{start + self.page_size}</NextContinuationToken>"
+            if truncated
+            else ""
+        )
+        return (
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<IsTruncated>{str(truncated).lower()}</IsTruncated>"
+            f"{contents}{next_token}</ListBucketResult>"
+        ).encode()
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int]:
+    first, last = header.removeprefix("bytes=").split("-")
+    if not first:
+        return max(size - int(last), 0), size
+    return int(first), min(int(last) + 1, size) if last else size
+
+
+@pytest.fixture
+def fake_bucket() -> Iterator[FakeBucket]:
+    bucket = FakeBucket()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self) -> None:
+            super().setup()
+            bucket.connections += 1
+
+        def do_GET(self) -> None:
+            parts = urlsplit(self.path)
+            key = parts.path.lstrip("/")
+            bucket.requests[key] += 1
+            if bucket.failures[key] > 0:
+                bucket.failures[key] -= 1
+                return self._send(503, b"Slow Down")
+            if not key:
+                query = parse_qs(parts.query)
+                body = bucket.list_page(
+                    query["prefix"][0], query.get("continuation-token", [""])[0]
+                )
+                return self._send(200, body)
+            if key not in bucket.objects:
+                return self._send(404, b"")
+            etag = bucket.etag(key)
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, b"")
+            body = bucket.objects[key]
+            byte_range = self.headers.get("Range")
+            if byte_range:
+                start, end = _parse_range(byte_range, len(body))
+                bucket.bytes_sent += end - start
+                return self._send(
+                    206,
+                    body[start:end],
+                    {
+                        "ETag": etag,
+                        "Content-Range": f"bytes {start}-{end - 1}/{len(body)}",
+                    },
+                )
+            bucket.bytes_sent += len(body)
+            self._send(200, body, {"ETag": etag})
+
+        def _send(
+            self, status: int, body: bytes, headers: Optional[dict] = None
+        ) -> None:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    bucket.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    yield bucket
+    server.shutdown()
+    server.server_close()
+    server_thread.join()
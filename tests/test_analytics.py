@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import polars as pl
+
+from cumulative_snow import synthetic
+from cumulative_snow.analytics import SnowAnalytics
+
+
+def test_winter_totals_and_statistics(tmp_path: Path) -> None:
+    source = tmp_path / "by_year"
+    synthetic.write_by_year(str(source), n_stations=4, years=6)
+    analytics = SnowAnalytics(str(tmp_path / "out"), memory_limit="256MB", threads=1)
+
+    written = analytics.build_winter_totals(str(source))
+    assert written == list(range(2013, 2021))
+    # Only the latest winter, which may still be open, is built again
+    assert analytics.build_winter_totals(str(source)) == [2020]
+
+    raw = pl.DataFrame(synthetic.raw_daily(2, 6)).filter(
+        (pl.col("ELEMENT") == "SNOW")
+        & pl.col("DATE").is_between(pl.lit("20170701"), pl.lit("20180630"))
+    )
+    ranks = analytics.percentile_ranks(2017, min_days=300)
+    assert ranks["ID"].to_pylist() == [synthetic.station_id(i) for i in range(4)]
+    assert ranks["SNOW"][2].as_py() == raw["DATA_VALUE"].sum()
+    assert ranks["WINTERS"].to_pylist() == [6] * 4
+    assert all(0 <= r <= 1 for r in ranks["PERCENT_RANK"].to_pylist())
+
+    anomalies = analytics.anomalies(
+        2017, normals=(2014, 2019), min_normal_winters=6, min_days=300
+    )
+    normal = (
+        pl.concat(
+            pl.DataFrame(analytics.percentile_ranks(w, min_days=300))
+            for w in range(2014, 2020)
+        )
+        .group_by("ID")
+        .agg(pl.col("SNOW").mean())
+    )
+    assert anomalies.num_rows == 4
+    assert anomalies["NORMAL"].to_pylist() == normal.sort("ID")["SNOW"].to_list()
+    no_normals = analytics.anomalies(2017, normals=(2014, 2019), min_normal_winters=7)
+    assert no_normals.num_rows == 0
+
+    stations = synthetic.stations(4).to_arrow()
+    top = pl.DataFrame(analytics.top_winters(stations, n=2, min_days=300))
+    assert top.group_by("STATE").len()["len"].max() == 2
+    for _, group in top.group_by("STATE"):
+        assert group["SNOW"].is_sorted(descending=True)
+    assert set(top["ID"]) <= set(stations["ID"].to_pylist())
+    analytics.close()
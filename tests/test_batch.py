@@ -0,0 +1,143 @@
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import ClassVar, Sequence
+
+import pytest
+
+from cumulative_snow import batch, load_data
+
+
+def _write_csv(path: Path, stations: Sequence[str], months: Sequence[int] = (11, 12)):
+    lines = ['"STATION","NAME","DATE","SNOW","TMAX"']
+    for station in stations:
+        for month in months:
+            for day in range(1, 29):
+                lines.append(
+                    f'"{station}","{station} PEAK","2011-{month}-{day:02d}",'
+                    f'"{day % 3}","{20 + day}"'
+                )
+    path.write_text("\n".join(lines) + "\n")
+
+
+class TrackingExecutor(ThreadPoolExecutor):
+    """Stands in for the process pool, recording the most stations that were
+    submitted but not yet written at once"""
+
+    instances: ClassVar[list["TrackingExecutor"]] = []
+
+    def __init__(self, max_workers=None, mp_context=None) -> None:
+        super().__init__(max_workers)
+        self.futures: list[Future] = []
+        self.most_pending = 0
+        TrackingExecutor.instances.append(self)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        pending = sum(not f.done() for f in self.futures) + 1
+        self.most_pending = max(self.most_pending, pending)
+        future = super().submit(fn, *args, **kwargs)
+        self.futures.append(future)
+        return future
+
+
+def test_writes_a_report_per_station(tmp_path: Path) -> None:
+    csv = tmp_path / "export.csv"
+    _write_csv(csv, ["A", "B", "C"])
+    output_dir = tmp_path / "reports"
+    # Can't be written over, so this station's report fails
+    (output_dir / "B.html").mkdir(parents=True)
+
+    progress = []
+    reports = batch.write_reports(
+        str(csv),
+        str(output_dir),
+        stations=["A", "B", "C"],
+        max_workers=2,
+        on_progress=lambda report, n: progress.append(n),
+    )
+
+    assert sorted(progress) == [1, 2, 3]
+    by_station = {r.station: r for r in reports}
+    assert by_station["A"].ok and by_station["C"].ok
+    assert "IsADirectoryError" in (by_station["B"].error or "")
+    assert "C PEAK" in (output_dir / "C.html").read_text()
+
+    only_a = batch.write_reports(
+        str(csv), str(tmp_path / "a"), station_filter="^A", max_workers=1
+    )
+    assert [r.station for r in only_a] == ["A"]
+
+
+def test_reads_only_a_few_stations_ahead_of_the_workers(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    csv = tmp_path / "export.csv"
+    stations = [f"S{i:02d}" for i in range(12)]
+    _write_csv(csv, stations)
+    written = []
+    lock = threading.Lock()
+
+    def slow_write(station, frame, output_path, save_svgs, profile):
+        time.sleep(0.02)
+        with lock:
+            written.append(station)
+        return batch.StationReport(station, output_path)
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", TrackingExecutor)
+    monkeypatch.setattr(batch, "_write_report", slow_write)
+    # Small chunks, so stations are read as the workers go
+    monkeypatch.setattr(
+        load_data,
+        "iter_noaa_csv",
+        functools.partial(load_data.iter_noaa_csv, block_size=4096),
+    )
+
+    reports = batch.write_reports(str(csv), str(tmp_path / "out"), max_workers=1)
+
+    assert sorted(written) == stations and all(r.ok for r in reports)
+    assert TrackingExecutor.instances[-1].most_pending == batch.PENDING_PER_WORKER
+
+
+def test_rejects_stations_split_across_the_csv(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    csv = tmp_path / "export.csv"
+    _write_csv(csv, ["A", "B", "A"], months=[11])
+    monkeypatch.setattr(
+        load_data,
+        "iter_noaa_csv",
+        functools.partial(load_data.iter_noaa_csv, block_size=1024),
+    )
+
+    with pytest.raises(ValueError, match="A appears again"):
+        batch.write_reports(str(csv), str(tmp_path / "out"), max_workers=1)
+
+
+def test_stations_out_of_id_order_span_chunks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    csv = tmp_path / "export.csv"
+    _write_csv(csv, ["USW0002", "USC0001"])
+    monkeypatch.setattr(
+        load_data,
+        "iter_noaa_csv",
+        functools.partial(load_data.iter_noaa_csv, block_size=1024),
+    )
+
+    stations = batch._iter_stations(str(csv), None, None, None, None)
+
+    assert [(s, len(frame)) for s, frame in stations] == [
+        ("USW0002", 56),
+        ("USC0001", 56),
+    ]
+
+
+def test_checks_the_filter_with_polars_regex(tmp_path: Path) -> None:
+    csv = tmp_path / "export.csv"
+    _write_csv(csv, ["A"])
+
+    # Python's re accepts look-behinds, polars doesn't
+    with pytest.raises(ValueError, match="Invalid station_filter"):
+        batch.write_reports(str(csv), str(tmp_path / "out"), station_filter="(?<=A)")
@@ -0,0 +1,46 @@
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from cumulative_snow import binning, load_data, plot
+
+
+def _years_of_snow(years: int):
+    dates = pl.date_range(date(2020 - years, 7, 1), date(2020, 6, 30), eager=True)
+    rng = np.random.default_rng(1)
+    snow = np.where(rng.random(len(dates)) < 0.1, rng.gamma(2.0, 2.0, len(dates)), 0)
+    return load_data.load_noaa_data(
+        pl.DataFrame({"STATION": "X", "DATE": dates, "SNOW": snow.round(1)})
+    )
+
+
+def test_distribution_matches_numpy() -> None:
+    values = np.array([1.0, 2.0, 2.5, 3.0, 4.0, 30.0])
+
+    dist = binning.distribution(values)
+
+    np.testing.assert_allclose(
+        [dist.q1, dist.median, dist.q3], np.quantile(values, [0.25, 0.5, 0.75])
+    )
+    # 30 is an outlier past 1.5 IQR
+    assert dist.upperfence == 4.0
+    assert dist.lowerfence == 1.0
+    assert dist.grid[0] < 1.0 and dist.grid[-1] > 30.0
+    assert dist.density.max() == 1.0
+
+
+def test_binned_figures_do_not_grow_with_record_length() -> None:
+    short, long = _years_of_snow(60), _years_of_snow(120)
+
+    _, short_scatter, short_heatmap, _ = plot.plot_overlapping(short)
+    _, long_scatter, long_heatmap, long_violin = plot.plot_overlapping(long)
+
+    assert len(long_scatter.to_json()) < 1.1 * len(short_scatter.to_json())
+    assert len(long_heatmap.to_json()) < 1.1 * len(short_heatmap.to_json())
+    snow_days = int((long["SNOW"] > 0).sum())
+    assert long_heatmap.data[0].z.sum() == snow_days
+    assert sum(long_scatter.data[1].y) == snow_days
+    assert len(long_scatter.data[0].x) == binning.DEFAULT_SAMPLE_POINTS
+    # A violin per year, the boxes and the sampled points
+    assert len(long_violin.data) == 120 + 2
@@ -0,0 +1,23 @@
+import asyncio
+from pathlib import Path
+
+from cumulative_snow import browser_storage
+
+
+def test_drops_files_saved_by_another_version(tmp_path: Path, monkeypatch) -> None:
+    root = tmp_path / "cache"
+    asyncio.run(browser_storage.mount_persistent(str(root)))
+    (root / "parquet").mkdir()
+    (root / "parquet" / "data.parquet").write_bytes(b"PAR1")
+    (root / "daily.db").write_bytes(b"db")
+
+    # Nothing is mounted outside pyodide, so there's nothing to save
+    assert not asyncio.run(browser_storage.sync())
+
+    asyncio.run(browser_storage.mount_persistent(str(root)))
+    assert (root / "daily.db").exists()
+
+    monkeypatch.setattr(browser_storage, "STORAGE_VERSION", 2)
+    asyncio.run(browser_storage.mount_persistent(str(root)))
+    assert sorted(p.name for p in root.iterdir()) == [browser_storage.VERSION_NAME]
+    assert (root / browser_storage.VERSION_NAME).read_text() == "2\n"
@@ -0,0 +1,47 @@
+from pathlib import Path
+from typing import Mapping
+
+from cumulative_snow.cache import StationCache
+from cumulative_snow.fetch import FetchResult
+
+
+class FakeServer:
+    def __init__(self) -> None:
+        self.bodies = {"a": b"a" * 40, "b": b"b" * 40, "c": b"c" * 40}
+        self.requests: list[tuple[str, dict[str, str]]] = []
+
+    def fetch(self, url: str, headers: Mapping[str, str]) -> FetchResult:
+        self.requests.append((url, dict(headers)))
+        body = self.bodies[url]
+        etag = f'"{hash(body)}"'
+        if headers.get("If-None-Match") == etag:
+            return FetchResult(None)
+        return FetchResult(body, etag=etag)
+
+
+def test_revalidates_with_etag(tmp_path: Path) -> None:
+    server = FakeServer()
+    cache = StationCache(str(tmp_path), max_age_seconds=0, fetch=server.fetch)
+
+    path = cache.get("a", "STATION=A/a.parquet")
+    assert Path(path).read_bytes() == server.bodies["a"]
+    assert cache.get("a", "STATION=A/a.parquet") == path
+    assert server.requests[1][1] == {"If-None-Match": f'"{hash(b"a" * 40)}"'}
+
+    server.bodies["a"] = b"new"
+    assert Path(cache.get("a", "STATION=A/a.parquet")).read_bytes() == b"new"
+    assert not [p for p in tmp_path.rglob(".tmp-*")]
+
+
+def test_evicts_least_recently_used(tmp_path: Path) -> None:
+    server = FakeServer()
+    cache = StationCache(str(tmp_path), max_bytes=100, fetch=server.fetch)
+
+    cache.get("a", "a")
+    cache.get("b", "b")
+    cache.get("a", "a")  # Fresh, so served without a request
+    assert len(server.requests) == 2
+
+    cache.get("c", "c")
+    assert sorted(cache.entries()) == ["a", "c"]
+    assert not (tmp_path / "b").exists()
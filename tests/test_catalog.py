@@ -0,0 +1,54 @@
+from pathlib import Path
+from typing import Mapping
+
+import polars as pl
+
+from cumulative_snow import catalog
+from cumulative_snow.cache import StationCache
+from cumulative_snow.fetch import FetchResult
+
+STATIONS = b"""\
+ACW00011604  17.1167  -61.7833   10.1    ST JOHNS COOLIDGE FLD
+USW00014739  42.3606  -71.0097    3.7 MA BOSTON                         GSN     72509
+US1MAMD0001  42.4000  -71.1000   20.0 MA SHORT LINE
+"""
+
+INVENTORY = b"""\
+ACW00011604  17.1167  -61.7833 TMAX 1949 1949
+USW00014739  42.3606  -71.0097 SNOW 1936 2024
+USW00014739  42.3606  -71.0097 TMAX 1936 2024
+US1MAMD0001  42.4000  -71.1000 SNOW 2010 2012
+"""
+
+
+def test_parse_fixed_width() -> None:
+    stations = catalog.parse_fixed_width(STATIONS, catalog.STATION_COLSPECS)
+    assert stations.row(1) == ("USW00014739", 42.3606, -71.0097, 3.7, "MA", "BOSTON")
+    assert stations["STATE"][0] is None
+    assert stations["NAME"][2] == "SHORT LINE"
+
+
+def test_snapshot_rebuilt_only_when_sources_change(tmp_path: Path) -> None:
+    sources = {"s": STATIONS, "i": INVENTORY}
+    fetched = []
+
+    def fetch(url: str, headers: Mapping[str, str]) -> FetchResult:
+        fetched.append(url)
+        etag = str(hash(sources[url]))
+        if headers.get("If-None-Match") == etag:
+            return FetchResult(None)
+        return FetchResult(sources[url], etag=etag)
+
+    cache = StationCache(str(tmp_path), max_age_seconds=0, fetch=fetch)
+    first = catalog.load_catalog(cache, "s", "i")
+    assert first["ID"].to_list() == ["USW00014739", "US1MAMD0001"]
+    assert first["NUM_YEARS"].to_list() == [89, 3]
+    snapshot = tmp_path / catalog.SNAPSHOT_NAME
+    mtime = snapshot.stat().st_mtime_ns
+
+    assert catalog.load_catalog(cache, "s", "i").equals(first)
+    assert snapshot.stat().st_mtime_ns == mtime
+
+    sources["i"] = INVENTORY.replace(b"2012", b"2013")
+    updated = catalog.load_catalog(cache, "s", "i")
+    assert updated.filter(pl.col("ID") == "US1MAMD0001")["LASTYEAR"][0] == 2013
@@ -0,0 +1,54 @@
+from datetime import date
+
+import polars as pl
+
+from cumulative_snow import climatology
+
+
+def test_monthly_averages_from_the_cube() -> None:
+    daily = pl.DataFrame(
+        {
+            "STATION": ["A", "A", "A", "A", "B"],
+            "DATE": [
+                date(2000, 1, 1),
+                date(2000, 1, 2),
+                date(2001, 1, 1),
+                date(2001, 7, 1),
+                date(2000, 1, 1),
+            ],
+            "SNOW": [1.0, 2.0, 5.0, 0.0, 100.0],
+            "TAVG": [10.0, 20.0, None, 70.0, 0.0],
+        }
+    )
+
+    cube = climatology.monthly_cube(daily)
+    assert cube.columns == [
+        "STATION",
+        "YEAR",
+        "MONTH",
+        "DAYS",
+        "SNOW",
+        "TAVG_MEAN",
+        "TAVG_COUNT",
+    ]
+    assert cube["DAYS"].to_list() == [2, 1, 1, 1]
+
+    averages = climatology.monthly_averages(cube, stations=["A"])
+    assert averages["MONTH"].to_list()[:7] == [
+        "Jul",
+        "Aug",
+        "Sep",
+        "Oct",
+        "Nov",
+        "Dec",
+        "Jan",
+    ]
+    jan = averages.row(6, named=True)
+    # The mean of each year's January total, and 2001 had no temperatures
+    assert jan["SNOW"] == 4.0
+    assert jan["TAVG"] == 15.0
+    assert averages.row(0, named=True)["TAVG"] == 70.0
+    assert averages.row(1, named=True)["SNOW"] is None
+
+    only_2000 = climatology.monthly_averages(cube, start_year=2000, end_year=2000)
+    assert only_2000.row(6, named=True)["SNOW"] == 51.5
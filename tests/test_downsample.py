@@ -0,0 +1,53 @@
+import numpy as np
+import polars as pl
+
+from cumulative_snow import downsample, plot
+
+
+def test_lttb_keeps_end_points_and_peaks() -> None:
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50) * 10
+    y[437] = 100
+
+    picked = downsample.lttb(x, y, 50)
+
+    assert len(picked) == 50
+    assert picked[0] == 0 and picked[-1] == 999
+    assert 437 in picked
+    assert (np.diff(picked) > 0).all()
+
+
+def test_continuous_plot_is_an_order_of_magnitude_smaller(
+    century_of_snow: pl.DataFrame,
+) -> None:
+    data = century_of_snow
+
+    fig = plot.plot_continuous(data)
+
+    points = sum(len(trace.x) for trace in fig.data)
+    assert len(fig.data) == 100
+    assert points * 10 < len(data)
+    season_ends = dict(
+        data.group_by("WINTER_YEAR").agg(pl.col("CUMULATIVE_SNOW").last()).iter_rows()
+    )
+    for trace in fig.data:
+        assert trace.y[-1] == season_ends[int(trace.name)]
+        assert max(trace.y) == trace.y[-1]
+
+
+def test_dropping_flat_runs_draws_the_same_line(century_of_snow: pl.DataFrame) -> None:
+    data = century_of_snow
+    data = data.with_columns(DAY=np.arange(len(data), dtype=float))
+
+    # Wide enough that only the middle of flat runs is dropped
+    out = downsample.downsample_lines(
+        data, "DAY", "CUMULATIVE_SNOW", "WINTER_YEAR", width_px=10**6
+    )
+
+    assert len(out) * 5 < len(data)
+    for year in data.partition_by("WINTER_YEAR"):
+        drawn = out.filter(pl.col("WINTER_YEAR") == year["WINTER_YEAR"][0])
+        np.testing.assert_allclose(
+            np.interp(year["DAY"], drawn["DAY"], drawn["CUMULATIVE_SNOW"]),
+            year["CUMULATIVE_SNOW"],
+        )
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+from conftest import FakeBucket
+
+from cumulative_snow import fetch
+from cumulative_snow.cache import StationCache
+
+
+def _station_files(bucket: FakeBucket) -> dict[str, bytes]:
+    bucket.objects = {
+        f"parquet/by_station/STATION=X/ELEMENT={e}/{i}.parquet": f"{e}{i}".encode()
+        for e in ["SNOW", "SNWD", "TMAX"]
+        for i in range(3)
+    }
+    bucket.objects["parquet/by_station/STATION=Y/ELEMENT=SNOW/0.parquet"] = b"y"
+    return bucket.objects
+
+
+def test_list_objects_follows_pages(fake_bucket: FakeBucket) -> None:
+    objects = _station_files(fake_bucket)
+    listed = list(
+        fetch.list_objects("parquet/by_station/STATION=X", bucket_url=fake_bucket.url)
+    )
+    assert [o.key for o in listed] == sorted(k for k in objects if "STATION=X" in k)
+    assert listed[0].etag == fake_bucket.etag(listed[0].key)
+    assert listed[0].size == len(objects[listed[0].key])
+    # 9 keys at 2 per page
+    assert fake_bucket.requests[""] == 5
+
+
+def test_concurrent_download_reuses_connections(
+    fake_bucket: FakeBucket, tmp_path: Path
+) -> None:
+    objects = _station_files(fake_bucket)
+    client = fetch.HttpClient(backoff_seconds=0.01)
+    cache = StationCache(str(tmp_path), fetch=client.fetch, max_workers=3)
+    urls = {key: f"{fake_bucket.url}/{key}" for key in objects}
+    fake_bucket.failures[next(iter(objects))] = 2
+
+    paths = cache.get_many(urls)
+
+    assert {k: Path(p).read_bytes() for k, p in paths.items()} == objects
+    assert fake_bucket.connections <= 3 + 2
+
+
+def test_gives_up_after_retries(fake_bucket: FakeBucket) -> None:
+    fake_bucket.objects["a"] = b"a"
+    fake_bucket.failures["a"] = 10
+    client = fetch.HttpClient(attempts=3, backoff_seconds=0.01)
+    with pytest.raises(fetch.HttpError):
+        client.fetch(f"{fake_bucket.url}/a", {})
+    assert fake_bucket.requests["a"] == 3
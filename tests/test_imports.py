@@ -0,0 +1,97 @@
+import ast
+import shutil
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).parent / ".."
+
+# Slow to import, especially under pyodide
+HEAVY = ("duckdb", "matplotlib", "pandas", "plotly", "polars", "pyarrow")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of each module a fresh
+    interpreter imports along with module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    "module, allowed",
+    [
+        ("cumulative_snow.main", ()),
+        ("cumulative_snow.args", ()),
+        ("cumulative_snow.profiling", ()),
+        ("cumulative_snow.browser_storage", ()),
+        ("cumulative_snow.batch", ("polars", "pyarrow")),
+        ("cumulative_snow.catalog", ("polars", "pyarrow")),
+        ("cumulative_snow.store", ("duckdb", "polars", "pyarrow")),
+        ("cumulative_snow.synthetic", ("polars", "pyarrow")),
+        # Plotly is given polars frames and NumPy arrays, never pandas
+        ("cumulative_snow.plot", ("plotly", "polars", "pyarrow")),
+        # pandas imports pyarrow
+        ("cumulative_snow.label_lines", ("pandas", "pyarrow")),
+    ],
+)
+def test_heavy_dependencies_load_only_where_used(
+    module: str, allowed: tuple[str, ...]
+) -> None:
+    times = _import_times(module)
+    assert {name.split(".")[0] for name in times} & set(HEAVY) == set(allowed)
+
+
+def _notebook_modules() -> set[str]:
+    """The package's modules importing the notebook's cumulative_snow imports
+    loads in a fresh interpreter"""
+    tree = ast.parse((REPO_ROOT / "marimo_s3_parquet.py").read_text())
+    names = {
+        alias.name
+        for node in ast.walk(tree)
+        if isinstance(node, ast.ImportFrom) and node.module == "cumulative_snow"
+        for alias in node.names
+    }
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys; from cumulative_snow import {', '.join(sorted(names))}; "
+            "print(*(m for m in sys.modules if m.startswith('cumulative_snow.')))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.skipif(shutil.which("uv") is None, reason="Builds the wheel with uv")
+def test_wasm_wheel_has_only_the_modules_the_notebook_imports(tmp_path: Path) -> None:
+    subprocess.run(
+        ["uv", "build", "--wheel", "-o", str(tmp_path), "-q"],
+        cwd=REPO_ROOT,
+        check=True,
+    )
+    [wheel] = tmp_path.glob("*.whl")
+    with zipfile.ZipFile(wheel) as f:
+        shipped = {
+            name.removesuffix(".py").replace("/", ".")
+            for name in f.namelist()
+            if name.startswith("cumulative_snow/") and name.endswith(".py")
+        }
+
+    assert shipped - {"cumulative_snow.__init__"} == _notebook_modules()
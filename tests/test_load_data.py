@@ -0,0 +1,101 @@
+from datetime import date
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+
+from cumulative_snow import load_data
+
+
+def _two_stations() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "STATION": ["B", "A", "A", "A", "B", "A"],
+            "DATE": [
+                date(2010, 7, 1),
+                date(2010, 6, 30),
+                date(2010, 7, 1),
+                date(2011, 1, 15),
+                date(2010, 12, 1),
+                date(2010, 1, 1),
+            ],
+            "SNOW": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        }
+    )
+
+
+def test_winter_columns_per_station() -> None:
+    out = load_data.load_noaa_frame(_two_stations())
+
+    assert out["STATION"].to_list() == ["A", "A", "A", "A", "B", "B"]
+    assert out["WINTER_YEAR"].to_list() == [2009, 2009, 2010, 2010, 2010, 2010]
+    assert out["WINTER_SEASON_START"].to_list() == [
+        date(2009, 6, 30),
+        date(2009, 6, 30),
+        date(2010, 6, 30),
+        date(2010, 6, 30),
+        date(2010, 6, 30),
+        date(2010, 6, 30),
+    ]
+    assert out["CUMULATIVE_SNOW"].to_list() == [6.0, 8.0, 3.0, 7.0, 1.0, 6.0]
+
+
+def test_accepts_pandas_and_arrow() -> None:
+    expected = load_data.load_noaa_frame(_two_stations())
+
+    pandas_in = _two_stations().to_pandas()
+    pandas_in["DATE"] = pd.to_datetime(pandas_in["DATE"])
+    out = load_data.load_noaa_data(pandas_in)
+    assert out["CUMULATIVE_SNOW"].to_list() == expected["CUMULATIVE_SNOW"].to_list()
+    assert load_data.to_pandas(out)["WINTER_YEAR"].cat.ordered
+
+    arrow_in: pa.Table = _two_stations().to_arrow()
+    assert load_data.load_noaa_frame(arrow_in).equals(expected)
+
+
+def test_string_dates_and_lazy() -> None:
+    raw = pl.LazyFrame(
+        {"ID": ["X", "X"], "DATE": ["20200701", "20200702"], "SNOW": [1.5, 2.0]}
+    )
+    out = load_data.add_winter_columns(raw).collect()
+    assert out["DATE"].to_list() == [date(2020, 7, 1), date(2020, 7, 2)]
+    assert out["CUMULATIVE_SNOW"].to_list() == [1.5, 3.5]
+
+
+def test_csv_chunks_carry_cumulative_snow(tmp_path) -> None:
+    csv = tmp_path / "export.csv"
+    lines = ['"STATION","NAME","DATE","SNOW","SNWD"']
+    for station in ["A", "B"]:
+        for day in range(1, 29):
+            snow = "" if day % 5 == 0 else "1.0"
+            lines.append(
+                f'"{station}","{station} NAME","2011-02-{day:02d}","{snow}",""'
+            )
+    csv.write_text("\n".join(lines) + "\n")
+
+    whole = pl.concat(load_data.iter_noaa_csv(str(csv)))
+    chunked = list(load_data.iter_noaa_csv(str(csv), block_size=256))
+    assert len(chunked) > 2
+    assert pl.concat(chunked).equals(whole)
+    assert whole.filter(pl.col("STATION") == "B")["CUMULATIVE_SNOW"].max() == 23.0
+    assert whole["SNWD"].null_count() == 0
+    assert whole["TMAX"].null_count() == len(whole)
+
+    only_b = pl.concat(load_data.iter_noaa_csv(str(csv), station="B", block_size=256))
+    assert only_b.equals(whole.filter(pl.col("STATION") == "B"))
+    assert list(load_data.iter_noaa_csv(str(csv), start_year=2011)) == []
+
+
+def test_day_of_season_is_the_same_every_winter() -> None:
+    days = [
+        date(2010, 7, 1),
+        date(2011, 2, 28),
+        date(2011, 3, 1),
+        date(2011, 6, 30),
+        date(2012, 2, 28),
+        date(2012, 2, 29),
+        date(2012, 3, 1),
+    ]
+    out = load_data.load_noaa_frame(pl.DataFrame({"DATE": days, "SNOW": 0.0}))
+    assert out["DAY_OF_SEASON"].dtype == pl.Int16
+    assert out["DAY_OF_SEASON"].to_list() == [0, 242, 244, 365, 242, 243, 244]
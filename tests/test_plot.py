@@ -0,0 +1,48 @@
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from cumulative_snow import load_data, plot
+
+
+def test_packed_lines_draw_every_winter_in_a_few_traces(
+    century_of_snow: pl.DataFrame,
+) -> None:
+    data = century_of_snow
+    per_winter = plot.plot_continuous(data)
+
+    fig = plot.plot_continuous(data, packed=True)
+
+    assert len(fig.data) == 10
+    assert all(trace.type == "scattergl" for trace in fig.data)
+    drawn = {}
+    for trace in fig.data:
+        # A break between each of the trace's winters
+        breaks = np.isnan(trace.y)
+        assert breaks.sum() == len(np.unique(trace.customdata)) - 1
+        for winter in np.unique(trace.customdata):
+            drawn[str(winter)] = trace.y[(trace.customdata == winter) & ~breaks]
+    assert len(drawn) == 100
+    for trace in per_winter.data:
+        np.testing.assert_array_equal(drawn[trace.name], trace.y)
+
+
+def test_station_without_snow() -> None:
+    dates = pl.date_range(date(2010, 7, 1), date(2011, 6, 30), eager=True)
+    data = load_data.load_noaa_data(
+        pl.DataFrame(
+            {
+                "STATION": "X",
+                "DATE": dates,
+                "SNOW": 0.0,
+                "TAVG": 60.0,
+                "TMAX": 70.0,
+                "TMIN": 50.0,
+            }
+        )
+    )
+
+    figs = plot.build_figures(data, packed=True, bands=True)
+
+    assert set(figs) == set(plot.FIGURES)
@@ -0,0 +1,46 @@
+import io
+import json
+import time
+
+from cumulative_snow import profiling
+
+
+@profiling.timed()
+def _stage() -> None:
+    with profiling.span("inner") as span:
+        span.rows = 3
+
+
+def test_records_nested_spans() -> None:
+    with profiling.profile() as profiler:
+        _stage()
+        try:
+            with profiling.span("failing"):
+                raise ValueError
+        except ValueError:
+            pass
+
+    assert profiling.current() is None
+    records = profiler.records()
+    assert [(r["name"], r["depth"], r["rows"]) for r in records] == [
+        ("_stage", 0, None),
+        ("inner", 1, 3),
+        ("failing", 0, None),
+    ]
+    assert records[2]["error"] == "ValueError"
+    assert records[0]["seconds"] >= records[1]["seconds"]
+    summary = profiler.summary()
+    assert summary.filter(summary["name"] == "inner")["rows"].to_list() == [3]
+
+    out = io.StringIO()
+    profiler.write_json(out)
+    assert len(json.loads(out.getvalue())["spans"]) == 3
+
+
+def test_disabled_spans_are_cheap() -> None:
+    assert profiling.current() is None
+    start = time.perf_counter()
+    for _ in range(10_000):
+        _stage()
+    # A few microseconds a call at most, even on slow CI machines
+    assert time.perf_counter() - start < 0.5
@@ -0,0 +1,102 @@
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from conftest import FakeBucket
+
+from cumulative_snow import fetch, remote_parquet
+
+
+def _parquet(years: range, element: str) -> bytes:
+    dates = [
+        f"{y}{m:02d}{d:02d}" for y in years for m in range(1, 13) for d in range(1, 29)
+    ]
+    table = pa.table(
+        {
+            "ID": ["USW00014739"] * len(dates),
+            "DATE": dates,
+            "DATA_VALUE": list(range(len(dates))),
+            "M_FLAG": ["x" * 200] * len(dates),
+            "Q_FLAG": ["y" * 200] * len(dates),
+        }
+    )
+    buf = io.BytesIO()
+    # One row group per year so years can be skipped
+    pq.write_table(
+        table, buf, row_group_size=12 * 28, compression="none", use_dictionary=False
+    )
+    return buf.getvalue()
+
+
+def test_reads_only_needed_row_groups_and_columns(fake_bucket: FakeBucket) -> None:
+    prefix = "parquet/by_station/STATION=USW00014739"
+    fake_bucket.objects = {
+        f"{prefix}/ELEMENT=SNOW/0.parquet": _parquet(range(1950, 2000), "SNOW"),
+        f"{prefix}/ELEMENT=WT01/0.parquet": _parquet(range(1950, 2000), "WT01"),
+    }
+    urls = [f"{fake_bucket.url}/{key}" for key in fake_bucket.objects]
+    client = fetch.HttpClient()
+
+    table = remote_parquet.read_station_parquet(
+        urls, min_year=1990, range_get=client.range_get
+    )
+
+    assert table.column_names == ["ID", "DATE", "ELEMENT", "DATA_VALUE"]
+    assert table.num_rows == 10 * 12 * 28
+    assert min(table["DATE"].to_pylist()) == "19900101"
+    assert set(table["ELEMENT"].to_pylist()) == {"SNOW"}
+    # The WT01 file is never requested and most of the SNOW file is skipped
+    assert fake_bucket.requests[f"{prefix}/ELEMENT=WT01/0.parquet"] == 0
+    total = len(fake_bucket.objects[f"{prefix}/ELEMENT=SNOW/0.parquet"])
+    assert fake_bucket.bytes_sent < total / 4
+
+
+def test_no_matching_rows_keep_the_column_types(fake_bucket: FakeBucket) -> None:
+    key = "parquet/by_station/STATION=USW00014739/ELEMENT=SNOW/0.parquet"
+    fake_bucket.objects = {key: _parquet(range(1950, 1960), "SNOW")}
+    client = fetch.HttpClient()
+
+    skipped = remote_parquet.read_station_parquet(
+        [f"{fake_bucket.url}/{key}"], min_year=2000, range_get=client.range_get
+    )
+    nothing = remote_parquet.read_station_parquet([], range_get=client.range_get)
+
+    expected = pa.schema(
+        {
+            "ID": pa.string(),
+            "DATE": pa.string(),
+            "ELEMENT": pa.string(),
+            "DATA_VALUE": pa.int64(),
+        }
+    )
+    assert skipped.num_rows == nothing.num_rows == 0
+    assert skipped.schema.equals(expected)
+    assert nothing.schema.equals(expected)
+
+
+def test_range_file_reads_like_a_file() -> None:
+    data = bytes(range(256)) * 100
+
+    def range_get(url: str, start: int, end: int | None) -> tuple[bytes, int]:
+        return (data[start:] if start < 0 else data[start:end]), len(data)
+
+    f = remote_parquet.HttpRangeFile("x", range_get, block_size=1000, footer_bytes=100)
+    assert f.read(5) == data[:5]
+    f.seek(2500)
+    assert f.read(3000) == data[2500:5500]
+    f.seek(-20, io.SEEK_END)
+    assert f.read() == data[-20:]
+    assert f.requests == 3
+
+
+def test_range_file_reads_more_than_its_block_budget_at_once() -> None:
+    data = bytes(range(256)) * 100
+
+    def range_get(url: str, start: int, end: int | None) -> tuple[bytes, int]:
+        return (data[start:] if start < 0 else data[start:end]), len(data)
+
+    f = remote_parquet.HttpRangeFile(
+        "x", range_get, block_size=100, max_blocks=4, footer_bytes=100
+    )
+    assert f.read(2000) == data[:2000]
+    assert len(f._blocks) == 4
@@ -0,0 +1,98 @@
+import numpy as np
+import polars as pl
+
+from cumulative_snow.search import StationSearch, words
+
+CATALOG = pl.DataFrame(
+    {
+        "ID": ["USW00014739", "USC00190120", "USC00198757", "CA006158355"],
+        "NAME": ["BOSTON", "AMHERST", "WORCESTER RGNL AP", "TORONTO CITY"],
+        "STATE": ["MA", "MA", "MA", "ON"],
+        "NUM_YEARS": [80, 120, 50, None],
+    }
+)
+
+
+def _names(search: StationSearch, query: str, **kwargs) -> list[str]:
+    return CATALOG[search.search(query, **kwargs)]["NAME"].to_list()
+
+
+def test_matches_prefixes_of_every_word() -> None:
+    search = StationSearch.from_catalog(CATALOG)
+    assert _names(search, "bos") == ["BOSTON"]
+    assert _names(search, "rgnl") == ["WORCESTER RGNL AP"]
+    assert _names(search, "usw000") == ["BOSTON"]
+    assert _names(search, "ma wor") == ["WORCESTER RGNL AP"]
+    assert _names(search, "ma nowhere") == []
+    assert _names(search, "x" * 40) == []
+
+
+def test_ranks_whole_words_then_leading_then_record_length() -> None:
+    search = StationSearch.from_catalog(CATALOG)
+    # All in MA, longest records first
+    assert _names(search, "ma") == ["AMHERST", "BOSTON", "WORCESTER RGNL AP"]
+    assert _names(search, "a") == ["AMHERST", "WORCESTER RGNL AP"]
+    # The exact ID beats stations that only share its prefix
+    assert _names(search, "USC00198757")[0] == "WORCESTER RGNL AP"
+
+
+def test_state_is_not_leading_without_a_name() -> None:
+    search = StationSearch(
+        ["A1", "B2"], ["", "BOSTON"], ["MA", "MA"], np.array([1, 100])
+    )
+    assert search.search("ma").tolist() == [1, 0]
+
+
+def test_empty_query_limit_and_mask() -> None:
+    search = StationSearch.from_catalog(CATALOG)
+    assert _names(search, "") == [
+        "AMHERST",
+        "BOSTON",
+        "WORCESTER RGNL AP",
+        "TORONTO CITY",
+    ]
+    assert _names(search, "", limit=2) == ["AMHERST", "BOSTON"]
+    mask = np.array([True, False, True, True])
+    assert _names(search, "ma", mask=mask) == ["BOSTON", "WORCESTER RGNL AP"]
+    assert _names(search, " ", mask=mask, limit=1) == ["BOSTON"]
+
+
+def _reference(ids, names, states, num_years, query: str) -> list[int]:
+    """Ranks every station one token at a time, as the module docstring says"""
+    ranked = []
+    for row, (id, name, state) in enumerate(zip(ids, names, states)):
+        name_words = words(name)
+        tokens = [id, *name_words, state]
+        score = 0
+        for i, word in enumerate(words(query)):
+            points = [
+                2 * (token == word) + (i == 0 and j == 1 and bool(name_words))
+                for j, token in enumerate(tokens)
+                if token.startswith(word)
+            ]
+            if not points:
+                break
+            score += max(points)
+        else:
+            ranked.append((-score, -num_years[row], row))
+    return [row for *_, row in sorted(ranked)]
+
+
+def test_matches_ranking_every_station() -> None:
+    # Common and rare words, so both large and small slices are searched
+    n = 5000
+    rng = np.random.default_rng(0)
+    ids = [f"US{i:05d}" for i in range(n)]
+    names = [
+        " ".join(rng.choice(["TOW", "TOWN", "TOWER", "LAKE", "NORTH", f"N{i}"], 2))
+        if i % 50
+        else ""
+        for i in range(n)
+    ]
+    states = rng.choice(["MA", "NH", "TX"], n).tolist()
+    num_years = rng.integers(1, 150, n)
+    search = StationSearch(ids, names, states, num_years)
+
+    for query in ["t", "tow", "town n", "n", "n12", "ma la", "US0001", "x"]:
+        expected = _reference(ids, names, states, num_years, query)
+        assert search.search(query, limit=n).tolist() == expected, query
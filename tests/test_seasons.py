@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+import polars as pl
+import pytest
+
+from cumulative_snow import load_data, seasons
+from cumulative_snow.seasons import SeasonMatrix
+
+
+def _winters(first: int, count: int, seed: int = 0) -> pl.DataFrame:
+    dates = pl.date_range(date(first, 7, 1), date(first + count, 6, 30), eager=True)
+    rng = np.random.default_rng(seed)
+    snow = np.where(rng.random(len(dates)) < 0.1, rng.gamma(2.0, 2.0, len(dates)), 0)
+    return load_data.load_noaa_data(
+        pl.DataFrame({"STATION": "X", "DATE": dates, "SNOW": snow.round(1)})
+    )
+
+
+def test_matches_the_daily_rows() -> None:
+    data = _winters(2010, 4)
+
+    matrix = SeasonMatrix.from_frame(data)
+
+    assert matrix.winters.tolist() == [2010, 2011, 2012, 2013]
+    for row in data.sample(50, seed=0).iter_rows(named=True):
+        assert matrix.row(row["WINTER_YEAR"])[row["DAY_OF_SEASON"]] == pytest.approx(
+            row["CUMULATIVE_SNOW"]
+        )
+    # Only winter 2011 ends in a leap year, the others repeat Feb 28th
+    for winter in (2010, 2012, 2013):
+        values = matrix.row(winter)
+        assert values[seasons.LEAP_DAY] == values[seasons.LEAP_DAY - 1]
+    assert not np.isnan(matrix.values).any()
+
+
+def test_missing_days_are_ignored() -> None:
+    data = _winters(2000, 3).filter(
+        ~((pl.col("WINTER_YEAR") == 2001) & (pl.col("DAY_OF_SEASON") >= 100))
+    )
+
+    matrix = SeasonMatrix.from_frame(data)
+
+    assert np.isnan(matrix.row(2001)[100:]).all()
+    expected = np.percentile(matrix.values[[0, 2], 200], [10, 50, 90])
+    np.testing.assert_allclose(matrix.percentiles()[:, 200], expected)
+    assert np.isnan(matrix.rank(2001)[200])
+
+
+def test_percentiles_anomalies_and_ranks() -> None:
+    matrix = SeasonMatrix.from_frame(_winters(1900, 120))
+
+    np.testing.assert_allclose(
+        matrix.percentiles(), np.percentile(matrix.values, [10, 50, 90], axis=0)
+    )
+    normals = matrix.values[(matrix.winters >= 1991) & (matrix.winters <= 2020)]
+    np.testing.assert_allclose(
+        matrix.anomaly(2000, normals=(1991, 2020)),
+        matrix.row(2000) - np.median(normals, axis=0),
+    )
+    # Ranks are by season day, 1 for the snowiest winter so far that season
+    day = 300
+    order = np.argsort(-matrix.values[:, day], kind="stable")
+    assert matrix.rank(matrix.winters[order[0]])[day] == 1
+    assert matrix.rank(matrix.winters[order[-1]])[day] <= 120
+    with pytest.raises(KeyError):
+        matrix.row(1800)
+
+
+def test_one_station_only() -> None:
+    data = pl.concat(
+        [_winters(2000, 1), _winters(2000, 1).with_columns(STATION=pl.lit("Y"))]
+    )
+    with pytest.raises(ValueError):
+        SeasonMatrix.from_frame(data)
@@ -0,0 +1,164 @@
+import asyncio
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pytest
+
+from cumulative_snow import plot, synthetic
+from cumulative_snow.serve import MemoryLRU, ReportServer
+from cumulative_snow.store import DailyStore
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self) -> None:
+        super().__init__(2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def stations() -> dict[str, tuple[pa.Table, pa.Table]]:
+    store = DailyStore(":memory:")
+    tables = {}
+    for i in range(2):
+        station = synthetic.station_id(i)
+        daily = store.put(station, "source", synthetic.raw_daily(i, 10), min_year=2010)
+        tables[station] = (daily, store.monthly(station))
+    store.close()
+    return tables
+
+
+async def _get(port: int, path: str, method: str = "GET") -> tuple[int, bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+def _run(server: ReportServer, requests) -> list:
+    async def run() -> list:
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            return [
+                await asyncio.gather(*(_get(port, *r) for r in batch))
+                for batch in requests
+            ]
+
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_build(stations) -> None:
+    loads: Counter[str] = Counter()
+
+    def load(station: str) -> tuple[pa.Table, pa.Table]:
+        loads[station] += 1
+        return stations[station]
+
+    executor = CountingExecutor()
+    server = ReportServer(load, executor=executor)
+    station = synthetic.station_id(0)
+    figure_paths = [(f"/station/{station}/{name}.json",) for name in plot.FIGURES]
+
+    first, second = _run(server, [[(f"/station/{station}",), *figure_paths]] * 2)
+    server.close()
+
+    assert loads == {station: 1}
+    assert executor.submitted == 1
+    assert first == second
+    status, page = first[0]
+    assert status == 200 and b"Plotly.newPlot" in page
+    for status, body in first[1:]:
+        assert status == 200
+        assert json.loads(body)["data"]
+
+
+def test_errors() -> None:
+    def load(station: str) -> tuple[pa.Table, pa.Table]:
+        raise KeyError(station)
+
+    server = ReportServer(load, executor=CountingExecutor())
+    [responses] = _run(
+        server,
+        [
+            [
+                ("/station/NOWHERE",),
+                ("/station/NOWHERE/continuous.json",),
+                ("/elsewhere",),
+                ("/station/NOWHERE", "POST"),
+            ]
+        ],
+    )
+    server.close()
+    assert [status for status, _ in responses] == [404, 404, 404, 405]
+
+
+def test_cached_figures_are_served_without_rebuilding(stations) -> None:
+    executor = CountingExecutor()
+    server = ReportServer(stations.__getitem__, executor=executor)
+    path = f"/station/{synthetic.station_id(1)}/overlapping.json"
+
+    [[first], cached] = _run(server, [[(path,)], [(path,)] * 20])
+    server.close()
+
+    assert first[0] == 200
+    assert cached == [first] * 20
+    assert executor.submitted == 1
+
+
+def test_updated_stations_are_reloaded_once_entries_expire(stations) -> None:
+    station, other = (synthetic.station_id(i) for i in range(2))
+    # The store's data for station changes to other's after the first load
+    versions = [stations[station], stations[other]]
+    now = [0.0]
+    server = ReportServer(
+        lambda _: versions.pop(0), executor=CountingExecutor(), max_age_seconds=60
+    )
+    server.cache.clock = lambda: now[0]
+    path = f"/station/{station}/continuous.json"
+
+    [[first]] = _run(server, [[(path,)]])
+    now[0] = 30
+    [[cached]] = _run(server, [[(path,)]])
+    now[0] = 61
+    [[updated]] = _run(server, [[(path,)]])
+    server.close()
+
+    assert first == cached
+    assert updated[0] == 200 and updated != first
+    assert versions == []
+
+
+def test_lru_evicts_past_the_byte_budget() -> None:
+    cache = MemoryLRU(max_bytes=100)
+    cache.put("a", 1, 40)
+    cache.put("b", 2, 40)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 40)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.nbytes == 80
+    # Larger than the whole budget, so not kept at all
+    cache.put("d", 4, 101)
+    assert "d" not in cache and len(cache) == 2
+
+
+def test_lru_expires_old_entries() -> None:
+    now = [0.0]
+    cache = MemoryLRU(max_bytes=100, max_age_seconds=10, clock=lambda: now[0])
+    cache.put("a", 1, 40)
+    now[0] = 5
+    cache.put("b", 2, 40)
+    now[0] = 11
+
+    assert cache.get("a") is None and "a" not in cache
+    assert cache.get("b") == 2
+    assert cache.nbytes == 40
@@ -0,0 +1,56 @@
+import numpy as np
+import polars as pl
+
+from cumulative_snow.spatial import BBox, StationIndex, haversine_km
+
+
+def _catalog(n: int = 5000) -> pl.DataFrame:
+    rng = np.random.default_rng(0)
+    return pl.DataFrame(
+        {
+            "ID": [f"S{i:05d}" for i in range(n)],
+            "NAME": [f"NAME {i}" for i in range(n)],
+            "STATE": ["MA"] * n,
+            "NUM_YEARS": rng.integers(1, 100, n),
+            "LATITUDE": rng.uniform(-90, 90, n),
+            "LONGITUDE": rng.uniform(-180, 180, n),
+        }
+    )
+
+
+def test_within_matches_brute_force() -> None:
+    catalog = _catalog()
+    index = StationIndex.from_catalog(catalog, cell_degrees=2.5)
+    lat, lon = catalog["LATITUDE"].to_numpy(), catalog["LONGITUDE"].to_numpy()
+
+    for bbox in [BBox(10, -80, 50, -60), BBox(-20, 170, 20, -170), BBox(0, 0, 0, 0)]:
+        if bbox.west > bbox.east:
+            in_lon = (lon >= bbox.west) | (lon <= bbox.east)
+        else:
+            in_lon = (lon >= bbox.west) & (lon <= bbox.east)
+        expected = np.flatnonzero((lat >= bbox.south) & (lat <= bbox.north) & in_lon)
+        assert sorted(index.within(bbox)) == sorted(expected)
+
+
+def test_nearest_matches_brute_force() -> None:
+    catalog = _catalog()
+    index = StationIndex.from_catalog(catalog)
+    lat, lon = catalog["LATITUDE"].to_numpy(), catalog["LONGITUDE"].to_numpy()
+
+    for point in [(42.36, -71.01), (89.9, 10.0), (0.0, 179.9)]:
+        expected = np.argsort(haversine_km(*point, lat, lon), kind="stable")[:7]
+        assert list(index.nearest(*point, n=7)) == list(expected)
+
+
+def test_clusters_cover_viewport() -> None:
+    catalog = _catalog()
+    index = StationIndex.from_catalog(catalog)
+    bbox = BBox(0, 0, 45, 90)
+
+    clusters = index.clusters(catalog, bbox, zoom=3)
+    assert clusters["COUNT"].sum() == len(index.within(bbox))
+    assert len(clusters) < clusters["COUNT"].sum()
+
+    singles = clusters.filter(pl.col("COUNT") == 1)
+    assert singles["ID"].null_count() == 0
+    assert clusters.filter(pl.col("COUNT") > 1)["ID"].null_count() > 0
@@ -0,0 +1,155 @@
+from datetime import date
+
+import polars as pl
+import pyarrow as pa
+
+from cumulative_snow import climatology, units
+from cumulative_snow.fetch import ObjectInfo
+from cumulative_snow.store import DailyStore, source_hash
+
+
+def _raw(years: range, since: date = date.min) -> pa.Table:
+    rows = [
+        (f"{y}0115", element, value)
+        for y in years
+        for element, value in [("SNOW", 254), ("TMAX", 100), ("WT01", 1)]
+        if date(y, 1, 15) >= since
+    ]
+    return pa.table(
+        {
+            "ID": ["X"] * len(rows),
+            "DATE": [r[0] for r in rows],
+            "ELEMENT": [r[1] for r in rows],
+            "DATA_VALUE": [r[2] for r in rows],
+        }
+    )
+
+
+def test_materializes_once_per_source() -> None:
+    store = DailyStore(":memory:")
+    source = source_hash([ObjectInfo("a", '"1"', 10)])
+    reads: list[int] = []
+
+    def read_raw(since: date) -> pa.Table:
+        reads.append(since.year)
+        return _raw(range(1960, 1990))
+
+    table = store.load("X", source, read_raw, min_year=1980)
+    assert table.num_rows == 10
+    # Kept in GHCNd units
+    assert table["DATE"].type == pa.date32()
+    assert table["DATE"][0].as_py() == date(1980, 1, 15)
+    assert table["SNOW"].type == pa.int16()
+    assert table["SNOW"][0].as_py() == 254
+    assert table["TMAX"][0].as_py() == 100
+    assert table["TMIN"][0].as_py() is None
+    assert table["PRCP"][0].as_py() is None
+    assert table["CUMULATIVE_SNOW"][0].as_py() == 254
+
+    # and converted when plotted
+    display = units.to_display_units(table).collect()
+    assert display.row(0, named=True) == {
+        "ID": "X",
+        "DATE": date(1980, 1, 15),
+        "TMAX": 50.0,
+        "TAVG": None,
+        "TMIN": None,
+        "PRCP": 0.0,
+        "SNOW": 10.0,
+        "SNWD": 0.0,
+        "CUMULATIVE_SNOW": 10.0,
+    }
+
+    # Narrower ranges are served from the stored table
+    assert store.load("X", source, read_raw, min_year=1985).num_rows == 5
+    assert reads == [1980]
+
+    # Widening the range rebuilds it
+    assert store.load("X", source, read_raw, min_year=1970).num_rows == 20
+    assert reads == [1980, 1970]
+
+
+def test_updates_only_the_open_winter() -> None:
+    store = DailyStore(":memory:")
+    reads: list[date] = []
+
+    def read_raw(days: list[str], value: int):
+        def read(since: date) -> pa.Table:
+            reads.append(since)
+            return pa.table(
+                {
+                    "ID": ["X"] * len(days),
+                    "DATE": days,
+                    "ELEMENT": ["SNOW"] * len(days),
+                    "DATA_VALUE": [value] * len(days),
+                }
+            )
+
+        return read
+
+    days = ["19990115", "19991201", "20000115"]
+    first = store.load("X", "a", read_raw(days, 254), min_year=1990)
+    assert first["CUMULATIVE_SNOW"].to_pylist() == [254, 254, 508]
+    assert store.high_water("X") == date(2000, 1, 15)
+
+    # Rows before the open winter are ignored even if the reader returns them
+    days.append("20000116")
+    updated = store.load("X", "b", read_raw(days, 508), min_year=1990)
+    assert reads == [date(1990, 1, 1), date(1999, 7, 1)]
+    assert updated["SNOW"].to_pylist() == [254, 508, 508, 508]
+    assert updated["CUMULATIVE_SNOW"].to_pylist() == [254, 508, 1016, 1524]
+    assert store.high_water("X") == date(2000, 1, 16)
+
+
+def test_updates_return_only_the_requested_years() -> None:
+    store = DailyStore(":memory:")
+    store.load("X", "a", lambda since: _raw(range(1960, 1990), since), min_year=1970)
+
+    updated = store.load(
+        "X", "b", lambda since: _raw(range(1960, 1991), since), min_year=1985
+    )
+    direct = store.update("X", "c", _raw(range(1990, 1991)), date(1989, 7, 1), 1988)
+
+    assert updated["DATE"][0].as_py() == date(1985, 1, 15)
+    assert updated.num_rows == 6
+    assert direct["DATE"][0].as_py() == date(1988, 1, 15)
+    # Everything from the year it was stored from is still there
+    assert store.load("X", "c", _raw, min_year=1970).num_rows == 21
+
+
+def test_monthly_cube_follows_updates() -> None:
+    store = DailyStore(":memory:")
+
+    def read_raw(since: date) -> pa.Table:
+        return _raw(range(1990, 2000), since)
+
+    daily = store.load("X", "a", read_raw, min_year=1990)
+    cube = store.monthly("X", start_year=1995)
+    assert cube.num_rows == 5
+    assert cube["MONTH"].to_pylist() == [1] * 5
+    assert cube["SNOW"].to_pylist() == [10.0] * 5
+    assert cube["TMAX_MEAN"].to_pylist() == [50.0] * 5
+    assert cube["TAVG_COUNT"].to_pylist() == [0] * 5
+    assert (
+        climatology.monthly_cube(units.to_display_units(daily))
+        .filter(pl.col("YEAR") >= 1995)
+        .to_arrow()
+        .select(["SNOW", "TMAX_MEAN"])
+        .equals(cube.select(["SNOW", "TMAX_MEAN"]))
+    )
+
+
+def test_recently_checked_stations_skip_listing(tmp_path) -> None:
+    path = str(tmp_path / "daily.db")
+    store = DailyStore(path)
+    assert store.get_recent("X", max_age_seconds=60) is None
+    store.load("X", "a", lambda since: _raw(range(1990, 2000), since), 1990)
+    store.checkpoint()
+    store.close()
+
+    # Survives reopening, as when the browser restores the file
+    store = DailyStore(path)
+    recent = store.get_recent("X", max_age_seconds=60, min_year=1990)
+    assert recent is not None and recent.num_rows == 10
+    assert store.get_recent("X", max_age_seconds=60, min_year=1980) is None
+    assert store.get_recent("X", max_age_seconds=0) is None
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cumulative_snow import load_data, synthetic
+from cumulative_snow.args import Args
+from cumulative_snow.store import DailyStore
+
+
+def test_deterministic_and_readable(tmp_path: Path) -> None:
+    assert synthetic.raw_daily(3, 2).equals(synthetic.raw_daily(3, 2))
+    assert not synthetic.raw_daily(3, 2).equals(synthetic.raw_daily(4, 2))
+
+    csv = tmp_path / "export.csv"
+    synthetic.write_csv(str(csv), n_stations=3, years=2)
+    data = load_data.load_noaa_csv(Args(str(csv), station=synthetic.station_id(1)))
+    assert len(data) == 2 * 365 + 1
+    assert data["WINTER_YEAR"].unique().to_list() == [2018, 2019]
+    assert data["CUMULATIVE_SNOW"].max() > 0
+
+    paths = synthetic.write_parquet(str(tmp_path), n_stations=1, years=2)
+    assert len(paths) == 6
+    raw = synthetic.raw_daily(0, 2)
+    assert sum(pq.read_metadata(p).num_rows for p in paths) == raw.num_rows
+
+    daily = DailyStore(":memory:").put(synthetic.station_id(0), "", raw, 2018)
+    assert daily.num_rows == 2 * 365 + 1
+    assert pc.min(daily["SNWD"]).as_py() == 0
+    assert pc.max(daily["SNWD"]).as_py() > 0
@@ -1,15 +1,38 @@
 import re
+from pathlib import Path
+from urllib.parse import urlsplit
 
-from playwright.sync_api import Page, expect
+import pytest
+from conftest import FakeBucket
+from playwright.sync_api import Page, Route, expect
 
+from cumulative_snow import catalog, fetch, synthetic
 
-def test_load_plots(page: Page, port: int) -> None:
-    page.goto(f"http://127.0.0.1:{port}")
-    expect.set_options(timeout=60_000)
+# Only the browser tests need the WASM build and a server to host it
+pytestmark = pytest.mark.usefixtures("local_server")
+
+BOSTON = "USW00014739"
+STATIONS = b"""\
+USW00014739  42.3606  -71.0097    3.7 MA BOSTON                         GSN     72509
+"""
+INVENTORY = b"""\
+USW00014739  42.3606  -71.0097 SNOW 2010 2020
+"""
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Expose-Headers": "ETag, Last-Modified, Content-Range",
+}
+
+
+def _choose_station(page: Page, name: str) -> None:
     expect(page.get_by_role("strong")).to_contain_text(
         "Select a station from the map or dropdown below"
     )
     expect(page.get_by_role("region", name="Map")).to_be_visible()
+    # The dropdown only has the stations best matching the search
+    page.get_by_placeholder("Name, state or ID").fill(name.split(" - ")[1])
+    page.get_by_placeholder("Name, state or ID").press("Enter")
     page.get_by_test_id("marimo-plugin-searchable-dropdown").locator("div").filter(
         has_text=re.compile(r"^--$")
     ).click()
@@ -17,10 +40,16 @@ def test_load_plots(page: Page, port: int) -> None:
         has_text=re.compile(r"^--$")
     ).click()
     page.get_by_placeholder("Search...").click()
-    page.get_by_placeholder("Search...").fill("Boston")
-    page.get_by_role("option", name="MA - BOSTON", exact=True).click()
+    page.get_by_placeholder("Search...").fill(name.split(" - ")[1])
+    page.get_by_role("option", name=name, exact=True).click()
     expect(page.get_by_text("WINTER_YEAR").first).to_be_visible()
 
+
+def test_load_plots(page: Page, port: int) -> None:
+    page.goto(f"http://127.0.0.1:{port}")
+    expect.set_options(timeout=60_000)
+    _choose_station(page, "MA - BOSTON")
+
     # Expect each of the plots to be visible
     for child_idx in range(2, 7):
         expect(
@@ -28,3 +57,44 @@ def test_load_plots(page: Page, port: int) -> None:
                 f"marimo-ui-element:nth-child({child_idx}) > marimo-plotly > .marimo > .contents > .w-full > .plot-container"
             )
         ).to_be_visible()
+
+
+def test_reload_is_served_from_indexeddb(
+    page: Page, port: int, fake_bucket: FakeBucket, tmp_path: Path
+) -> None:
+    # NOAA and S3 are replaced by the fake bucket with a synthetic Boston
+    fake_bucket.page_size = 100
+    for path in synthetic.write_parquet(str(tmp_path), 1, years=10, ids=[BOSTON]):
+        key = Path(path).relative_to(tmp_path).as_posix()
+        fake_bucket.objects[key] = Path(path).read_bytes()
+    ncei = {
+        urlsplit(catalog.STATIONS_URL).path: STATIONS,
+        urlsplit(catalog.INVENTORY_URL).path: INVENTORY,
+    }
+    for path, body in ncei.items():
+        fake_bucket.objects[path.lstrip("/")] = body
+
+    def forward(route: Route) -> None:
+        if route.request.method == "OPTIONS":
+            return route.fulfill(status=204, headers=CORS_HEADERS)
+        parts = urlsplit(route.request.url)
+        query = f"?{parts.query}" if parts.query else ""
+        response = route.fetch(url=f"{fake_bucket.url}{parts.path}{query}")
+        route.fulfill(response=response, headers={**response.headers, **CORS_HEADERS})
+
+    # The notebook runs in a web worker, whose requests only the context sees
+    page.context.route(re.compile(r"https://www\.ncei\.noaa\.gov/.*"), forward)
+    page.context.route(re.compile(re.escape(fetch.NOAA_BUCKET_URL) + "/.*"), forward)
+
+    expect.set_options(timeout=60_000)
+    page.goto(f"http://127.0.0.1:{port}")
+    _choose_station(page, "MA - BOSTON")
+    saved = page.get_by_text("Station data saved in this browser for your next visit")
+    expect(saved).to_be_visible()
+    assert sum(fake_bucket.requests.values()) > 0
+
+    fake_bucket.requests.clear()
+    page.reload()
+    _choose_station(page, "MA - BOSTON")
+    expect(saved).to_be_visible()
+    assert sum(fake_bucket.requests.values()) == 0